@@ -2,7 +2,6 @@ import streamlit as st
 import pandas as pd
 import json
 import asyncio
-import concurrent.futures
 from datetime import datetime, date
 import tempfile
 import io
@@ -10,6 +9,7 @@ import base64
 from pathlib import Path
 import time
 import os
+import uuid
 from dotenv import load_dotenv
 
 from core.invoice_checker import InvoiceChecker
@@ -22,6 +22,14 @@ from core.excel_manager import ExcelManager
 from core.llm_client import LLMClient
 from core.task_engine import TaskEngine
 from core.ui_components import CommonUIComponents, ProgressManager
+from core.concurrency_controller import get_concurrency_controller
+from core.singleflight import get_singleflight
+from core.usage_stats import get_usage_stats
+from core.metrics import get_metrics, metrics_tags
+from core.text_cache import get_text_cache
+from core.extractors import get_extractor_registry
+from core.local_rules import LOCAL_CHECK_TYPES, LocalRuleEngine
+from config import get_config
 
 # セッション状態の初期化
 def initialize_session_state():
@@ -155,28 +163,62 @@ def main():
         st.markdown("### 処理設定")
         st.markdown("---")
         
-        max_workers = st.slider(
-            "並列処理数", 
-            min_value=1, 
-            max_value=12, 
-            value=3,
-            help="同時に処理するファイル数を設定します"
-        )
+        # 並列数の自動調整はプロセス全体（全セッション）で共有するため設定ファイル（CONCURRENCY_CONFIGのadaptive）でのみ切り替える
+        concurrency_config = get_config("CONCURRENCY_CONFIG")
+        adaptive_concurrency = get_concurrency_controller().enabled
+        
+        if adaptive_concurrency:
+            max_workers = st.slider(
+                "並列処理数の上限",
+                min_value=1,
+                max_value=concurrency_config.get("max_limit", 64),
+                value=min(32, concurrency_config.get("max_limit", 64)),
+                help="経理業務処理で同時に処理するデータ数の上限を設定します（実際の並列数は自動調整されます）"
+            )
+        else:
+            max_workers = st.slider(
+                "並列処理数", 
+                min_value=1, 
+                max_value=12, 
+                value=3,
+                help="同時に処理するファイル数を設定します"
+            )
         st.session_state.max_workers = max_workers
         
+        max_concurrent_requests = st.number_input(
+            "請求書チェックの同時リクエスト数",
+            min_value=1,
+            max_value=1000,
+            value=get_config("PROCESSING_CONFIG").get("max_concurrent_requests", 64),
+            help="請求書チェックは非同期で実行され、ルール×ファイルのリクエストをこの数まで同時に送信します"
+        )
+        st.session_state.max_concurrent_requests = int(max_concurrent_requests)
+        
+        cascade_config = get_config("MODEL_CASCADE_CONFIG")
+        use_cascade = st.checkbox(
+            "モデルカスケード",
+            value=cascade_config.get("enabled", False),
+            help=f"小さいモデル（{cascade_config.get('first_pass_model', 'gpt-4.1-mini')}）で先に評価し、不合格・要確認・確信度が低い・検証エラーの結果のみGPT-4.1で再評価します"
+        )
+        st.session_state.checker.cascade.enabled = use_cascade
+        st.session_state.task_engine.llm_client.cascade.enabled = use_cascade
+        
         # システム情報
         st.markdown("### 情報")
         st.markdown("---")
         
         system_config = {
             "モード": app_mode,
-            "モデル": "GPT-4.1",
-            "並列処理": f"{max_workers} ファイル",
+            "モデル": f"{cascade_config.get('first_pass_model', 'gpt-4.1-mini')} → GPT-4.1" if use_cascade else "GPT-4.1",
+            "並列処理": f"最大{max_workers} ファイル（自動調整）" if adaptive_concurrency else f"{max_workers} ファイル",
+            "同時リクエスト数": f"{int(max_concurrent_requests)} 件",
             "APIキー": "設定済み" if provider_info["configured"] else "未設定",
             "プロバイダー": provider_info["provider"].upper()
         }
         
         CommonUIComponents.show_configuration_summary(system_config, "システム設定")
+        
+        show_text_cache_stats()
     
     # モードに応じたUIを表示
     if app_mode == "請求書チェック":
@@ -459,6 +501,16 @@ def show_evidence_upload():
                         with col3:
                             st.metric("ドキュメント種類", len(summary.get("document_types", {})))
                         
+                        extraction_stats = processed_evidence.get("metadata", {}).get("extraction_stats")
+                        if extraction_stats:
+                            mode_label = "プロセスプール" if extraction_stats["mode"] == "process_pool" else "単一プロセス"
+                            st.caption(f"テキスト抽出: {extraction_stats['documents']}件"
+                                       f"（キャッシュから再利用 {extraction_stats.get('cached_documents', 0)}件、"
+                                       f"ページ分割 {extraction_stats.get('split_documents', 0)}件）/ "
+                                       f"{extraction_stats['wall_seconds']:.1f}秒"
+                                       f"（{mode_label}・{extraction_stats['workers']}並列、"
+                                       f"抽出時間の合計 {extraction_stats['extraction_seconds']:.1f}秒）")
+                        
                         # ドキュメント種類別統計
                         if "document_types" in summary:
                             st.markdown("**ドキュメント種類別統計**")
@@ -632,6 +684,42 @@ def show_processing_execution():
     with st.container(border=True):
         st.markdown("### 実行")
         
+        # タスク定義の説明を使用し、補足事項があれば追加
+        task_description = task_config.get('description', '')
+        if additional_info:
+            combined_instruction = f"{task_description}\n\n補足事項: {additional_info}"
+        else:
+            combined_instruction = task_description
+        
+        if st.button("事前見積もり", help="LLMを呼び出さずに、トークン数・所要時間・コストとコンテキスト長超過データを算出します"):
+            preflight = st.session_state.task_engine.preflight_accounting_task(
+                st.session_state.selected_task_id,
+                st.session_state.processed_evidence,
+                combined_instruction,
+                max_workers=st.session_state.get("max_workers", 3)
+            )
+            if preflight["success"]:
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("リクエスト数", f"{preflight['request_count']:,}")
+                with col2:
+                    st.metric("入力 / 出力トークン", f"{preflight['input_tokens']:,} / {preflight['output_tokens']:,}")
+                with col3:
+                    st.metric("所要時間（目安）", f"約{preflight['estimated_seconds']:,}秒",
+                              help=f"律速要因: {preflight['bottleneck']}")
+                with col4:
+                    st.metric("コスト（目安）", f"{preflight['estimated_cost']:,.4f} {preflight['currency']}")
+                
+                if preflight["oversize_items"]:
+                    st.error(f"コンテキスト長（{preflight['context_window_tokens']:,}トークン）を超えるデータが"
+                             f"{len(preflight['oversize_items'])}件あります。該当データの証跡を見直してください。")
+                    st.dataframe(pd.DataFrame(preflight["oversize_items"]), hide_index=True, use_container_width=True)
+                
+                with st.expander("入力トークンの多いデータ", expanded=False):
+                    st.dataframe(pd.DataFrame(preflight["largest_items"]), hide_index=True, use_container_width=True)
+            else:
+                st.error(f"事前見積もりエラー: {preflight['error']}")
+        
         if st.button("処理実行", type="primary"):
                 # workbookが利用可能かチェック
                 if not hasattr(st.session_state.excel_manager, 'workbook') or not st.session_state.excel_manager.workbook:
@@ -650,27 +738,29 @@ def show_processing_execution():
                     data_count = len(st.session_state.processed_evidence.get("data", {}))
                     status_text.text(f"処理開始: {data_count}件のデータを{max_workers}並列で処理します")
                     
+                    # 今回の実行分の並列数・スループット統計を集計するためリセット
+                    controller = get_concurrency_controller()
+                    concurrency_since = controller.get_stats()
+                    # メトリクスは全セッションで共有するため、今回の実行の呼び出しをrunタグで識別する
+                    metrics_run = uuid.uuid4().hex
+                    st.session_state.accounting_metrics_run = metrics_run
+                    
                     # 進捗更新用のコールバック関数
                     def update_progress(completed, total, data_id):
                         progress = completed / total
                         progress_bar.progress(progress)
-                        status_text.text(f"処理中... {completed}/{total} 完了 (最新: {data_id})")
+                        status_text.text(f"処理中... {completed}/{total} 完了 (最新: {data_id}) | "
+                                         f"{format_concurrency_stats(controller.get_stats(since=concurrency_since))}")
                     
-                    # タスク定義の説明を使用し、補足事項があれば追加
-                    task_description = task_config.get('description', '')
-                    if additional_info:
-                        combined_instruction = f"{task_description}\n\n補足事項: {additional_info}"
-                    else:
-                        combined_instruction = task_description
-                    
-                    execution_result = st.session_state.task_engine.execute_accounting_task(
-                        st.session_state.selected_task_id,
-                        st.session_state.processed_evidence,
-                        st.session_state.excel_manager,
-                        combined_instruction,
-                        max_workers=max_workers,
-                        progress_callback=update_progress
-                    )
+                    with metrics_tags(run=metrics_run):
+                        execution_result = st.session_state.task_engine.execute_accounting_task(
+                            st.session_state.selected_task_id,
+                            st.session_state.processed_evidence,
+                            st.session_state.excel_manager,
+                            combined_instruction,
+                            max_workers=max_workers,
+                            progress_callback=update_progress
+                        )
                     
                     # 処理完了後の表示更新
                     progress_bar.progress(1.0)
@@ -703,6 +793,18 @@ def show_processing_execution():
                                     st.error(error)
                         
                         st.info(f"**結果書き込み先**: {summary['target_sheet']}シート {summary['excel_range']}")
+                        
+                        concurrency_stats = summary.get("concurrency_stats")
+                        if concurrency_stats:
+                            st.caption(f"最大並列数: {concurrency_stats['peak_limit']} | "
+                                       f"レート制限(429): {concurrency_stats['throttled']}回 | "
+                                       f"一時的なエラー: {concurrency_stats['errors']}回 | "
+                                       f"同一リクエストの集約で削減した呼び出し: "
+                                       f"{summary.get('coalesce_stats', {}).get('coalesced', 0)}回")
+                        
+                        cascade_stats = summary.get("cascade_stats")
+                        if cascade_stats and cascade_stats.get("enabled"):
+                            st.caption(f"モデルカスケード: {format_cascade_stats(cascade_stats)}")
                     else:
                         st.error(f"処理エラー: {execution_result.get('error', '不明なエラー')}")
 
@@ -762,6 +864,9 @@ def show_processing_results():
                 st.error(f"ダウンロード準備エラー: {str(e)}")
         else:
             st.warning("調書が読み込まれていないため、ダウンロードできません。")
+        
+        # LLM呼び出しのメトリクス
+        show_metrics_export("accounting")
     
     # 詳細結果表示
     with st.container(border=True):
@@ -872,12 +977,21 @@ def show_manual_rule_creation():
             key="manual_rule_prompt"
         )
         
+        local_check_options = [""] + list(LOCAL_CHECK_TYPES.keys())
+        rule_local_check = st.selectbox(
+            "ローカル事前判定",
+            local_check_options,
+            format_func=lambda key: LOCAL_CHECK_TYPES.get(key, "なし（常にLLMで判定）"),
+            help="金額計算や期末日との比較のように計算で判定できるルールは、LLMを使わずに判定します（判定できない場合のみLLMで評価）",
+            key="manual_rule_local_check"
+        )
+        
         st.markdown("</div>", unsafe_allow_html=True)
         
         if st.button("ルールを追加", type="primary", use_container_width=True, key="add_manual_rule"):
             if rule_name and rule_prompt:
                 st.session_state.rules.add_rule(
-                    rule_name, rule_category, rule_prompt
+                    rule_name, rule_category, rule_prompt, local_check=rule_local_check or None
                 )
                 st.success(f"ルール '{rule_name}' が追加されました")
                 st.rerun()
@@ -1036,14 +1150,34 @@ def show_existing_rules():
                 st.markdown(f"**チェック内容**")
                 st.code(rule['prompt'], language="text")
                 
+                local_check_spec = LocalRuleEngine.get_check_spec(rule)
+                if local_check_spec:
+                    st.markdown(f"**ローカル事前判定**: {LOCAL_CHECK_TYPES[local_check_spec['type']]}")
+                
                 st.markdown(f"**作成日**: {rule['created_at']}")
                 
                 col_edit, col_delete = st.columns([1, 1])
+                with col_edit:
+                    # エキスパンダーは入れ子にできないため、チェックボックスで編集フォームを開閉する
+                    editing = st.checkbox("編集", key=f"edit_toggle_{rule_id}")
                 with col_delete:
                     if st.button("削除", key=f"delete_{rule_id}", type="secondary", use_container_width=True):
                         st.session_state.rules.delete_rule(rule_id)
                         st.success(f"ルール '{rule['name']}' が削除されました")
                         st.rerun()
+                
+                if editing:
+                    with st.form(f"edit_rule_{rule_id}"):
+                        edited_name = st.text_input("ルール名", value=rule['name'])
+                        edited_category = st.text_input("カテゴリ", value=rule['category'])
+                        edited_prompt = st.text_area("チェック内容", value=rule['prompt'], height=150)
+                        if st.form_submit_button("保存", type="primary", use_container_width=True):
+                            # 更新日時が変わるため、差分再チェックではこのルールのみ再評価される
+                            st.session_state.rules.update_rule(
+                                rule_id, name=edited_name, category=edited_category, prompt=edited_prompt
+                            )
+                            st.success(f"ルール '{edited_name}' が更新されました")
+                            st.rerun()
     else:
         st.info("まだルールが設定されていません。上記のフォームから新しいルールを追加してください。")
 
@@ -1220,64 +1354,184 @@ def show_check_execution():
                 total_checks = len(selected_files) * len(selected_rules)
                 st.metric("総チェック数", total_checks)
             
+            batch_rules = st.checkbox(
+                "ルール一括評価モード",
+                value=False,
+                help="1ファイルにつき全ルールを1回のリクエストでまとめて評価します。リクエスト数と入力トークンを削減できます（結果が不正なルールのみ個別に再評価）"
+            )
+            
+            # 前回の結果がある場合は、入力（請求書の内容・ルール・モデル）が変わった組み合わせのみ再チェックできる
+            incremental = st.checkbox(
+                "差分のみ再チェック",
+                value=False,
+                disabled="check_results" not in st.session_state,
+                help="前回のチェック結果のうち、請求書の内容・ルールの更新日時・モデルが同じ組み合わせを再利用し、変更があった組み合わせのみ評価します"
+            )
+            
             # 推定処理時間
-            estimated_time = round((total_checks/st.session_state.max_workers)+1) * 3   # 1チェックあたり約3秒と仮定 並列処理を考慮
+            total_requests = len(selected_files) if batch_rules else total_checks
+            estimated_time = round((total_requests/st.session_state.max_concurrent_requests)+1) * 3   # 1リクエストあたり約3秒と仮定 同時リクエスト数を考慮
             st.markdown(f"**推定処理時間**: 約 {estimated_time//60} 分 {estimated_time%60} 秒")
             
             st.markdown("</div>", unsafe_allow_html=True)
             
             # 実行ボタン
             if st.button("チェック開始", type="primary", use_container_width=True):
-                run_invoice_check(selected_rules, selected_files)
+                run_invoice_check(selected_rules, selected_files, batch_rules=batch_rules, incremental=incremental)
     else:
         st.warning("ルールとファイルの両方を選択してください")
 
-def run_invoice_check(selected_rules, selected_files):
-    """請求書チェックを実行"""
+def format_concurrency_stats(stats):
+    """同時実行数の統計を進捗表示用の文字列に整形"""
+    return (f"並列数: {stats['in_flight']}/{stats['limit']} | "
+            f"スループット: {stats['throughput_per_second'] * 60:.1f}件/分 | "
+            f"レート制限(429): {stats['throttled']}回")
+
+def show_text_cache_stats():
+    """抽出テキストキャッシュの利用状況（サイドバー）"""
+    text_cache = get_text_cache()
+    stats = text_cache.get_stats()
+    if not stats["enabled"]:
+        return
+    
+    with st.expander("抽出テキストキャッシュ"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("ヒット", stats["hits"], help="抽出せずにキャッシュから再利用したドキュメント数（このセッション）")
+        with col2:
+            st.metric("ミス", stats["misses"], help="新たにテキストを抽出したドキュメント数（このセッション）")
+        st.caption(f"ヒット率: {stats['hit_rate'] * 100:.1f}% | "
+                   f"キャッシュ件数: {stats['entries']} 件 / "
+                   f"{stats['size_bytes'] / 1024 / 1024:.1f} MB（上限 {stats['max_size_bytes'] / 1024 / 1024:.0f} MB）")
+        for extractor, count in sorted(stats["extractors"].items()):
+            st.caption(f"- {extractor}: {count} 件")
+        
+        # 抽出バックエンドごとの処理速度（このプロセスでの計測）
+        for backend, backend_stats in sorted(get_extractor_registry().get_stats().items()):
+            st.caption(f"{backend}: 成功 {backend_stats['successes']} / 失敗 {backend_stats['failures']} / "
+                       f"タイムアウト {backend_stats['timeouts']} 件 | "
+                       f"{backend_stats['throughput_mb_per_second']:.1f} MB/秒")
+        
+        if st.button("キャッシュを削除", key="clear_text_cache", use_container_width=True):
+            text_cache.clear()
+            text_cache.reset_stats()
+            st.rerun()
+
+def format_cascade_stats(stats):
+    """モデルのカスケードの段階別集計を表示用の文字列に整形"""
+    first_pass = stats["tiers"]["first_pass"]
+    primary = stats["tiers"]["primary"]
+    return (f"{stats['first_pass_model']}: {first_pass['requests']}回 / {first_pass['tokens']:,}トークン / "
+            f"平均{first_pass['latency_avg_seconds']:.1f}秒 | "
+            f"{stats['primary_model']}: {primary['requests']}回 / {primary['tokens']:,}トークン / "
+            f"平均{primary['latency_avg_seconds']:.1f}秒 | "
+            f"再評価: {stats['escalations']}/{stats['first_pass_items']}件")
+
+def show_metrics_export(key_prefix):
+    """このセッションの直近の実行のLLM呼び出しメトリクス（応答時間の分布）とJSON/CSVのダウンロード"""
+    metrics_run = st.session_state.get(f"{key_prefix}_metrics_run")
+    if not metrics_run:
+        return
+    metrics = get_metrics()
+    services = metrics.get_summary(run=metrics_run)["services"]
+    if not services:
+        return
+    
+    for service, service_stats in services.items():
+        latency = service_stats["histograms"]["latency_ms"]
+        st.caption(f"{service}: {service_stats['calls']}回 | 応答時間 p50 {latency['p50']:.0f}ms / "
+                   f"p90 {latency['p90']:.0f}ms / p99 {latency['p99']:.0f}ms | "
+                   f"リトライ {service_stats['retries']}回 | エラー {service_stats['errors']}回 | "
+                   f"検証エラー {service_stats['validation_failures']}回")
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="メトリクスをダウンロード（JSON）",
+            data=metrics.export_json(run=metrics_run),
+            file_name=f"llm_metrics_{timestamp}.json",
+            mime="application/json",
+            key=f"{key_prefix}_metrics_json",
+            help="LLM呼び出しごとの応答時間・待ち時間・トークン数とヒストグラムをダウンロードします"
+        )
+    with col2:
+        st.download_button(
+            label="メトリクスをダウンロード（CSV）",
+            data=metrics.export_csv(run=metrics_run),
+            file_name=f"llm_metrics_{timestamp}.csv",
+            mime="text/csv",
+            key=f"{key_prefix}_metrics_csv",
+            help="LLM呼び出しごとの記録をCSV形式でダウンロードします"
+        )
+
+def run_invoice_check(selected_rules, selected_files, batch_rules=False, incremental=False):
+    """
+    請求書チェックを実行
+    incrementalの場合は前回の結果を再利用して変更分のみ評価し、前回の結果に反映する
+    """
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    total_files = len(selected_files)
     results = {}
-    
-    # 並列処理で実行
-    with concurrent.futures.ThreadPoolExecutor(max_workers=st.session_state.max_workers) as executor:
-        futures = {}
-        
-        for i, file_name in enumerate(selected_files):
-            file_data = st.session_state.processed_data[file_name]
-            future = executor.submit(
-                st.session_state.checker.check_invoice,
-                file_data,
-                selected_rules
-            )
-            futures[future] = file_name
-        
-        # 結果を収集
-        completed = 0
-        status_text.text("チェック中...")
-        for future in concurrent.futures.as_completed(futures):
-            file_name = futures[future]
-            try:
-                result = future.result()
-                results[file_name] = result
-                completed += 1
-                
-                progress = completed / total_files
-                progress_bar.progress(progress)
-                status_text.text(f"処理中... {completed}/{total_files} 完了")
-                
-            except Exception as e:
-                st.error(f"ファイル {file_name} の処理中にエラーが発生しました: {str(e)}")
-                results[file_name] = {"error": str(e)}
-    
-    # 結果をセッション状態に保存
+    previous_results = st.session_state.get("check_results", {}) if incremental else None
+    
+    # 今回の実行分のキャッシュ・並列数の統計を集計するためリセット
+    st.session_state.checker.response_cache.reset_stats()
+    controller = get_concurrency_controller()
+    concurrency_since = controller.get_stats()
+    coalesce_since = get_singleflight().get_stats()
+    usage_since = get_usage_stats().get_stats()
+    st.session_state.checker.cascade.reset_stats()
+    # メトリクスは全セッションで共有するため、今回の実行の呼び出しをrunタグで識別する
+    metrics_run = uuid.uuid4().hex
+    st.session_state.invoice_check_metrics_run = metrics_run
+    
+    # 非同期で実行（1スレッドのイベントループ上で同時リクエスト数を制限）
+    files_data = [st.session_state.processed_data[file_name] for file_name in selected_files]
+    
+    def update_progress(completed, total, file_name):
+        progress_bar.progress(completed / total)
+        status_text.text(f"処理中... {completed}/{total} 完了 (最新: {file_name}) | "
+                         f"{format_concurrency_stats(controller.get_stats(since=concurrency_since))}")
+    
+    status_text.text("チェック中...")
+    try:
+        with metrics_tags(run=metrics_run):
+            check_results = asyncio.run(st.session_state.checker.check_invoices_async(
+                files_data,
+                selected_rules,
+                batch_rules=batch_rules,
+                max_concurrency=st.session_state.max_concurrent_requests,
+                progress_callback=update_progress,
+                previous_results=previous_results
+            ))
+        for file_name, result in zip(selected_files, check_results):
+            results[file_name] = result
+            if "error" in result and "checks" not in result:
+                st.error(f"ファイル {file_name} の処理中にエラーが発生しました: {result['error']}")
+    except Exception as e:
+        st.error(f"チェック処理中にエラーが発生しました: {str(e)}")
+        for file_name in selected_files:
+            results.setdefault(file_name, {"error": str(e)})
+    
+    # 結果をセッション状態に保存（差分再チェックの場合は前回の結果に反映）
+    reused_checks = sum(result.get("reused_checks", 0) for result in results.values())
+    if incremental:
+        results = {**previous_results, **results}
     st.session_state.check_results = results
+    st.session_state.check_cache_stats = st.session_state.checker.response_cache.get_stats()
+    st.session_state.check_coalesce_stats = get_singleflight().get_stats(since=coalesce_since)
+    st.session_state.check_usage_stats = get_usage_stats().get_stats(since=usage_since)
+    st.session_state.check_cascade_stats = st.session_state.checker.cascade.get_stats()
     status_text.empty()
     st.session_state.check_timestamp = datetime.now()
     
     progress_bar.progress(1.0)
-    st.success(f"{len(results)}件のファイルのチェックが完了しました")
+    if incremental:
+        st.success(f"{len(selected_files)}件のファイルのチェックが完了しました（前回の結果を再利用: {reused_checks}件のチェック）")
+    else:
+        st.success(f"{len(results)}件のファイルのチェックが完了しました")
 
 def show_results():
     """既存の結果表示機能"""
@@ -1360,6 +1614,50 @@ def show_results():
                 help="すべてのチェックが正常なファイル数"
             )
         
+        # レスポンスキャッシュの利用状況
+        cache_stats = st.session_state.get("check_cache_stats")
+        if cache_stats and cache_stats.get("enabled"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric(
+                    label="キャッシュヒット",
+                    value=cache_stats["hits"],
+                    help="キャッシュから再利用したルール評価数（LLM呼び出しなし）"
+                )
+            with col2:
+                st.metric(
+                    label="キャッシュミス",
+                    value=cache_stats["misses"],
+                    help="LLMで新たに評価したルール数"
+                )
+            with col3:
+                st.metric(
+                    label="キャッシュヒット率",
+                    value=f"{cache_stats['hit_rate'] * 100:.1f}%",
+                    help=f"キャッシュ件数: {cache_stats['entries']} 件 / {cache_stats['size_bytes'] / 1024 / 1024:.1f} MB"
+                )
+        
+        # 同一リクエストの集約状況
+        coalesce_stats = st.session_state.get("check_coalesce_stats")
+        if coalesce_stats and coalesce_stats.get("coalesced"):
+            st.caption(f"同時に実行された同一内容のリクエスト {coalesce_stats['coalesced']} 件を集約し、"
+                       f"LLM呼び出しを削減しました（実行 {coalesce_stats['executed']} 件）")
+        
+        # プロバイダー側のプロンプトキャッシュの利用状況（usageのcached_tokens）
+        usage_stats = st.session_state.get("check_usage_stats")
+        if usage_stats and usage_stats.get("prompt_tokens"):
+            st.caption(f"入力トークン {usage_stats['prompt_tokens']:,} のうち {usage_stats['cached_tokens']:,} "
+                       f"（{usage_stats['cached_rate'] * 100:.1f}%）がプロンプトキャッシュから再利用されました"
+                       f"（キャッシュ利用リクエスト {usage_stats['cached_requests']}/{usage_stats['requests']} 件）")
+        
+        # モデルのカスケードの段階別集計
+        cascade_stats = st.session_state.get("check_cascade_stats")
+        if cascade_stats and cascade_stats.get("enabled"):
+            st.caption(f"モデルカスケード: {format_cascade_stats(cascade_stats)}")
+        
+        # LLM呼び出しのメトリクス
+        show_metrics_export("invoice_check")
+        
     # 詳細結果表示
     with st.container(border=True):
         st.markdown(f'<div class="card-header">詳細結果</div>', unsafe_allow_html=True)
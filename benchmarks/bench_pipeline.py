@@ -0,0 +1,219 @@
+"""
+パイプライン全体のベンチマーク（ローカルのモックLLMサーバーを使用）
+
+- accounting: ZIP展開・ドキュメント抽出 → プロンプト構築 → LLM → Excel書き込み
+  （FolderProcessor.process_evidence_folder → TaskEngine.execute_accounting_task → ExcelManager.save_workbook）
+- invoice: 請求書チェック（InvoiceChecker.check_invoices_async、run_invoice_checkと同じ経路）
+
+件数ごとにスループット・LLM応答時間（p50/p95、モックサーバー側で計測）・ピークメモリ（tracemalloc）を出力する
+
+実行方法（リポジトリのルートで）:
+    python benchmarks/bench_pipeline.py --sizes 10,100,1000,10000 --latency-ms 200
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import zipfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# モックサーバーに接続するため、coreの読み込み前にプロバイダーを切り替える
+os.environ["OPENAI_PROVIDER"] = "mock"
+
+import openpyxl  # noqa: E402
+
+from core.excel_manager import ExcelManager  # noqa: E402
+from core.folder_processor import FolderProcessor  # noqa: E402
+from core.invoice_checker import InvoiceChecker  # noqa: E402
+from core.concurrency_controller import get_concurrency_controller  # noqa: E402
+from core.mock_llm_server import MockLLMServer  # noqa: E402
+from core.rate_limiter import get_shared_rate_limiter  # noqa: E402
+from core.rule_manager import RuleManager  # noqa: E402
+from core.task_engine import TaskEngine  # noqa: E402
+
+ACCOUNTING_TASK_ID = "accounting_task_1"
+ACCOUNTING_INSTRUCTION = "請求書と入金明細を照合し、請求金額・入金金額・照合結果を記載してください"
+
+
+class _UploadedBytes(io.BytesIO):
+    """Streamlitのアップロードファイル相当（name属性付き）"""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+def _invoice_text(index: int) -> str:
+    amount = 100000 + index * 10
+    return (f"請求書\n請求書番号: INV-{index:06d}\n請求日: 2024年3月25日\n支払期限: 2024年4月30日\n"
+            f"請求者: 株式会社サンプル{index % 50}\n請求金額: {amount:,}円（消費税10%込み）\n"
+            f"振込先: サンプル銀行 本店 普通 {1000000 + index}\n")
+
+
+def _build_evidence_zip(items: int) -> _UploadedBytes:
+    """証跡ZIP（evidence/データID/ドキュメント の2階層）を作成"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for i in range(items):
+            folder = f"evidence/data_{i:05d}"
+            zip_file.writestr(f"{folder}/invoice.txt", _invoice_text(i))
+            zip_file.writestr(f"{folder}/payment.txt",
+                              f"入金明細\n入金日: 2024年4月25日\n入金額: {100000 + i * 10:,}円\n")
+    return _UploadedBytes(buffer.getvalue(), "evidence.zip")
+
+
+def _build_excel_manager() -> ExcelManager:
+    """結果シートを持つ調書ワークブックを用意"""
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "結果"
+    excel_manager = ExcelManager()
+    excel_manager.workbook = workbook
+    excel_manager.file_name = "benchmark.xlsx"
+    return excel_manager
+
+
+def run_accounting(items: int, args) -> dict:
+    zip_upload = _build_evidence_zip(items)
+    task_engine = TaskEngine()
+    task_engine.set_api_key("mock")
+
+    evidence_data = FolderProcessor().process_evidence_folder(zip_upload)
+    if not evidence_data["success"]:
+        raise RuntimeError(evidence_data["error"])
+
+    excel_manager = _build_excel_manager()
+    result = task_engine.execute_accounting_task(
+        task_config_id=ACCOUNTING_TASK_ID,
+        evidence_data=evidence_data,
+        excel_manager=excel_manager,
+        instruction=ACCOUNTING_INSTRUCTION,
+        max_workers=args.workers
+    )
+    if not result.get("success"):
+        raise RuntimeError(result.get("error"))
+    excel_manager.save_workbook()
+    return {"failed": result["summary"]["failed_data_count"]}
+
+
+def run_invoice(items: int, args) -> dict:
+    checker = InvoiceChecker()
+    checker.set_api_key("mock")
+    # キャッシュヒットで計測が歪まないよう無効化
+    checker.response_cache.enabled = False
+
+    rule_ids = list(RuleManager().get_all_rules().keys())[:args.rules]
+    files_data = [{
+        "file_name": f"invoice_{i:05d}.pdf",
+        "content": _invoice_text(i),
+        "metadata": {"file_type": "pdf"}
+    } for i in range(items)]
+
+    results = asyncio.run(checker.check_invoices_async(
+        files_data, rule_ids, batch_rules=args.batch_rules, max_concurrency=args.concurrency
+    ))
+    return {"failed": sum(1 for result in results if result.get("error"))}
+
+
+SCENARIOS = {"accounting": run_accounting, "invoice": run_invoice}
+
+
+def measure(scenario: str, items: int, server: MockLLMServer, args) -> dict:
+    """1シナリオ・1件数の計測"""
+    server.reset_stats()
+    get_concurrency_controller().reset_stats()
+    tracemalloc.start()
+    started_at = time.perf_counter()
+
+    with open(os.devnull, "w") as devnull, \
+            (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+        outcome = SCENARIOS[scenario](items, args)
+
+    elapsed = time.perf_counter() - started_at
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = server.get_stats()
+    concurrency_stats = get_concurrency_controller().get_stats()
+    return {
+        "scenario": scenario,
+        "items": items,
+        "elapsed_seconds": round(elapsed, 3),
+        "items_per_second": round(items / elapsed, 2) if elapsed > 0 else 0.0,
+        "llm_requests": stats["requests"],
+        "llm_errors": stats["errors"] + stats["rate_limited"],
+        "latency_p50_ms": round(stats["latency_p50"] * 1000, 1),
+        "latency_p95_ms": round(stats["latency_p95"] * 1000, 1),
+        "peak_memory_mb": round(peak_memory / (1024 * 1024), 2),
+        "peak_concurrency": concurrency_stats["peak_limit"] if concurrency_stats["enabled"] else None,
+        "throttled": concurrency_stats["throttled"],
+        "prompt_tokens": stats["prompt_tokens"],
+        "cached_tokens": stats["cached_tokens"],
+        "failed_items": outcome["failed"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モックLLMを使ったパイプライン全体のベンチマーク")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="件数（カンマ区切り）")
+    parser.add_argument("--scenarios", default="accounting,invoice", help="accounting / invoice（カンマ区切り）")
+    parser.add_argument("--latency-ms", type=float, default=200, help="モックLLMの応答遅延の中央値（ミリ秒）")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500エラーを返す確率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429エラーを返す確率")
+    parser.add_argument("--workers", type=int, default=32, help="経理業務処理の並列数")
+    parser.add_argument("--concurrency", type=int, default=64, help="請求書チェックの同時リクエスト数")
+    parser.add_argument("--rules", type=int, default=3, help="請求書チェックで適用するルール数")
+    parser.add_argument("--batch-rules", action="store_true", help="ルール一括評価モードで請求書チェックを実行")
+    parser.add_argument("--rate-limit", action="store_true", help="共有レートリミッターを有効のまま計測")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="同時実行数の自動調整を無効にし、--workers / --concurrencyで固定して計測")
+    parser.add_argument("--output", default=None, help="結果をJSONで保存するパス")
+    parser.add_argument("--verbose", action="store_true", help="処理中のログを表示")
+    args = parser.parse_args()
+
+    os.chdir(REPO_ROOT)
+
+    server = MockLLMServer(
+        latency_ms=args.latency_ms,
+        latency_distribution=args.latency_distribution,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    os.environ["MOCK_LLM_BASE_URL"] = server.start()
+
+    if not args.rate_limit:
+        # モック相手のためRPM/TPM制限は不要（実APIの制限を再現する場合は--rate-limit）
+        get_shared_rate_limiter().enabled = False
+    get_concurrency_controller().enabled = not args.fixed_concurrency
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+
+    print(f"{'シナリオ':<12}{'件数':>8}{'秒':>10}{'件/秒':>10}{'LLM呼出':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'ピークMB':>10}{'失敗':>6}")
+    rows = []
+    try:
+        for scenario in scenarios:
+            for items in sizes:
+                row = measure(scenario, items, server, args)
+                rows.append(row)
+                print(f"{scenario:<12}{items:>8}{row['elapsed_seconds']:>10.2f}{row['items_per_second']:>10.1f}"
+                      f"{row['llm_requests']:>10}{row['latency_p50_ms']:>10.1f}{row['latency_p95_ms']:>10.1f}"
+                      f"{row['peak_memory_mb']:>10.1f}{row['failed_items']:>6}")
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
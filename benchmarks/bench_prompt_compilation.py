@@ -0,0 +1,107 @@
+"""
+プロンプトのコンパイルによるデータごとのオーバーヘッド削減を計測するマイクロベンチマーク
+
+従来方式: データごとにレスポンススキーマのJSON化・出力仕様の文字列化・テンプレート展開を行う
+コンパイル方式: タスク開始時に1度だけ生成し、データごとは証跡データの整形と差し込みのみ
+
+実行方法（リポジトリのルートで）:
+    python benchmarks/bench_prompt_compilation.py --items 1000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.llm_client import LLMClient, _accounting_system_prompt  # noqa: E402
+
+TASK_CONFIGS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 "config", "task_configs.json")
+
+
+def _build_evidence(items: int):
+    """計測用の単一データ証跡を作成"""
+    evidence_list = []
+    for i in range(items):
+        data_id = f"data_{i:05d}"
+        evidence_list.append((data_id, {
+            "success": True,
+            "data": {
+                data_id: {
+                    "document_count": 2,
+                    "documents": {
+                        "invoice.pdf": {"type": "pdf", "extension": ".pdf",
+                                        "content": f"請求書 No.{i} 請求金額 {110000 + i}円 請求日 2024-03-31"},
+                        "payment.xlsx": {"type": "excel", "extension": ".xlsx",
+                                         "content": f"入金明細 {i} 入金額 {110000 + i}円 入金日 2024-04-30"}
+                    }
+                }
+            }
+        }))
+    return evidence_list
+
+
+def _legacy_messages(client: LLMClient, instruction, evidence, output_format, task_config):
+    """従来方式: データごとに全ての部品を生成"""
+    prompt = client._compile_prompt(instruction, output_format, task_config).render(
+        client._format_evidence_data(evidence))
+    system_prompt = _accounting_system_prompt.__wrapped__(include_schema=not client.use_structured_outputs)
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+
+
+def _compiled_messages(client: LLMClient, compiled_prompt, evidence):
+    """コンパイル方式: 証跡データの整形と差し込みのみ"""
+    prompt = compiled_prompt.render(client._format_evidence_data(evidence))
+    return [{"role": "system", "content": compiled_prompt.system_prompt}, {"role": "user", "content": prompt}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プロンプトコンパイルのマイクロベンチマーク")
+    parser.add_argument("--items", type=int, default=1000, help="データ件数")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最良値を採用）")
+    args = parser.parse_args()
+
+    with open(TASK_CONFIGS_PATH, "r", encoding="utf-8") as f:
+        task_config = json.load(f)["accounting_task_1"]
+    output_format = task_config["output_config"]
+    instruction = "請求書と入金明細を照合してください"
+
+    client = LLMClient()
+    evidence_list = _build_evidence(args.items)
+
+    # 結果が一致することを確認
+    compiled_prompt = client.get_compiled_prompt(instruction, output_format, task_config)
+    _, sample = evidence_list[0]
+    assert _legacy_messages(client, instruction, sample, output_format, task_config) == \
+        _compiled_messages(client, compiled_prompt, sample)
+
+    legacy_times = []
+    compiled_times = []
+    for _ in range(args.repeat):
+        _accounting_system_prompt.cache_clear()
+        client._compiled_prompts.clear()
+
+        started_at = time.perf_counter()
+        for _, evidence in evidence_list:
+            _legacy_messages(client, instruction, evidence, output_format, task_config)
+        legacy_times.append(time.perf_counter() - started_at)
+
+        started_at = time.perf_counter()
+        compiled_prompt = client.get_compiled_prompt(instruction, output_format, task_config)
+        for _, evidence in evidence_list:
+            _compiled_messages(client, compiled_prompt, evidence)
+        compiled_times.append(time.perf_counter() - started_at)
+
+    legacy_per_item = min(legacy_times) / args.items * 1e6
+    compiled_per_item = min(compiled_times) / args.items * 1e6
+
+    print(f"データ件数: {args.items}件（{args.repeat}回の最良値）")
+    print(f"従来方式:       {legacy_per_item:8.1f} µs/件")
+    print(f"コンパイル方式: {compiled_per_item:8.1f} µs/件")
+    print(f"削減率:         {(1 - compiled_per_item / legacy_per_item) * 100:8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,62 @@
-# Configuration files
\ No newline at end of file
+# Configuration files
+"""
+設定の読み込み
+
+config.sample.py をベースに、利用者が作成した config.py の値で上書きした設定を返す。
+config.py に存在しないセクションやキーはサンプルの既定値が使われる。
+"""
+import copy
+import importlib.util
+from pathlib import Path
+from typing import Any, Dict
+
+_CONFIG_DIR = Path(__file__).resolve().parent
+_SAMPLE_FILE = _CONFIG_DIR / "config.sample.py"
+_USER_FILE = _CONFIG_DIR / "config.py"
+
+_loaded_sections: Dict[str, Dict[str, Any]] = {}
+
+
+def _load_module_sections(file_path: Path) -> Dict[str, Dict[str, Any]]:
+    """設定ファイルを読み込み、大文字の辞書定義をセクションとして返す"""
+    if not file_path.exists():
+        return {}
+
+    spec = importlib.util.spec_from_file_location(f"_config_{file_path.stem.replace('.', '_')}", file_path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        print(f"設定ファイル読み込みエラー ({file_path.name}): {str(e)}")
+        return {}
+
+    return {
+        name: value
+        for name, value in vars(module).items()
+        if name.isupper() and isinstance(value, dict)
+    }
+
+
+def _load_all_sections() -> Dict[str, Dict[str, Any]]:
+    """サンプル設定とユーザー設定をマージ"""
+    if not _loaded_sections:
+        sections = _load_module_sections(_SAMPLE_FILE)
+        for name, values in _load_module_sections(_USER_FILE).items():
+            merged = dict(sections.get(name, {}))
+            merged.update(values)
+            sections[name] = merged
+        _loaded_sections.update(sections)
+    return _loaded_sections
+
+
+def get_config(section: str) -> Dict[str, Any]:
+    """
+    設定セクションを取得
+
+    Args:
+        section: セクション名（例: "ERROR_CONFIG"）
+
+    Returns:
+        設定値の辞書（コピー）。セクションが存在しない場合は空の辞書
+    """
+    return copy.deepcopy(_load_all_sections().get(section, {}))
@@ -43,6 +43,57 @@ PROCESSING_CONFIG = {
     
     # タイムアウト（秒）
     "timeout": 300,  # 5分
+    
+    # 請求書チェック（非同期処理）の同時リクエスト数
+    "max_concurrent_requests": 64,
+    
+    # 経理業務処理で小さなデータを複数まとめて1リクエストで処理するか
+    "pack_items": False,
+    
+    # まとめて処理する場合の1リクエストあたりの入力トークン予算
+    "pack_token_budget": 8000,
+    
+    # まとめて処理する場合の1リクエストあたりの最大データ数
+    "max_items_per_pack": 10,
+    
+    # 同一内容のリクエストが同時に実行中の場合、1回の呼び出しの結果を共有するか
+    "coalesce_requests": True,
+}
+
+# 証跡ドキュメントのテキスト抽出設定（PDF・Excelをプロセスプールで並列抽出）
+EXTRACTION_CONFIG = {
+    # 抽出に使うプロセス数（0はCPUコア数、1は常に単一プロセスで抽出）
+    "max_workers": 0,
+    
+    # プロセスプールを使う最小ドキュメント数（これ未満はプロセス起動のコストの方が大きいため単一プロセス）
+    "min_documents_for_pool": 8,
+}
+
+# テキスト抽出バックエンドの設定（拡張子・MIMEタイプごとに優先順に試し、失敗時は次のバックエンド）
+EXTRACTOR_CONFIG = {
+    # バックエンドの選択方法（"rank": 登録順位、"fastest": 計測した処理速度が速い順）
+    "selection": "rank",
+    
+    # "fastest" で処理速度を採用するのに必要な成功件数
+    "min_benchmark_samples": 5,
+    
+    # 1バックエンドあたりのタイムアウト（秒、0は無制限）。超えた場合は次のバックエンドを試す
+    "timeout_seconds": 120,
+    
+    # 拡張子ごとのバックエンドの優先順（指定したものを先に試す）
+    "backend_order": {
+        ".pdf": ["pymupdf", "pypdf2"],
+    },
+    
+    # このページ数以上のPDFはページ範囲に分割して複数プロセスで並列に抽出（0は分割しない）
+    "page_parallel_threshold": 100,
+    
+    # ページ分割での抽出に使うプロセス数（0はEXTRACTION_CONFIGのmax_workers、それも0の場合はCPUコア数。CPUコア数が上限）
+    # プロセスプールは初回に作成し、アップロードされたファイルをまたいで再利用する
+    "page_parallel_workers": 0,
+    
+    # 1プロセスに割り当てる最小ページ数（ページ数が少ない場合は分割数を減らす）
+    "min_pages_per_range": 25,
 }
 
 # アプリケーション設定
@@ -86,6 +137,216 @@ OUTPUT_CONFIG = {
     "detailed_logging": True,
 }
 
+# LLMレスポンスキャッシュ設定
+CACHE_CONFIG = {
+    # キャッシュを有効にするか
+    "enabled": True,
+    
+    # キャッシュファイルのパス（SQLite）
+    "db_path": "cache/llm_responses.sqlite3",
+    
+    # 最大エントリ数（超過分は最終参照が古い順に削除）
+    "max_entries": 20000,
+    
+    # 最大サイズ（バイト）
+    "max_size_bytes": 200 * 1024 * 1024,  # 200MB
+    
+    # 有効期限（日）
+    "max_age_days": 30,
+}
+
+# 抽出テキストキャッシュ設定（ドキュメントのSHA-256をキーにPDF・Excel等の抽出結果を再利用）
+TEXT_CACHE_CONFIG = {
+    # キャッシュを有効にするか
+    "enabled": True,
+    
+    # キャッシュファイルのパス（SQLite）
+    "db_path": "cache/extracted_text.sqlite3",
+    
+    # 最大エントリ数（超過分は最終参照が古い順に削除）
+    "max_entries": 50000,
+    
+    # 最大サイズ（バイト）
+    "max_size_bytes": 500 * 1024 * 1024,  # 500MB
+}
+
+# レート制限設定（全LLMサービスで共有）
+RATE_LIMIT_CONFIG = {
+    # レート制限を有効にするか
+    "enabled": True,
+    
+    # 1分あたりの最大リクエスト数（RPM）
+    "requests_per_minute": 500,
+    
+    # 1分あたりの最大トークン数（TPM）
+    "tokens_per_minute": 200000,
+    
+    # 出力トークンの想定値（事前予約用、応答のusageで補正）
+    "default_completion_tokens": 1000,
+}
+
+# 同時実行数の自動調整設定（AIMD、全LLMサービスで共有）
+CONCURRENCY_CONFIG = {
+    # 自動調整を有効にするか（無効時は並列処理数・同時リクエスト数の設定値で固定）
+    "adaptive": True,
+    
+    # 同時実行数の初期値・下限・上限（画面の並列処理数・同時リクエスト数もさらに上限として働く）
+    "initial_limit": 4,
+    "min_limit": 1,
+    "max_limit": 64,
+    
+    # 応答が健全な場合、1往復あたりに増やす数
+    "increase_step": 1,
+    
+    # 429・エラー率超過時に掛ける減少率と、連続して減らさないための間隔（秒）
+    "decrease_factor": 0.5,
+    "decrease_cooldown_seconds": 2.0,
+    
+    # 応答時間が基準（最小の移動平均）の何倍までなら増やすか
+    "latency_tolerance": 2.0,
+    
+    # 一時的なエラー率（429を含む）がこれを超えたら減らす
+    "error_rate_threshold": 0.2,
+    
+    # エラー率・スループットの集計期間（秒）
+    "window_seconds": 30,
+}
+
+# モデルのカスケード設定（小さいモデルで先に評価し、必要な場合のみ主モデルで再評価）
+MODEL_CASCADE_CONFIG = {
+    # カスケードを有効にするか（無効時はすべて主モデルで評価）
+    "enabled": False,
+    
+    # 先に評価する小さいモデル（Azure OpenAIでは環境変数 AZURE_OPENAI_CASCADE_DEPLOYMENT_NAME を優先）
+    "first_pass_model": "gpt-4.1-mini",
+    
+    # 確信度（confidence）がこれ未満の結果は主モデルで再評価
+    "confidence_threshold": 0.7,
+    
+    # 請求書チェックで警告（要確認）の結果も主モデルで再評価するか（不合格・検証エラーは常に再評価）
+    "escalate_on_warning": True,
+    
+    # 経理業務処理で主モデルで再処理するステータスと照合結果
+    "escalate_statuses": ["要確認", "エラー"],
+    "escalate_match_statuses": ["要確認"],
+}
+
+# LLM呼び出しのメトリクス設定（応答時間・待ち時間・トークン数のヒストグラムとJSON/CSVエクスポート）
+METRICS_CONFIG = {
+    # メトリクスを記録するか
+    "enabled": True,
+    
+    # 保持する呼び出しごとの記録の上限（超えた分は古い記録から破棄、ヒストグラムは全件を集計）
+    "max_records": 100000,
+    
+    # ヒストグラムの有効桁数（3桁で相対誤差約1%以内）
+    "histogram_significant_digits": 3,
+}
+
+# HTTP接続プール設定（プロバイダー・認証情報ごとに共有）
+HTTP_CLIENT_CONFIG = {
+    # 最大同時接続数
+    "max_connections": 100,
+    
+    # Keep-Aliveで保持する最大接続数
+    "max_keepalive_connections": 20,
+    
+    # Keep-Alive接続の保持時間（秒）
+    "keepalive_expiry": 30.0,
+    
+    # リクエストのタイムアウト（秒）
+    "timeout": 120.0,
+    
+    # 接続確立のタイムアウト（秒）
+    "connect_timeout": 10.0,
+}
+
+# Structured Outputs設定（strictなJSONスキーマで応答形式を指定）
+STRUCTURED_OUTPUT_CONFIG = {
+    # strictなJSONスキーマ指定を使用するか（無効時はjson_object指定＋プロンプト内のスキーマ説明）
+    "enabled": True,
+    
+    # Azure OpenAIで使用する場合に必要な最小APIバージョン（これより古い場合は自動的に無効）
+    "azure_min_api_version": "2024-08-01-preview",
+}
+
+# 証跡データの関連箇所選択設定（経理業務処理）
+EVIDENCE_SELECTION_CONFIG = {
+    # データごとの証跡がトークン予算を超える場合に関連箇所のみを送信するか
+    "enabled": True,
+    
+    # データ1件あたりの証跡データのトークン予算
+    "token_budget_per_item": 12000,
+    
+    # 区画の最大文字数（ページ・シート単位で分割し、長い場合はさらに分割）
+    "chunk_chars": 1500,
+    
+    # BM25のパラメーター
+    "bm25_k1": 1.5,
+    "bm25_b": 0.75,
+    
+    # 各ドキュメントの先頭区画（請求者・日付等）を常に含めるか
+    "always_include_first_chunk": True,
+}
+
+# 事前見積もり（プリフライト）設定
+PREFLIGHT_CONFIG = {
+    # モデルのコンテキスト長（トークン）
+    "context_window_tokens": 1047576,
+    
+    # 1件あたりの出力トークン予測（基本値＋出力列ごとの加算値）
+    "output_tokens_base": 150,
+    "output_tokens_per_column": 40,
+    
+    # 1リクエストの所要時間予測（基本遅延＋出力トークン÷生成速度）
+    "latency_base_seconds": 2.0,
+    "output_tokens_per_second": 80,
+    
+    # 100万トークンあたりの料金
+    "input_price_per_million": 2.0,
+    "output_price_per_million": 8.0,
+    "currency": "USD",
+}
+
+# モックLLMサーバー設定（OPENAI_PROVIDER=mock の場合に使用）
+MOCK_LLM_CONFIG = {
+    # 待ち受けアドレスとポート（0は空きポートを自動選択）
+    "host": "127.0.0.1",
+    "port": 0,
+    
+    # 応答遅延の中央値（ミリ秒）
+    "latency_ms": 500,
+    
+    # 遅延の分布（fixed / uniform / lognormal）
+    "latency_distribution": "lognormal",
+    
+    # 遅延のばらつき（uniformは±の割合、lognormalは対数標準偏差）
+    "latency_jitter": 0.5,
+    
+    # 500エラーを返す確率
+    "error_rate": 0.0,
+    
+    # 429エラーを返す確率とRetry-After（秒）
+    "rate_limit_rate": 0.0,
+    "retry_after_seconds": 1,
+    
+    # usageに返すトークン数（Noneの場合はリクエスト・応答から見積もり）
+    "prompt_tokens": None,
+    "completion_tokens": None,
+    
+    # プロンプトキャッシュの模擬（直近のリクエストと先頭がこのトークン数以上一致した場合に
+    # cached_tokensを返す。0の場合は模擬しない）と、比較対象として保持するリクエスト数
+    "prompt_cache_min_tokens": 1024,
+    "prompt_cache_size": 256,
+    
+    # タスク種別ごとの定型応答（invoice_check / multi_rule_check / accounting /
+    # rule_suggestions / rule_enhancement）。未指定の種別は自動生成
+    "canned_responses": {},
+    
+    # 乱数シード（Noneの場合は毎回異なる）
+    "seed": None,
+}
+
 # セキュリティ設定
 SECURITY_CONFIG = {
     # ファイルの一時保存を行うか
@@ -103,9 +364,15 @@ ERROR_CONFIG = {
     # エラー時のリトライ回数
     "max_retries": 3,
     
-    # リトライ間隔（秒）
+    # リトライ間隔（秒、リトライごとに2倍に延長）
     "retry_delay": 1,
     
+    # リトライ間隔の上限（秒、Retry-Afterヘッダーにも適用）
+    "max_retry_delay": 60,
+    
+    # リトライ間隔にランダムな揺らぎを加えるか
+    "retry_jitter": True,
+    
     # エラーログの詳細度
     "error_detail_level": "HIGH",
 }
@@ -173,6 +440,22 @@ ACCOUNTING_STANDARDS = {
     ],
 }
 
+# ローカルでのルール事前判定設定（ルールのlocal_check指定時、判定できない場合はLLMで評価）
+LOCAL_RULES_CONFIG = {
+    # ローカル判定を有効にするか
+    "enabled": True,
+    
+    # 日付カットオフ判定の期末日（"YYYY-MM-DD"、Noneの場合は文書中の記載または
+    # 取引日・納品日を含む会計期間の期末日をACCOUNTING_STANDARDSのfiscal_year_endから算出）
+    "period_end_date": None,
+    
+    # 消費税の端数処理（floor: 切り捨て / round: 四捨五入 / ceil: 切り上げ / any: いずれも許容）
+    "tax_rounding": "any",
+    
+    # 見出し（請求日・期末日等）から日付までの最大文字数
+    "max_label_distance": 20,
+}
+
 # 国際化設定
 I18N_CONFIG = {
     # デフォルト言語
@@ -1,7 +1,18 @@
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple
 from dotenv import load_dotenv
+from config import get_config
+from .rate_limiter import RateLimiter, get_shared_rate_limiter
+from .concurrency_controller import get_concurrency_controller
+from .model_cascade import ModelCascade
+from .singleflight import get_singleflight, make_request_key
+from .usage_stats import get_usage_stats
+from .metrics import CallTimer, metrics_tags
+from .retry_policy import RetryPolicy
+from .tokenizer import estimate_messages_tokens
 try:
     from langchain_openai import ChatOpenAI, AzureChatOpenAI
 except ImportError:
@@ -18,6 +29,281 @@ try:
 except ImportError:
     OPENAI_AVAILABLE = False
 
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+
+# プロバイダー・認証情報ごとに共有するHTTPクライアントとOpenAIクライアント
+_client_pool: Dict[Tuple, Dict[str, Any]] = {}
+_client_pool_lock = threading.Lock()
+
+
+def _create_http_client() -> Any:
+    """HTTP_CLIENT_CONFIGに従い、Keep-Alive接続をプールするHTTPクライアントを作成"""
+    http_config = get_config("HTTP_CLIENT_CONFIG")
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=http_config.get("max_connections", 100),
+            max_keepalive_connections=http_config.get("max_keepalive_connections", 20),
+            keepalive_expiry=http_config.get("keepalive_expiry", 30.0)
+        ),
+        timeout=httpx.Timeout(
+            http_config.get("timeout", 120.0),
+            connect=http_config.get("connect_timeout", 10.0)
+        )
+    )
+
+
+def get_provider_base_url(provider: str) -> Optional[str]:
+    """プロバイダーの接続先URL（mockの場合はローカルのモックサーバー、それ以外はNoneで既定値）"""
+    if provider == "mock":
+        from .mock_llm_server import get_mock_base_url
+        return get_mock_base_url()
+    return None
+
+
+def _get_pooled_clients(provider: str, api_key: str, azure_endpoint: Optional[str] = None,
+                        api_version: Optional[str] = None) -> Dict[str, Any]:
+    """プロバイダー・認証情報に対応するクライアント一式を取得（初回のみ作成）"""
+    if not OPENAI_AVAILABLE:
+        raise ImportError("OpenAIライブラリが正しくインストールされていません")
+    
+    key = (provider, api_key, azure_endpoint, api_version)
+    with _client_pool_lock:
+        clients = _client_pool.get(key)
+        if clients is None:
+            http_client = _create_http_client() if HTTPX_AVAILABLE else None
+            if provider == "azure":
+                # リトライはexecute_llm_callで制御
+                openai_client = openai.AzureOpenAI(
+                    api_key=api_key,
+                    azure_endpoint=azure_endpoint,
+                    api_version=api_version,
+                    max_retries=0,
+                    http_client=http_client
+                )
+            else:
+                openai_client = openai.OpenAI(
+                    api_key=api_key,
+                    base_url=get_provider_base_url(provider),
+                    max_retries=0,
+                    http_client=http_client
+                )
+            
+            clients = {"http_client": http_client, "openai_client": openai_client}
+            _client_pool[key] = clients
+    return clients
+
+
+def get_openai_client(provider: str, api_key: str, azure_endpoint: Optional[str] = None,
+                      api_version: Optional[str] = None) -> Any:
+    """
+    プロバイダー・認証情報ごとに共有するOpenAI/AzureOpenAIクライアントを取得
+    接続プールとTLSセッションを使い回すため、呼び出しごとにクライアントを作成しない
+    
+    Args:
+        provider: "openai" / "azure" / "mock"（ローカルのモックサーバー）
+        api_key: APIキー
+        azure_endpoint: Azureのエンドポイント（Azureの場合）
+        api_version: AzureのAPIバージョン（Azureの場合）
+        
+    Returns:
+        OpenAIクライアント
+    """
+    return _get_pooled_clients(provider, api_key, azure_endpoint, api_version)["openai_client"]
+
+
+def get_http_client(provider: str, api_key: str, azure_endpoint: Optional[str] = None,
+                    api_version: Optional[str] = None) -> Any:
+    """get_openai_clientと同じ接続プールを持つHTTPクライアントを取得（LangChain用、httpx未導入時はNone）"""
+    return _get_pooled_clients(provider, api_key, azure_endpoint, api_version)["http_client"]
+
+
+def extract_usage(response: Any) -> Dict[str, Optional[int]]:
+    """
+    LLMレスポンスからトークン使用量を取り出す
+    OpenAIクライアントのレスポンスとLangChainのメッセージの両方に対応
+    
+    Returns:
+        prompt_tokens / completion_tokens / total_tokens / cached_tokens（取得できない場合はNone）
+        cached_tokensはプロバイダー側のプロンプトキャッシュで再利用された入力トークン数
+    """
+    usage = {"prompt_tokens": None, "completion_tokens": None, "total_tokens": None, "cached_tokens": None}
+    
+    # OpenAIクライアント（response.usage）
+    raw_usage = getattr(response, "usage", None)
+    if raw_usage is not None and not isinstance(raw_usage, dict):
+        usage["prompt_tokens"] = getattr(raw_usage, "prompt_tokens", None)
+        usage["completion_tokens"] = getattr(raw_usage, "completion_tokens", None)
+        usage["total_tokens"] = getattr(raw_usage, "total_tokens", None)
+        usage["cached_tokens"] = getattr(getattr(raw_usage, "prompt_tokens_details", None), "cached_tokens", None)
+        return usage
+    
+    # LangChain（response_metadata["token_usage"]）
+    metadata = getattr(response, "response_metadata", None) or {}
+    token_usage = metadata.get("token_usage") if isinstance(metadata, dict) else None
+    if token_usage:
+        usage["prompt_tokens"] = token_usage.get("prompt_tokens")
+        usage["completion_tokens"] = token_usage.get("completion_tokens")
+        usage["total_tokens"] = token_usage.get("total_tokens")
+        usage["cached_tokens"] = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        return usage
+    
+    # LangChain（usage_metadata）
+    usage_metadata = getattr(response, "usage_metadata", None)
+    if usage_metadata:
+        usage["prompt_tokens"] = usage_metadata.get("input_tokens")
+        usage["completion_tokens"] = usage_metadata.get("output_tokens")
+        usage["total_tokens"] = usage_metadata.get("total_tokens")
+        usage["cached_tokens"] = (usage_metadata.get("input_token_details") or {}).get("cache_read")
+    
+    return usage
+
+
+def _estimate_request_tokens(messages: List[Any], max_completion_tokens: Optional[int]) -> int:
+    """入力トークンの見積もりに出力トークンの想定値を加えた予約量"""
+    if max_completion_tokens is None:
+        max_completion_tokens = get_config("RATE_LIMIT_CONFIG").get("default_completion_tokens", 1000)
+    return estimate_messages_tokens(messages) + max_completion_tokens
+
+
+def _classify_failure(exception: Exception) -> Optional[str]:
+    """同時実行数の調整に使うエラー種別（調整対象外のエラーはNone）"""
+    if RetryPolicy.is_throttled(exception):
+        return "throttled"
+    if RetryPolicy.is_retryable(exception):
+        return "error"
+    return None
+
+
+def _log_retry(attempt: int, exception: Exception, delay: float):
+    """リトライ時のログ出力"""
+    print(f"[LLM] WARNING: 一時的なエラーのため{delay:.1f}秒後にリトライします（{attempt}回目）: {str(exception)}")
+
+
+def _retry_callback(timer: CallTimer) -> Callable[[int, Exception, float], None]:
+    """リトライ時のログ出力とリトライ回数の計測"""
+    def on_retry(attempt: int, exception: Exception, delay: float):
+        timer.on_retry(attempt, exception, delay)
+        _log_retry(attempt, exception, delay)
+    return on_retry
+
+
+def _coalescing_enabled(coalesce_key: Optional[str]) -> bool:
+    """同一リクエストの同時実行を集約するか"""
+    return coalesce_key is not None and get_config("PROCESSING_CONFIG").get("coalesce_requests", True)
+
+
+def execute_llm_call(call: Callable[[], Any], messages: List[Any],
+                     max_completion_tokens: Optional[int] = None,
+                     coalesce_key: Optional[str] = None) -> Any:
+    """
+    共有レートリミッター・同時実行数の制御・リトライポリシーを通してLLMを呼び出す
+    全サービス（InvoiceChecker / LLMClient / RuleSuggester）のLLM呼び出しはここを経由する
+    
+    Args:
+        call: 実際のAPI呼び出しを行う関数
+        messages: 送信するメッセージ（トークン見積もり用）
+        max_completion_tokens: 出力トークンの想定上限（Noneの場合は設定値）
+        coalesce_key: リクエストのキー（make_request_key）。同じキーの呼び出しが実行中の場合は結果を共有する
+        
+    Returns:
+        APIレスポンス
+    """
+    rate_limiter = get_shared_rate_limiter()
+    controller = get_concurrency_controller()
+    estimated_tokens = _estimate_request_tokens(messages, max_completion_tokens)
+    
+    def attempt(timer: CallTimer):
+        # リトライも1リクエストとして同時実行・レート制限の枠を確保する（待機中のリトライは枠を持たない）
+        timer.start_wait()
+        controller.acquire()
+        try:
+            rate_limiter.acquire(estimated_tokens)
+            timer.end_wait()
+            started_at = time.monotonic()
+            try:
+                response = call()
+            except Exception as e:
+                timer.latency = time.monotonic() - started_at
+                outcome = _classify_failure(e)
+                if outcome:
+                    controller.record(timer.latency, outcome)
+                raise
+            timer.latency = time.monotonic() - started_at
+            controller.record(timer.latency, "success")
+        finally:
+            controller.release()
+        timer.usage = extract_usage(response)
+        rate_limiter.reconcile(estimated_tokens, timer.usage["total_tokens"])
+        get_usage_stats().record(timer.usage)
+        return response
+    
+    def run():
+        # 集約された呼び出しは実行役のみ記録する
+        timer = CallTimer()
+        try:
+            response = RetryPolicy().call(lambda: attempt(timer), on_retry=_retry_callback(timer))
+        except Exception as e:
+            timer.record(e)
+            raise
+        timer.record()
+        return response
+    
+    if _coalescing_enabled(coalesce_key):
+        return get_singleflight().do(coalesce_key, run)
+    return run()
+
+
+async def execute_llm_call_async(call: Callable[[], Awaitable[Any]], messages: List[Any],
+                                 max_completion_tokens: Optional[int] = None,
+                                 coalesce_key: Optional[str] = None) -> Any:
+    """execute_llm_callの非同期版"""
+    rate_limiter = get_shared_rate_limiter()
+    controller = get_concurrency_controller()
+    estimated_tokens = _estimate_request_tokens(messages, max_completion_tokens)
+    
+    async def attempt(timer: CallTimer):
+        timer.start_wait()
+        await controller.acquire_async()
+        try:
+            await rate_limiter.acquire_async(estimated_tokens)
+            timer.end_wait()
+            started_at = time.monotonic()
+            try:
+                response = await call()
+            except Exception as e:
+                timer.latency = time.monotonic() - started_at
+                outcome = _classify_failure(e)
+                if outcome:
+                    controller.record(timer.latency, outcome)
+                raise
+            timer.latency = time.monotonic() - started_at
+            controller.record(timer.latency, "success")
+        finally:
+            controller.release()
+        timer.usage = extract_usage(response)
+        rate_limiter.reconcile(estimated_tokens, timer.usage["total_tokens"])
+        get_usage_stats().record(timer.usage)
+        return response
+    
+    async def run():
+        timer = CallTimer()
+        try:
+            response = await RetryPolicy().call_async(lambda: attempt(timer), on_retry=_retry_callback(timer))
+        except Exception as e:
+            timer.record(e)
+            raise
+        timer.record()
+        return response
+    
+    if _coalescing_enabled(coalesce_key):
+        return await get_singleflight().do_async(coalesce_key, run)
+    return await run()
+
 
 class BaseLLMService(ABC):
     """
@@ -30,10 +316,17 @@ class BaseLLMService(ABC):
         load_dotenv()
         
         self.llm = None
+        self._llms: Dict[str, Any] = {}  # モデルごとのLangChain用LLM（カスケード用）
         self.client = None  # OpenAI直接クライアント用
         self.api_key = None
         self.provider = os.getenv("OPENAI_PROVIDER", "openai")
         
+        # プロセス全体で共有するレートリミッター
+        self.rate_limiter: RateLimiter = get_shared_rate_limiter()
+        
+        # プロセス全体で共有する同時実行数の制御
+        self.concurrency_controller = get_concurrency_controller()
+        
         # プロバイダーに応じた設定を準備
         if self.provider == "azure":
             self.azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -42,6 +335,9 @@ class BaseLLMService(ABC):
             self.model = self.azure_deployment
         else:
             self.model = "gpt-4.1"  # GPT-4.1相当
+        
+        # 小さいモデルでの先行評価と段階別の集計
+        self.cascade = ModelCascade(self.model, self.provider)
     
     def set_api_key(self, api_key: str = None) -> bool:
         """
@@ -81,35 +377,102 @@ class BaseLLMService(ABC):
     
     def _initialize_langchain_llm(self):
         """LangChain用LLMを初期化"""
+        self.llm = self._create_langchain_llm(self.model)
+        self._llms = {self.model: self.llm}
+    
+    def _get_langchain_llm(self, model: Optional[str] = None) -> Any:
+        """モデルに対応するLangChain用LLMを取得（主モデル以外は初回使用時に生成）"""
+        if model is None or model == self.model:
+            return self.llm
+        if model not in self._llms:
+            self._llms[model] = self._create_langchain_llm(model)
+        return self._llms[model]
+    
+    def _create_langchain_llm(self, model: str) -> Any:
+        """指定したモデル（Azure OpenAIではデプロイ名）のLangChain用LLMを生成"""
         if not ChatOpenAI:
             raise ImportError("LangChainライブラリが正しくインストールされていません")
             
+        # 同期呼び出しはOpenAIクライアントと同じ接続プールを使う
+        http_client = None
+        if OPENAI_AVAILABLE:
+            http_client = get_http_client(*self._client_credentials())
+        
         if self.provider == "azure" and AzureChatOpenAI:
             # Azure OpenAIを使用
-            self.llm = AzureChatOpenAI(
+            return AzureChatOpenAI(
                 azure_endpoint=self.azure_endpoint,
                 openai_api_key=self.api_key,
-                azure_deployment=self.azure_deployment,
+                azure_deployment=model,
                 openai_api_version=self.azure_api_version,
-                model_name=self.azure_deployment
+                model_name=model,
+                max_retries=0,  # リトライはexecute_llm_callで制御
+                http_client=http_client
             )
         else:
-            # 通常のOpenAIを使用
-            self.llm = ChatOpenAI(
-                model_name=self.model,
+            # 通常のOpenAI（またはモックサーバー）を使用
+            base_url_kwargs = {}
+            base_url = get_provider_base_url(self.provider)
+            if base_url:
+                base_url_kwargs["openai_api_base"] = base_url
+            
+            return ChatOpenAI(
+                model_name=model,
                 openai_api_key=self.api_key,
+                max_retries=0,  # リトライはexecute_llm_callで制御
+                http_client=http_client,
+                **base_url_kwargs
             )
     
-    def _initialize_openai_client(self):
-        """OpenAI直接クライアントを初期化"""
+    def _client_credentials(self) -> Tuple:
+        """共有クライアントの取得に使う（provider, api_key, azure_endpoint, api_version）"""
         if self.provider == "azure":
-            self.client = openai.AzureOpenAI(
-                api_key=self.api_key,
-                azure_endpoint=self.azure_endpoint,
-                api_version=self.azure_api_version
-            )
-        else:
-            self.client = openai.OpenAI(api_key=self.api_key)
+            return (self.provider, self.api_key, self.azure_endpoint, self.azure_api_version)
+        return (self.provider, self.api_key, None, None)
+    
+    def _initialize_openai_client(self):
+        """OpenAI直接クライアントを初期化（共有クライアントを使用）"""
+        self.client = get_openai_client(*self._client_credentials())
+    
+    def _llm_with_response_format(self, response_format: Optional[Dict[str, Any]], model: Optional[str] = None) -> Any:
+        """response_formatが指定された場合はLLMにバインドして返す"""
+        llm = self._get_langchain_llm(model)
+        if response_format is None:
+            return llm
+        return llm.bind(response_format=response_format)
+    
+    def _request_key(self, messages: List[Any], response_format: Optional[Dict[str, Any]],
+                     model: Optional[str] = None) -> str:
+        """同一リクエストの集約に使うキー（認証情報が異なる呼び出しは集約しない）"""
+        return make_request_key(model or self.model, messages, response_format=response_format,
+                                credentials=self._client_credentials())
+    
+    def invoke_llm(self, messages: List[Any], response_format: Optional[Dict[str, Any]] = None,
+                   model: Optional[str] = None) -> Any:
+        """
+        LangChain用LLMをレート制限付きで呼び出す
+        modelを省略した場合は主モデル。トークン数・所要時間はカスケードの段階別に集計する
+        """
+        model = model or self.model
+        llm = self._llm_with_response_format(response_format, model)
+        started_at = time.monotonic()
+        with metrics_tags(model=model):
+            response = execute_llm_call(lambda: llm.invoke(messages), messages,
+                                        coalesce_key=self._request_key(messages, response_format, model))
+        self.cascade.record(model, extract_usage(response)["total_tokens"], time.monotonic() - started_at)
+        return response
+    
+    async def ainvoke_llm(self, messages: List[Any], response_format: Optional[Dict[str, Any]] = None,
+                          model: Optional[str] = None) -> Any:
+        """LangChain用LLMをレート制限付きで非同期に呼び出す"""
+        model = model or self.model
+        llm = self._llm_with_response_format(response_format, model)
+        started_at = time.monotonic()
+        with metrics_tags(model=model):
+            response = await execute_llm_call_async(lambda: llm.ainvoke(messages), messages,
+                                                    coalesce_key=self._request_key(messages, response_format, model))
+        self.cascade.record(model, extract_usage(response)["total_tokens"], time.monotonic() - started_at)
+        return response
     
     def is_configured(self) -> bool:
         """APIキーが設定されているかを確認"""
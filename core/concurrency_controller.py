@@ -0,0 +1,236 @@
+"""
+LLM呼び出しの同時実行数の自動調整（AIMD）
+応答時間とエラー率が健全な間は同時実行数を加算的に増やし、
+429（スロットリング）や一時的なエラーが増えた場合は乗算的に減らす
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from config import get_config
+
+# 応答時間の指数移動平均の重み
+_LATENCY_EWMA_ALPHA = 0.2
+
+# エラー率の判定に必要な最小サンプル数
+_MIN_ERROR_SAMPLES = 10
+
+# 実行単位の最大同時実行数の集計に保持する上限の変更履歴の件数
+_MAX_LIMIT_CHANGES = 1000
+
+# get_statsのsinceで増分を求める累積カウンタ
+_COUNTER_KEYS = ("completed", "throttled", "errors", "increases", "decreases")
+
+
+class AdaptiveConcurrencyController:
+    """
+    全LLMサービスで共有する同時実行数の制御
+    スレッドからはacquire/release、イベントループからはacquire_async/releaseで枠を確保する
+    """
+
+    def __init__(self, initial_limit: Optional[int] = None, min_limit: Optional[int] = None,
+                 max_limit: Optional[int] = None, enabled: Optional[bool] = None):
+        concurrency_config = get_config("CONCURRENCY_CONFIG")
+
+        self.enabled = concurrency_config.get("adaptive", True) if enabled is None else enabled
+        self.min_limit = min_limit or concurrency_config.get("min_limit", 1)
+        self.max_limit = max_limit or concurrency_config.get("max_limit", 64)
+        self.increase_step = concurrency_config.get("increase_step", 1)
+        self.decrease_factor = concurrency_config.get("decrease_factor", 0.5)
+        self.decrease_cooldown = concurrency_config.get("decrease_cooldown_seconds", 2.0)
+        self.latency_tolerance = concurrency_config.get("latency_tolerance", 2.0)
+        self.error_rate_threshold = concurrency_config.get("error_rate_threshold", 0.2)
+        self.window_seconds = concurrency_config.get("window_seconds", 30)
+
+        initial_limit = initial_limit or concurrency_config.get("initial_limit", 4)
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial_limit)))
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters: deque = deque()
+        self._in_flight = 0
+        self._latency_ewma: Optional[float] = None
+        self._baseline_latency: Optional[float] = None
+        self._last_decrease_at = 0.0
+
+        self._recent: deque = deque()  # (完了時刻, 結果)
+        self._limit_changes: deque = deque(maxlen=_MAX_LIMIT_CHANGES)  # (変更時刻, 変更後の上限)
+        self._started_at = time.monotonic()
+        self._stats = self._empty_stats()
+
+    def _empty_stats(self) -> Dict[str, Any]:
+        return {
+            "completed": 0,
+            "throttled": 0,
+            "errors": 0,
+            "increases": 0,
+            "decreases": 0,
+            "peak_limit": self.limit
+        }
+
+    @property
+    def limit(self) -> int:
+        """現在の同時実行数の上限"""
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self):
+        """同時実行の枠が空くまで待機（スレッド用）"""
+        with self._condition:
+            while self.enabled and self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    async def acquire_async(self):
+        """acquireの非同期版（イベントループをブロックしない）"""
+        with self._lock:
+            if not self.enabled or (self._in_flight < self.limit and not self._async_waiters):
+                self._in_flight += 1
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._async_waiters.append((loop, future))
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, future) in self._async_waiters:
+                    self._async_waiters.remove((loop, future))
+                    raise
+            # 枠の割り当て後にキャンセルされた場合は返却する
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """同時実行の枠を返却"""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._wake()
+
+    def _grant(self, future: asyncio.Future):
+        """待機中のコルーチンに枠を渡す（待機側のイベントループ上で実行）"""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def _wake(self):
+        """空いた枠を待機中の呼び出しに割り当てる（ロック取得中に呼び出す）"""
+        while self._async_waiters and (not self.enabled or self._in_flight < self.limit):
+            loop, future = self._async_waiters.popleft()
+            self._in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:
+                # イベントループが終了済み
+                self._in_flight -= 1
+        self._condition.notify_all()
+
+    def record(self, latency: float, outcome: str):
+        """
+        1回の呼び出し結果を反映して同時実行数を調整
+
+        Args:
+            latency: 応答時間（秒）
+            outcome: "success" / "throttled"（429） / "error"（一時的なエラー）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._recent.append((now, outcome))
+            while self._recent and now - self._recent[0][0] > self.window_seconds:
+                self._recent.popleft()
+
+            if outcome == "throttled":
+                self._stats["throttled"] += 1
+                self._decrease(now)
+            elif outcome == "error":
+                self._stats["errors"] += 1
+                failures = sum(1 for _, recent_outcome in self._recent if recent_outcome != "success")
+                if len(self._recent) >= _MIN_ERROR_SAMPLES and failures / len(self._recent) > self.error_rate_threshold:
+                    self._decrease(now)
+            else:
+                self._stats["completed"] += 1
+                if self._latency_ewma is None:
+                    self._latency_ewma = latency
+                else:
+                    self._latency_ewma += _LATENCY_EWMA_ALPHA * (latency - self._latency_ewma)
+                if self._baseline_latency is None or self._latency_ewma < self._baseline_latency:
+                    self._baseline_latency = self._latency_ewma
+
+                # 枠を使い切っていて応答時間が基準内の場合のみ増やす（1往復あたり約increase_step）
+                healthy = self._latency_ewma <= self._baseline_latency * self.latency_tolerance
+                if self.enabled and healthy and self._in_flight >= self.limit and self._limit < self.max_limit:
+                    previous_limit = self.limit
+                    self._limit = min(float(self.max_limit), self._limit + self.increase_step / self._limit)
+                    if self.limit > previous_limit:
+                        self._limit_changes.append((now, self.limit))
+                        self._stats["increases"] += 1
+                        self._stats["peak_limit"] = max(self._stats["peak_limit"], self.limit)
+
+            self._wake()
+
+    def _decrease(self, now: float):
+        """同時実行数を乗算的に減らす（連続したエラーで下げすぎないようクールダウンを設ける）"""
+        if not self.enabled or now - self._last_decrease_at < self.decrease_cooldown:
+            return
+        self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+        self._limit_changes.append((now, self.limit))
+        self._last_decrease_at = now
+        self._stats["decreases"] += 1
+
+    def reset_stats(self):
+        """統計情報をリセット（学習済みの同時実行数は維持）"""
+        with self._lock:
+            self._recent.clear()
+            self._started_at = time.monotonic()
+            self._stats = self._empty_stats()
+
+    def get_stats(self, since: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        統計情報を取得
+
+        Args:
+            since: 実行開始時に取得した統計。指定するとそれ以降の増分を返す
+                   （プロセス全体で共有する統計をリセットせずに実行単位で集計する）
+        """
+        with self._lock:
+            now = time.monotonic()
+            started_at = max(self._started_at, since["as_of"]) if since else self._started_at
+            window = min(self.window_seconds, max(now - started_at, 1e-6))
+            recent_successes = sum(1 for completed_at, outcome in self._recent
+                                   if outcome == "success" and now - completed_at <= window)
+            stats = dict(self._stats)
+            if since:
+                for key in _COUNTER_KEYS:
+                    stats[key] -= since.get(key, 0)
+                stats["peak_limit"] = max([since["limit"], self.limit] + [
+                    limit for changed_at, limit in self._limit_changes if changed_at > since["as_of"]
+                ])
+            stats.update({
+                "enabled": self.enabled,
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "throughput_per_second": recent_successes / window,
+                "latency_ewma": self._latency_ewma,
+                "as_of": now
+            })
+        return stats
+
+
+_shared_controller: Optional[AdaptiveConcurrencyController] = None
+_shared_controller_lock = threading.Lock()
+
+
+def get_concurrency_controller() -> AdaptiveConcurrencyController:
+    """プロセス全体で共有する同時実行数の制御を取得"""
+    global _shared_controller
+    if _shared_controller is None:
+        with _shared_controller_lock:
+            if _shared_controller is None:
+                _shared_controller = AdaptiveConcurrencyController()
+    return _shared_controller
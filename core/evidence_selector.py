@@ -0,0 +1,214 @@
+"""
+証跡データの関連箇所の選択
+ドキュメントをページ・シート・段落単位の区画に分割し、指示と出力列の説明を検索語として
+BM25（文字バイグラム）でローカルに採点して、データごとのトークン予算内に収まる区画を選ぶ
+"""
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import get_config
+from .tokenizer import estimate_tokens
+
+# 抽出処理が出力する区切り行（"--- ページ 1 ---" / "--- シート: 売上 ---"）
+_SECTION_MARKER = re.compile(r"^--- .+ ---$", re.MULTILINE)
+
+# 英数字の語（金額の桁区切りは除去してから分割）
+_WORD_PATTERN = re.compile(r"[0-9a-z]+")
+
+# 日本語（ひらがな・カタカナ・漢字）の連続部分
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+")
+
+# 選択した区画の間を省略したことを示す文字列
+_OMISSION_MARK = "[...中略...]"
+
+
+def tokenize_for_search(text: str) -> List[str]:
+    """
+    検索用に語へ分割
+    英数字は語単位、日本語は形態素解析を使わず文字バイグラムに分割する
+    """
+    if not text:
+        return []
+
+    normalized = text.lower().replace(",", "")
+    terms = _WORD_PATTERN.findall(normalized)
+    for run in _CJK_PATTERN.findall(normalized):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def build_query_terms(instruction: str, output_format: Optional[Dict[str, Any]] = None) -> Tuple[str, ...]:
+    """
+    指示と出力列の定義（見出し・説明）から検索語を作成
+
+    Returns:
+        重複を除いた検索語（出現順）
+    """
+    texts = [instruction or ""]
+    for col_def in (output_format or {}).get("column_definitions", {}).values():
+        texts.append(col_def.get("header", ""))
+        texts.append(col_def.get("description", ""))
+
+    return tuple(dict.fromkeys(term for text in texts for term in tokenize_for_search(text)))
+
+
+def split_into_chunks(content: str, max_chars: int) -> List[Dict[str, str]]:
+    """
+    ドキュメントの内容を区画に分割
+    ページ・シートの区切り行で分け、長い区画は行単位でmax_chars以内にまとめ直す
+
+    Returns:
+        区画のリスト（label: 区切り行、text: 本文）
+    """
+    sections = []
+    positions = [match.start() for match in _SECTION_MARKER.finditer(content)]
+    if not positions or positions[0] > 0:
+        positions.insert(0, 0)
+    positions.append(len(content))
+
+    for start, end in zip(positions, positions[1:]):
+        section = content[start:end].strip("\n")
+        if not section.strip():
+            continue
+        label = ""
+        first_line, _, body = section.partition("\n")
+        if _SECTION_MARKER.match(first_line):
+            label, section = first_line, body
+        sections.append((label, section))
+
+    chunks = []
+    for label, section in sections:
+        current: List[str] = []
+        current_length = 0
+        for line in section.split("\n"):
+            # 1行がmax_charsを超える場合は文字数で分割
+            pieces = [line[i:i + max_chars] for i in range(0, len(line), max_chars)] or [""]
+            for piece in pieces:
+                if current and current_length + len(piece) + 1 > max_chars:
+                    chunks.append({"label": label, "text": "\n".join(current)})
+                    current, current_length = [], 0
+                current.append(piece)
+                current_length += len(piece) + 1
+        if current and "".join(current).strip():
+            chunks.append({"label": label, "text": "\n".join(current)})
+
+    return chunks
+
+
+def bm25_scores(query_terms: Iterable[str], documents: List[List[str]],
+                k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """
+    検索語に対する各区画のBM25スコアを算出
+
+    Args:
+        query_terms: 検索語
+        documents: 区画ごとの語のリスト
+        k1: 語の出現頻度の飽和パラメーター
+        b: 区画の長さによる正規化の強さ
+
+    Returns:
+        区画ごとのスコア
+    """
+    if not documents:
+        return []
+
+    term_counts = [Counter(terms) for terms in documents]
+    average_length = sum(len(terms) for terms in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for counts in term_counts for term in counts)
+
+    scores = []
+    for terms, counts in zip(documents, term_counts):
+        length_norm = k1 * (1 - b + b * len(terms) / average_length)
+        score = 0.0
+        for term in set(query_terms):
+            frequency = counts.get(term, 0)
+            if not frequency:
+                continue
+            df = document_frequency[term]
+            idf = math.log((len(documents) - df + 0.5) / (df + 0.5) + 1)
+            score += idf * frequency * (k1 + 1) / (frequency + length_norm)
+        scores.append(score)
+    return scores
+
+
+class EvidenceSelector:
+    """
+    データ1件分のドキュメントから、トークン予算内で関連度の高い区画を選択する
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, chunk_chars: Optional[int] = None):
+        selection_config = get_config("EVIDENCE_SELECTION_CONFIG")
+
+        self.enabled = selection_config.get("enabled", True)
+        self.token_budget = token_budget or selection_config.get("token_budget_per_item", 12000)
+        self.chunk_chars = chunk_chars or selection_config.get("chunk_chars", 1500)
+        self.k1 = selection_config.get("bm25_k1", 1.5)
+        self.b = selection_config.get("bm25_b", 0.75)
+        self.include_first_chunk = selection_config.get("always_include_first_chunk", True)
+
+    def select(self, documents: Dict[str, str], query_terms: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        ドキュメントごとに送信する内容を選択
+
+        Args:
+            documents: ドキュメント名と内容
+            query_terms: 検索語（build_query_termsの結果）
+
+        Returns:
+            ドキュメント名ごとの選択結果
+            （content: 送信する内容、truncated: 抜粋か、selected_chunks / total_chunks: 区画数）
+        """
+        total_tokens = sum(estimate_tokens(content) for content in documents.values())
+        if not self.enabled or total_tokens <= self.token_budget:
+            return {name: {"content": content, "truncated": False} for name, content in documents.items()}
+
+        chunks = []  # (ドキュメント名, 区画番号, 区画)
+        for name, content in documents.items():
+            for index, chunk in enumerate(split_into_chunks(content, self.chunk_chars)):
+                chunks.append((name, index, chunk))
+
+        chunk_texts = [f"{chunk['label']}\n{chunk['text']}" if chunk["label"] else chunk["text"]
+                       for _, _, chunk in chunks]
+        chunk_tokens = [estimate_tokens(text) for text in chunk_texts]
+        scores = bm25_scores(query_terms, [tokenize_for_search(text) for text in chunk_texts], self.k1, self.b)
+
+        # 各ドキュメントの先頭区画（請求者・日付等の見出し情報）を優先し、残りはスコア順
+        order = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+        if self.include_first_chunk:
+            order = [i for i in order if chunks[i][1] == 0] + [i for i in order if chunks[i][1] != 0]
+
+        remaining = self.token_budget
+        selected = set()
+        for i in order:
+            if chunk_tokens[i] <= remaining:
+                selected.add(i)
+                remaining -= chunk_tokens[i]
+
+        result = {}
+        for name in documents:
+            indices = [i for i in range(len(chunks)) if chunks[i][0] == name]
+            parts = []
+            previous_index = -1
+            for i in indices:
+                if i not in selected:
+                    continue
+                if chunks[i][1] != previous_index + 1:
+                    parts.append(_OMISSION_MARK)
+                parts.append(chunk_texts[i])
+                previous_index = chunks[i][1]
+            if parts and previous_index != len(indices) - 1:
+                parts.append(_OMISSION_MARK)
+
+            selected_count = sum(1 for i in indices if i in selected)
+            result[name] = {
+                "content": "\n".join(parts),
+                "truncated": selected_count != len(indices),
+                "selected_chunks": selected_count,
+                "total_chunks": len(indices)
+            }
+        return result
@@ -0,0 +1,515 @@
+"""
+ドキュメントのテキスト抽出処理の共通レジストリ
+拡張子・MIMEタイプごとに抽出バックエンドを優先順に登録し、利用可能なものから順に試す
+（タイムアウト・失敗・空の結果の場合は次のバックエンドにフォールバック）
+FileProcessor・FolderProcessor・RuleSuggesterで共有し、同じドキュメントは画面によらず同じテキストになる
+
+バックエンドごとの処理時間を記録し、selection が "fastest" の場合は十分な計測がある
+バックエンドを処理速度（MB/秒）の速い順に試す
+
+ページ数の多いPDFはページ範囲に分割して複数プロセスで並列に抽出し、ページ順に結合する
+（page_parallel_threshold以上のページ数の場合。プロセスプールのワーカー内では分割しない）
+"""
+import concurrent.futures
+import io
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import get_config
+from .text_cache import get_text_cache
+
+# PDF処理ライブラリ
+try:
+    import fitz  # PyMuPDF
+    FITZ_AVAILABLE = True
+except ImportError:
+    FITZ_AVAILABLE = False
+
+try:
+    import PyPDF2
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+# Wordファイル処理用
+try:
+    from docx import Document
+    DOCX_AVAILABLE = True
+except ImportError:
+    DOCX_AVAILABLE = False
+
+# Excelファイル処理用
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except ImportError:
+    PANDAS_AVAILABLE = False
+
+# 抽出結果の形式のバージョン（出力形式を変更した場合は上げる。抽出テキストキャッシュのキーに含まれる）
+EXTRACTORS_VERSION = "1"
+
+
+class ExtractionError(Exception):
+    """利用可能なすべてのバックエンドで抽出に失敗した場合のエラー"""
+
+    def __init__(self, message: str, attempts: Optional[List[Tuple[str, int, float, str]]] = None):
+        super().__init__(message)
+        # 試したバックエンドごとの (名前, バイト数, 秒数, 結果)（ExtractionResult.attemptsと同じ形式）
+        self.attempts = attempts or []
+
+
+@dataclass(frozen=True)
+class ExtractorBackend:
+    """抽出バックエンド（extractは失敗時に例外、抽出できない場合は空文字列を返す）"""
+    name: str
+    extensions: Tuple[str, ...]
+    extract: Callable[[bytes, str], str]
+    available: bool = True
+    mime_types: Tuple[str, ...] = ()
+    rank: int = 0
+    # ページ単位で抽出できるバックエンド（ページ数の取得とページ範囲の抽出）
+    count_pages: Optional[Callable[[bytes], int]] = None
+    extract_pages: Optional[Callable[[bytes, int, int], List[str]]] = None
+
+
+@dataclass
+class ExtractionResult:
+    """抽出結果"""
+    text: str
+    backend: str
+    seconds: float
+    fallbacks: List[str] = field(default_factory=list)
+    # 試したバックエンドごとの (名前, バイト数, 秒数, 結果)。別プロセスで抽出した場合に
+    # 親プロセスのレジストリへ統計を反映するために使う（record_attempts）
+    attempts: List[Tuple[str, int, float, str]] = field(default_factory=list)
+
+
+def format_pages(pages: List[str]) -> str:
+    """ページごとのテキストを区切り付きで結合（空のページは省略）"""
+    text_content = []
+    for page_num, page_text in enumerate(pages):
+        if page_text and page_text.strip():
+            text_content.append(f"--- ページ {page_num + 1} ---")
+            text_content.append(page_text)
+    return "\n".join(text_content)
+
+
+def _count_pages_with_pymupdf(file_content: bytes) -> int:
+    """PyMuPDFでPDFのページ数を取得"""
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        return pdf_document.page_count
+
+
+def _extract_pages_with_pymupdf(file_content: bytes, start: int, end: int) -> List[str]:
+    """PyMuPDFでPDFのページ範囲 [start, end) のテキストを抽出"""
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        end = min(end, pdf_document.page_count)
+        return [pdf_document.load_page(page_num).get_text() for page_num in range(start, end)]
+
+
+def _extract_pdf_with_pymupdf(file_content: bytes, file_name: str) -> str:
+    """PyMuPDFでPDFからテキストを抽出"""
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        return format_pages([pdf_document.load_page(page_num).get_text()
+                             for page_num in range(pdf_document.page_count)])
+
+
+def _count_pages_with_pypdf2(file_content: bytes) -> int:
+    """PyPDF2でPDFのページ数を取得"""
+    return len(PyPDF2.PdfReader(io.BytesIO(file_content)).pages)
+
+
+def _extract_pages_with_pypdf2(file_content: bytes, start: int, end: int) -> List[str]:
+    """PyPDF2でPDFのページ範囲 [start, end) のテキストを抽出"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+    end = min(end, len(pdf_reader.pages))
+    return [pdf_reader.pages[page_num].extract_text() for page_num in range(start, end)]
+
+
+def _extract_pdf_with_pypdf2(file_content: bytes, file_name: str) -> str:
+    """PyPDF2でPDFからテキストを抽出"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+    return format_pages([page.extract_text() for page in pdf_reader.pages])
+
+
+def _extract_excel_with_pandas(file_content: bytes, file_name: str) -> str:
+    """pandasでExcelファイルの全シートからテキストを抽出"""
+    excel_data = pd.read_excel(io.BytesIO(file_content), sheet_name=None)
+
+    text_content = []
+    for sheet_name, df in excel_data.items():
+        text_content.append(f"--- シート: {sheet_name} ---")
+        text_content.append(df.to_string(index=False, na_rep=''))
+        text_content.append("")
+    return "\n".join(text_content)
+
+
+def _extract_docx_with_python_docx(file_content: bytes, file_name: str) -> str:
+    """python-docxでWord文書の段落とテーブルからテキストを抽出"""
+    document = Document(io.BytesIO(file_content))
+
+    text_content = [paragraph.text for paragraph in document.paragraphs if paragraph.text.strip()]
+    for table in document.tables:
+        text_content.append("\n--- テーブル ---")
+        for row in table.rows:
+            text_content.append(" | ".join(cell.text.strip() for cell in row.cells))
+    return "\n".join(text_content)
+
+
+def _extract_plain_text(file_content: bytes, file_name: str) -> str:
+    """テキストファイルをデコード（UTF-8、失敗時はShift_JIS）"""
+    try:
+        return file_content.decode("utf-8")
+    except UnicodeDecodeError:
+        return file_content.decode("shift-jis")
+
+
+DEFAULT_BACKENDS = [
+    ExtractorBackend("pymupdf", (".pdf",), _extract_pdf_with_pymupdf, FITZ_AVAILABLE,
+                     ("application/pdf",), rank=0,
+                     count_pages=_count_pages_with_pymupdf, extract_pages=_extract_pages_with_pymupdf),
+    ExtractorBackend("pypdf2", (".pdf",), _extract_pdf_with_pypdf2, PDF_AVAILABLE,
+                     ("application/pdf",), rank=1,
+                     count_pages=_count_pages_with_pypdf2, extract_pages=_extract_pages_with_pypdf2),
+    ExtractorBackend("pandas", (".xlsx", ".xls"), _extract_excel_with_pandas, PANDAS_AVAILABLE,
+                     ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                      "application/vnd.ms-excel"), rank=0),
+    ExtractorBackend("python-docx", (".docx",), _extract_docx_with_python_docx, DOCX_AVAILABLE,
+                     ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",), rank=0),
+    ExtractorBackend("plain-text", (".txt", ".md"), _extract_plain_text, True,
+                     ("text/plain", "text/markdown"), rank=0),
+]
+
+
+class ExtractorRegistry:
+    """拡張子・MIMEタイプごとの抽出バックエンドの登録と選択"""
+
+    def __init__(self, selection: Optional[str] = None, timeout_seconds: Optional[float] = None):
+        extractor_config = get_config("EXTRACTOR_CONFIG")
+
+        self.selection = selection or extractor_config.get("selection", "rank")
+        self.timeout_seconds = timeout_seconds if timeout_seconds is not None else extractor_config.get("timeout_seconds", 120)
+        self.min_benchmark_samples = extractor_config.get("min_benchmark_samples", 5)
+        self.backend_order: Dict[str, List[str]] = extractor_config.get("backend_order", {})
+        self.page_parallel_threshold = extractor_config.get("page_parallel_threshold", 100)
+        self.page_parallel_workers = extractor_config.get("page_parallel_workers", 0) or \
+            get_config("EXTRACTION_CONFIG").get("max_workers", 0)
+        self.min_pages_per_range = max(1, extractor_config.get("min_pages_per_range", 25))
+
+        self._lock = threading.Lock()
+        # ページ分割での抽出に使うプロセスプール（初回に作成し、ファイルをまたいで再利用する）
+        self._page_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._page_pool_lock = threading.Lock()
+        self._backends: List[ExtractorBackend] = []
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, backend: ExtractorBackend):
+        """バックエンドを登録（同名のバックエンドは置き換える）"""
+        with self._lock:
+            self._backends = [registered for registered in self._backends if registered.name != backend.name]
+            self._backends.append(backend)
+
+    def get_backend(self, name: str) -> Optional[ExtractorBackend]:
+        """名前でバックエンドを取得"""
+        with self._lock:
+            return next((backend for backend in self._backends if backend.name == name), None)
+
+    def _throughput(self, backend_name: str) -> Optional[float]:
+        """計測した処理速度（MB/秒、計測が足りない場合はNone）"""
+        stats = self._stats.get(backend_name)
+        if not stats or stats["successes"] < self.min_benchmark_samples or stats["seconds"] <= 0:
+            return None
+        return stats["bytes"] / 1024 / 1024 / stats["seconds"]
+
+    def backends_for(self, file_name: str, mime_type: Optional[str] = None) -> List[ExtractorBackend]:
+        """
+        ファイルに対応する利用可能なバックエンドを試す順に取得
+
+        優先順位: 設定のbackend_order → selectionが"fastest"の場合は計測した処理速度 → 登録時のrank
+        """
+        extension = Path(file_name).suffix.lower()
+        with self._lock:
+            candidates = [
+                backend for backend in self._backends
+                if backend.available and (extension in backend.extensions or (mime_type and mime_type in backend.mime_types))
+            ]
+
+            order = self.backend_order.get(extension, [])
+
+            def sort_key(backend: ExtractorBackend):
+                configured = order.index(backend.name) if backend.name in order else len(order)
+                throughput = self._throughput(backend.name) if self.selection == "fastest" else None
+                return configured, -(throughput or 0.0), backend.rank
+
+            return sorted(candidates, key=sort_key)
+
+    def is_supported(self, file_name: str, mime_type: Optional[str] = None) -> bool:
+        """利用可能なバックエンドがあるか"""
+        return bool(self.backends_for(file_name, mime_type))
+
+    def version_for(self, file_name: str, mime_type: Optional[str] = None) -> str:
+        """抽出テキストキャッシュに記録するバージョン（出力形式と最優先のバックエンド）"""
+        backends = self.backends_for(file_name, mime_type)
+        return f"{EXTRACTORS_VERSION}:{backends[0].name if backends else 'none'}"
+
+    def _run_with_timeout(self, backend: ExtractorBackend, file_content: bytes, file_name: str) -> str:
+        """タイムアウト付きでバックエンドを実行（タイムアウトした処理はバックグラウンドで破棄）"""
+        if not self.timeout_seconds:
+            return backend.extract(file_content, file_name)
+
+        outcome: Dict[str, Any] = {}
+
+        def target():
+            try:
+                outcome["text"] = backend.extract(file_content, file_name)
+            except Exception as e:
+                outcome["error"] = e
+
+        worker = threading.Thread(target=target, name=f"extractor-{backend.name}", daemon=True)
+        worker.start()
+        worker.join(self.timeout_seconds)
+        if worker.is_alive():
+            raise TimeoutError(f"{self.timeout_seconds}秒以内に抽出が完了しませんでした")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["text"]
+
+    def page_ranges(self, backend: ExtractorBackend, file_content: bytes,
+                    workers: Optional[int] = None) -> Optional[List[Tuple[int, int]]]:
+        """
+        ページ分割して並列に抽出する場合のページ範囲（[開始, 終了) のリスト）
+
+        Args:
+            workers: 分割数の上限（省略時は設定のpage_parallel_workers、0はCPUコア数）
+
+        Returns:
+            ページ単位で抽出できない、ページ数がしきい値未満、または分割数が1の場合はNone
+        """
+        if not backend.count_pages or not backend.extract_pages or self.page_parallel_threshold <= 0:
+            return None
+        try:
+            page_count = backend.count_pages(file_content)
+        except Exception:
+            # 開けないファイルは通常の抽出でエラー・フォールバックを扱う
+            return None
+        if page_count < self.page_parallel_threshold:
+            return None
+
+        workers = workers or self.page_parallel_limit()
+        parts = min(workers, math.ceil(page_count / self.min_pages_per_range))
+        if parts < 2:
+            return None
+        pages_per_range = math.ceil(page_count / parts)
+        return [(start, min(start + pages_per_range, page_count)) for start in range(0, page_count, pages_per_range)]
+
+    def page_parallel_limit(self) -> int:
+        """ページ分割での抽出に使うプロセス数（設定値、未設定の場合はCPUコア数。CPUコア数を上限とする）"""
+        cpu_count = os.cpu_count() or 1
+        return max(1, min(self.page_parallel_workers or cpu_count, cpu_count))
+
+    def _get_page_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        """ページ分割での抽出に使うプロセスプール（初回のみ作成）"""
+        with self._page_pool_lock:
+            if self._page_pool is None:
+                self._page_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.page_parallel_limit())
+            return self._page_pool
+
+    def _discard_page_pool(self, executor: concurrent.futures.ProcessPoolExecutor):
+        """壊れた・処理が戻らないプロセスプールを破棄（次回の抽出で作り直す）"""
+        with self._page_pool_lock:
+            if self._page_pool is executor:
+                self._page_pool = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _extract_pages_in_parallel(self, backend: ExtractorBackend, file_content: bytes, file_name: str,
+                                   page_ranges: List[Tuple[int, int]]) -> str:
+        """ページ範囲ごとに共有のプロセスプールで抽出してページ順に結合（プールが使えない場合は一括で抽出）"""
+        executor = None
+        try:
+            executor = self._get_page_pool()
+            futures = [executor.submit(extract_page_range, backend.name, file_content, start, end)
+                       for start, end in page_ranges]
+            deadline = time.monotonic() + self.timeout_seconds if self.timeout_seconds else None
+            pages: List[str] = []
+            for future in futures:
+                timeout = max(0.0, deadline - time.monotonic()) if deadline else None
+                pages.extend(future.result(timeout=timeout))
+            return format_pages(pages)
+        except concurrent.futures.TimeoutError:
+            self._discard_page_pool(executor)
+            raise TimeoutError(f"{self.timeout_seconds}秒以内に抽出が完了しませんでした")
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            if executor is not None:
+                self._discard_page_pool(executor)
+            print(f"ページ分割での抽出に失敗したため一括で抽出します: {str(e)}")
+            return self._run_with_timeout(backend, file_content, file_name)
+
+    def _run_backend(self, backend: ExtractorBackend, file_content: bytes, file_name: str) -> str:
+        """バックエンドを実行（ページ数の多いPDFはページ分割して並列に抽出）"""
+        if multiprocessing.parent_process() is None:
+            page_ranges = self.page_ranges(backend, file_content)
+            if page_ranges:
+                return self._extract_pages_in_parallel(backend, file_content, file_name, page_ranges)
+        return self._run_with_timeout(backend, file_content, file_name)
+
+    def record_attempts(self, attempts: List[Tuple[str, int, float, str]]):
+        """別プロセス（プロセスプールのワーカー）で計測した抽出の結果を統計に反映"""
+        for attempt in attempts:
+            self._record(*attempt)
+
+    def _record(self, backend_name: str, size: int, seconds: float, outcome: str):
+        with self._lock:
+            stats = self._stats.setdefault(backend_name, {
+                "successes": 0, "empty": 0, "failures": 0, "timeouts": 0, "bytes": 0, "seconds": 0.0
+            })
+            stats[outcome] += 1
+            if outcome == "successes":
+                stats["bytes"] += size
+                stats["seconds"] += seconds
+
+    def extract(self, file_content: bytes, file_name: str, mime_type: Optional[str] = None) -> ExtractionResult:
+        """
+        優先順にバックエンドを試してテキストを抽出
+
+        Returns:
+            ExtractionResult（すべてのバックエンドが空の結果を返した場合は空文字列）
+
+        Raises:
+            ExtractionError: 対応するバックエンドがない、またはすべて失敗・タイムアウトした場合
+        """
+        backends = self.backends_for(file_name, mime_type)
+        if not backends:
+            raise ExtractionError(f"サポートされていないファイル形式です: {Path(file_name).suffix.lower() or mime_type}")
+
+        started = time.perf_counter()
+        errors = []
+        attempts: List[Tuple[str, int, float, str]] = []
+        empty_backend = None
+
+        def record(backend_name: str, backend_started: float, outcome: str):
+            attempt = (backend_name, len(file_content), time.perf_counter() - backend_started, outcome)
+            attempts.append(attempt)
+            self._record(*attempt)
+
+        for backend in backends:
+            backend_started = time.perf_counter()
+            try:
+                text = self._run_backend(backend, file_content, file_name)
+            except TimeoutError as e:
+                record(backend.name, backend_started, "timeouts")
+                errors.append(f"{backend.name}: {str(e)}")
+                continue
+            except Exception as e:
+                record(backend.name, backend_started, "failures")
+                errors.append(f"{backend.name}: {str(e)}")
+                continue
+
+            if not text or not text.strip():
+                # 空の結果は他のバックエンドで抽出できる可能性がある
+                record(backend.name, backend_started, "empty")
+                empty_backend = empty_backend or backend.name
+                continue
+
+            record(backend.name, backend_started, "successes")
+            return ExtractionResult(text, backend.name, time.perf_counter() - started, errors, attempts)
+
+        if empty_backend:
+            return ExtractionResult("", empty_backend, time.perf_counter() - started, errors, attempts)
+        raise ExtractionError("抽出に失敗しました（" + " / ".join(errors) + "）", attempts)
+
+    def benchmark(self, samples: Dict[str, bytes]) -> Dict[str, Dict[str, Any]]:
+        """
+        サンプルのドキュメントを対応するすべてのバックエンドで抽出して処理時間を計測
+        計測結果は統計に加算され、selectionが"fastest"の場合のバックエンドの順序に反映される
+
+        Args:
+            samples: {ファイル名: ファイル内容}
+
+        Returns:
+            get_statsと同じ形式のバックエンドごとの統計
+        """
+        for file_name, file_content in samples.items():
+            for backend in self.backends_for(file_name):
+                backend_started = time.perf_counter()
+                try:
+                    text = self._run_with_timeout(backend, file_content, file_name)
+                    outcome = "successes" if text and text.strip() else "empty"
+                except TimeoutError:
+                    outcome = "timeouts"
+                except Exception:
+                    outcome = "failures"
+                self._record(backend.name, len(file_content), time.perf_counter() - backend_started, outcome)
+        return self.get_stats()
+
+    def reset_stats(self):
+        """統計情報をリセット"""
+        with self._lock:
+            self._stats = {}
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """バックエンドごとの統計（件数・処理速度）を取得"""
+        with self._lock:
+            stats = {name: dict(backend_stats) for name, backend_stats in self._stats.items()}
+        for name, backend_stats in stats.items():
+            backend_stats["throughput_mb_per_second"] = (
+                backend_stats["bytes"] / 1024 / 1024 / backend_stats["seconds"] if backend_stats["seconds"] > 0 else 0.0
+            )
+        return stats
+
+
+def extract_page_range(backend_name: str, file_content: bytes, start: int, end: int) -> List[str]:
+    """
+    共通レジストリのバックエンドでページ範囲 [start, end) のテキストを抽出
+    （プロセスプールのワーカーで実行するpickle可能なモジュール関数）
+
+    Raises:
+        ExtractionError: バックエンドが登録されていない、またはページ単位で抽出できない場合
+    """
+    backend = get_extractor_registry().get_backend(backend_name)
+    if backend is None or not backend.extract_pages:
+        raise ExtractionError(f"ページ単位で抽出できないバックエンドです: {backend_name}")
+    return backend.extract_pages(file_content, start, end)
+
+
+def text_cache_key(file_name: str, mime_type: Optional[str] = None) -> Tuple[str, str]:
+    """抽出テキストキャッシュの抽出処理名とバージョン（どのモジュールから抽出しても同じキー）"""
+    extension = Path(file_name).suffix.lower() or mime_type or ""
+    return f"extractors{extension}", get_extractor_registry().version_for(file_name, mime_type)
+
+
+def extract_text(file_content: bytes, file_name: str, mime_type: Optional[str] = None) -> str:
+    """
+    抽出テキストキャッシュを経由して共通レジストリでテキストを抽出
+
+    Raises:
+        ExtractionError: 対応するバックエンドがない、またはすべて失敗した場合（キャッシュされない）
+    """
+    extractor, version = text_cache_key(file_name, mime_type)
+    return get_text_cache().get_or_extract(
+        file_content, extractor, version,
+        lambda: get_extractor_registry().extract(file_content, file_name, mime_type).text
+    )
+
+
+_shared_registry: Optional[ExtractorRegistry] = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_extractor_registry() -> ExtractorRegistry:
+    """プロセス全体で共有する抽出レジストリ（標準のバックエンドを登録済み）を取得"""
+    global _shared_registry
+    if _shared_registry is None:
+        with _shared_registry_lock:
+            if _shared_registry is None:
+                registry = ExtractorRegistry()
+                for backend in DEFAULT_BACKENDS:
+                    registry.register(backend)
+                _shared_registry = registry
+    return _shared_registry
@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import Dict, List, Any, Optional
 import pandas as pd
 from datetime import datetime
+from .extractors import ExtractionError, extract_text, get_extractor_registry
 
 # PDFファイル処理用
 try:
@@ -23,13 +24,8 @@ class FileProcessor:
     """ファイル処理機能を提供するクラス"""
     
     def __init__(self):
-        self.supported_types = {
-            'application/pdf': self._process_pdf,
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': self._process_excel,
-            'application/vnd.ms-excel': self._process_excel,
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document': self._process_docx,
-            'application/msword': self._process_doc,
-        }
+        # テキスト抽出は共通レジストリ（拡張子・MIMEタイプごとのバックエンド）を使用
+        self.extractors = get_extractor_registry()
     
     def process_files(self, uploaded_files) -> Dict[str, Dict[str, Any]]:
         """
@@ -69,21 +65,17 @@ class FileProcessor:
         file_content = file.read()
         file.seek(0)  # ファイルポインタをリセット
         
-        # ファイルタイプに応じて処理
-        if file_type in self.supported_types:
-            processor = self.supported_types[file_type]
-            content = processor(file_content, file_name)
+        # 拡張子・MIMEタイプに応じたバックエンドで抽出（同じ内容のファイルは抽出テキストキャッシュから取得）
+        extension = Path(file_name).suffix.lower()
+        if file_type == 'application/msword' or extension == '.doc':
+            content = self._process_doc(file_content, file_name)
+        elif self.extractors.is_supported(file_name, file_type):
+            try:
+                content = extract_text(file_content, file_name, file_type) or "テキストを抽出できませんでした（空のドキュメント）"
+            except ExtractionError as e:
+                content = f"テキスト抽出エラー: {str(e)}"
         else:
-            # サポートされていないファイルタイプの場合、拡張子で判定
-            extension = Path(file_name).suffix.lower()
-            if extension == '.pdf':
-                content = self._process_pdf(file_content, file_name)
-            elif extension in ['.xlsx', '.xls']:
-                content = self._process_excel_by_extension(file_content, file_name, extension)
-            elif extension == '.docx':
-                content = self._process_docx(file_content, file_name)
-            else:
-                content = f"サポートされていないファイル形式: {file_type} ({extension})"
+            content = f"サポートされていないファイル形式: {file_type} ({extension})"
         
         return {
             "file_name": file_name,
@@ -96,109 +88,6 @@ class FileProcessor:
             }
         }
     
-    def _process_pdf(self, file_content: bytes, file_name: str) -> str:
-        """PDFファイルを処理"""
-        if not PDF_AVAILABLE:
-            return "PDFファイルの処理にはPyPDF2が必要です"
-        
-        try:
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text_content = []
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text_content.append(f"--- ページ {page_num + 1} ---")
-                    text_content.append(page_text)
-            
-            if not text_content:
-                return "PDFからテキストを抽出できませんでした"
-            
-            return "\n".join(text_content)
-            
-        except Exception as e:
-            return f"PDF処理エラー: {str(e)}"
-    
-    def _process_excel(self, file_content: bytes, file_name: str) -> str:
-        """Excelファイルを処理"""
-        try:
-            excel_file = io.BytesIO(file_content)
-            
-            # すべてのシートを読み込み
-            excel_data = pd.read_excel(excel_file, sheet_name=None)
-            
-            text_content = []
-            for sheet_name, df in excel_data.items():
-                text_content.append(f"--- シート: {sheet_name} ---")
-                
-                # データフレームを文字列に変換
-                df_string = df.to_string(index=False, na_rep='')
-                text_content.append(df_string)
-                text_content.append("")
-            
-            return "\n".join(text_content)
-            
-        except Exception as e:
-            return f"Excel処理エラー: {str(e)}"
-    
-    def _process_excel_by_extension(self, file_content: bytes, file_name: str, extension: str) -> str:
-        """拡張子に基づいてExcelファイルを処理"""
-        try:
-            excel_file = io.BytesIO(file_content)
-            
-            if extension == '.xlsx':
-                engine = 'openpyxl'
-            else:  # .xls
-                engine = 'xlrd'
-            
-            excel_data = pd.read_excel(excel_file, sheet_name=None, engine=engine)
-            
-            text_content = []
-            for sheet_name, df in excel_data.items():
-                text_content.append(f"--- シート: {sheet_name} ---")
-                df_string = df.to_string(index=False, na_rep='')
-                text_content.append(df_string)
-                text_content.append("")
-            
-            return "\n".join(text_content)
-            
-        except Exception as e:
-            return f"Excel処理エラー: {str(e)}"
-    
-    def _process_docx(self, file_content: bytes, file_name: str) -> str:
-        """Word文書を処理"""
-        if not DOCX_AVAILABLE:
-            return "Word文書の処理にはpython-docxが必要です"
-        
-        try:
-            doc_file = io.BytesIO(file_content)
-            document = Document(doc_file)
-            
-            text_content = []
-            
-            # 段落を処理
-            for paragraph in document.paragraphs:
-                if paragraph.text.strip():
-                    text_content.append(paragraph.text)
-            
-            # テーブルを処理
-            for table in document.tables:
-                text_content.append("\n--- テーブル ---")
-                for row in table.rows:
-                    row_text = []
-                    for cell in row.cells:
-                        row_text.append(cell.text.strip())
-                    text_content.append(" | ".join(row_text))
-            
-            if not text_content:
-                return "Word文書からテキストを抽出できませんでした"
-            
-            return "\n".join(text_content)
-            
-        except Exception as e:
-            return f"Word文書処理エラー: {str(e)}"
-    
     def _process_doc(self, file_content: bytes, file_name: str) -> str:
         """古いWord文書(.doc)を処理"""
         # .docファイルの処理は複雑なため、基本的なメッセージを返す
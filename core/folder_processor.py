@@ -1,24 +1,30 @@
-import io
+import os
+import shutil
 import tempfile
+import time
 import zipfile
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
-import pandas as pd
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
 from datetime import datetime
 import json
+from config import get_config
+from .text_cache import get_text_cache, hash_content
+from .extractors import (ExtractionError, ExtractorRegistry, extract_page_range, format_pages, get_extractor_registry,
+                         text_cache_key)
 
-# PDF処理ライブラリ
-try:
-    import PyPDF2
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+# プロセスプールで抽出するファイル形式（CPU負荷の高い形式のみ、テキストは逐次処理）
+POOL_EXTRACTION_EXTENSIONS = {".pdf", ".xlsx", ".xls", ".docx"}
 
-try:
-    import fitz  # PyMuPDF
-    FITZ_AVAILABLE = True
-except ImportError:
-    FITZ_AVAILABLE = False
+# 抽出テキストキャッシュの対象とするファイル形式
+TEXT_CACHE_EXTENSIONS = {".pdf", ".xlsx", ".xls", ".docx"}
+
+# テキストが含まれないドキュメントの本文
+EMPTY_DOCUMENT_TEXT = "テキストを抽出できませんでした（空のドキュメント）"
+
+# アップロードを一時ファイルへ書き出す際の読み込み単位（バイト）
+SPOOL_CHUNK_SIZE = 1024 * 1024
 
 class FolderProcessor:
     """
@@ -28,6 +34,13 @@ class FolderProcessor:
     
     def __init__(self):
         self.supported_document_types = ['.pdf', '.txt', '.png', '.jpg', '.jpeg', '.xlsx', '.xls', '.docx']
+        
+        extraction_config = get_config("EXTRACTION_CONFIG")
+        self.extraction_workers = extraction_config.get("max_workers", 0)
+        self.min_documents_for_pool = extraction_config.get("min_documents_for_pool", 8)
+        self.last_extraction_stats: Dict[str, Any] = {}
+        self.text_cache = get_text_cache()
+        self.extractors = get_extractor_registry()
     
     def process_evidence_folder(self, uploaded_file) -> Dict[str, Any]:
         """
@@ -40,22 +53,21 @@ class FolderProcessor:
             階層化された証跡データ
         """
         try:
-            # ZIPファイルを展開
-            zip_content = self._extract_zip_file(uploaded_file)
-            
-            # デバッグ情報：zipファイル構造を記録
-            zip_structure = list(zip_content.keys())
-            
-            # 2階層構造を解析
-            structured_data = self._analyze_folder_structure(zip_content)
-            
-            # デバッグ: 構造化データの内容を表示
-            print(f"解析された構造:")
-            for data_id, files in structured_data.items():
-                print(f"  {data_id}: {len(files)}ファイル - {files}")
-            
-            # 各ドキュメントを処理
-            processed_data = self._process_documents(structured_data, zip_content)
+            # アップロードを一時ファイルに書き出し、メンバーは処理時に1件ずつ読み込む
+            with self._spool_upload(uploaded_file) as spooled_file, zipfile.ZipFile(spooled_file) as zip_file:
+                # デバッグ情報：zipファイル構造を記録
+                zip_structure = self._list_supported_members(zip_file)
+                
+                # 2階層構造を解析
+                structured_data = self._analyze_folder_structure(zip_structure)
+                
+                # デバッグ: 構造化データの内容を表示
+                print(f"解析された構造:")
+                for data_id, files in structured_data.items():
+                    print(f"  {data_id}: {len(files)}ファイル - {files}")
+                
+                # 各ドキュメントを処理
+                processed_data = self._process_documents(structured_data, zip_file)
             
             return {
                 "success": True,
@@ -64,6 +76,7 @@ class FolderProcessor:
                     "total_data_folders": len(processed_data),
                     "total_documents": sum(len(data["documents"]) for data in processed_data.values()),
                     "processed_at": datetime.now().isoformat(),
+                    "extraction_stats": self.last_extraction_stats,
                     "zip_structure": zip_structure,  # デバッグ情報
                     "detected_data_folders": list(structured_data.keys())  # デバッグ情報
                 }
@@ -76,29 +89,53 @@ class FolderProcessor:
                 "data": {}
             }
     
-    def _extract_zip_file(self, uploaded_file) -> Dict[str, bytes]:
-        """ZIPファイルを展開"""
-        zip_content = {}
+    @staticmethod
+    def _spool_upload(uploaded_file):
+        """
+        アップロードされたファイルを一時ファイルへ分割コピー（全体をメモリ上に複製しない）
+        
+        Returns:
+            先頭にシーク済みの一時ファイル（閉じると削除される）
+        """
+        spooled_file = tempfile.TemporaryFile()
+        try:
+            uploaded_file.seek(0)
+            shutil.copyfileobj(uploaded_file, spooled_file, SPOOL_CHUNK_SIZE)
+            uploaded_file.seek(0)
+            spooled_file.seek(0)
+        except Exception:
+            spooled_file.close()
+            raise
+        return spooled_file
+    
+    def _list_supported_members(self, zip_file: zipfile.ZipFile) -> List[str]:
+        """ZIP内のサポート対象ファイルのパス一覧（内容は読み込まない）"""
+        member_paths = []
         
-        with zipfile.ZipFile(io.BytesIO(uploaded_file.read())) as zip_file:
-            print(f"ZIPファイル内のファイル一覧:")
-            for file_info in zip_file.filelist:
-                print(f"  {file_info.filename} (ディレクトリ: {file_info.is_dir()})")
+        print(f"ZIPファイル内のファイル一覧:")
+        for file_info in zip_file.filelist:
+            print(f"  {file_info.filename} (ディレクトリ: {file_info.is_dir()})")
+            
+            if not file_info.is_dir():
+                file_path = Path(file_info.filename)
+                file_extension = file_path.suffix.lower()
                 
-                if not file_info.is_dir():
-                    file_path = Path(file_info.filename)
-                    file_extension = file_path.suffix.lower()
-                    
-                    if file_extension in self.supported_document_types:
-                        zip_content[file_info.filename] = zip_file.read(file_info)
-                        print(f"    ✓ 読み込み: {file_info.filename} ({file_extension})")
-                    else:
-                        print(f"    ✗ スキップ: {file_info.filename} ({file_extension} はサポート外)")
+                if file_extension in self.supported_document_types:
+                    member_paths.append(file_info.filename)
+                    print(f"    ✓ 対象: {file_info.filename} ({file_extension}, {file_info.file_size} bytes)")
+                else:
+                    print(f"    ✗ スキップ: {file_info.filename} ({file_extension} はサポート外)")
         
-        print(f"読み込まれたファイル数: {len(zip_content)}")
-        return zip_content
+        print(f"対象ファイル数: {len(member_paths)}")
+        return member_paths
+    
+    @staticmethod
+    def _iter_member_contents(zip_file: zipfile.ZipFile, doc_paths: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """ZIPのメンバーを1件ずつ読み込んで返す（呼び出し側が次を要求した時点で前の内容は不要になる）"""
+        for doc_path in doc_paths:
+            yield doc_path, zip_file.read(doc_path)
     
-    def _analyze_folder_structure(self, zip_content: Dict[str, bytes]) -> Dict[str, List[str]]:
+    def _analyze_folder_structure(self, member_paths: Iterable[str]) -> Dict[str, List[str]]:
         """
         2階層フォルダ構造を解析
         
@@ -107,7 +144,7 @@ class FolderProcessor:
         """
         structured_data = {}
         
-        for file_path in zip_content.keys():
+        for file_path in member_paths:
             parts = Path(file_path).parts
             
             # zipファイル内の構造を解析
@@ -129,56 +166,45 @@ class FolderProcessor:
         
         return structured_data
     
-    def _process_documents(self, structured_data: Dict[str, List[str]], zip_content: Dict[str, bytes]) -> Dict[str, Dict[str, Any]]:
+    def _process_documents(self, structured_data: Dict[str, List[str]], zip_file: zipfile.ZipFile) -> Dict[str, Dict[str, Any]]:
         """各データフォルダ内のドキュメントを処理"""
         processed_data = {}
         
         print(f"\nドキュメント処理開始:")
+        # テキスト抽出（PDF・Excelは件数が多い場合にプロセスプールで並列抽出）
+        doc_paths = [doc_path for document_paths in structured_data.values() for doc_path in document_paths]
+        extractions = self._extract_documents(doc_paths, zip_file)
+        
         for data_id, document_paths in structured_data.items():
             documents = {}
             print(f"\n処理中: {data_id} ({len(document_paths)}ファイル)")
             
             for doc_path in document_paths:
-                try:
-                    doc_name = Path(doc_path).name
-                    doc_extension = Path(doc_path).suffix.lower()
-                    
-                    # ファイル内容を取得
-                    file_content = zip_content.get(doc_path, b"")
-                    print(f"  処理: {doc_name} ({doc_extension}, {len(file_content)} bytes)")
-                    
-                    # テキスト内容を抽出
-                    content_text = ""
-                    if doc_extension == ".txt":
-                        try:
-                            content_text = file_content.decode('utf-8')
-                        except:
-                            try:
-                                content_text = file_content.decode('shift-jis')
-                            except:
-                                content_text = "テキストデコードエラー"
-                    elif doc_extension == ".pdf":
-                        content_text = self._extract_pdf_text(file_content)
-                    elif doc_extension in [".xlsx", ".xls"]:
-                        content_text = self._extract_excel_text(file_content, doc_name)
-                    elif doc_extension == ".docx":
-                        content_text = "[.docxファイル - 内容抽出は未実装]"
-                    
-                    documents[doc_name] = {
-                        "path": doc_path,
-                        "type": self._classify_document_type(doc_name),
-                        "extension": doc_extension,
-                        "content": content_text,  # 実際のコンテンツを追加
-                        "size": len(file_content),
-                        "processed_at": datetime.now().isoformat(),
-                        "status": "処理完了"
-                    }
-                    print(f"    ✓ 完了: 内容サイズ = {len(content_text)} 文字")
-                    
-                except Exception as e:
+                doc_name = Path(doc_path).name
+                doc_extension = Path(doc_path).suffix.lower()
+                extraction = extractions[doc_path]
+                
+                if "error" in extraction:
                     documents[doc_name] = {
-                        "error": f"ドキュメント処理エラー: {str(e)}"
+                        "error": f"ドキュメント処理エラー: {extraction['error']}"
                     }
+                    continue
+                
+                file_size = zip_file.getinfo(doc_path).file_size
+                content_text = extraction["content"]
+                print(f"  処理: {doc_name} ({doc_extension}, {file_size} bytes)")
+                
+                documents[doc_name] = {
+                    "path": doc_path,
+                    "type": self._classify_document_type(doc_name),
+                    "extension": doc_extension,
+                    "content": content_text,  # 実際のコンテンツを追加
+                    "size": file_size,
+                    "extraction_seconds": extraction["seconds"],
+                    "processed_at": datetime.now().isoformat(),
+                    "status": "処理完了"
+                }
+                print(f"    ✓ 完了: 内容サイズ = {len(content_text)} 文字 ({extraction['seconds']:.2f}秒)")
             
             processed_data[data_id] = {
                 "data_id": data_id,
@@ -188,6 +214,178 @@ class FolderProcessor:
         
         return processed_data
     
+    def _extract_document(self, doc_path: str, file_content: bytes) -> Dict[str, Any]:
+        """
+        共通の抽出レジストリで1ドキュメントのテキストを抽出し所要時間を計測
+        抽出できない形式（画像など）は空文字列、抽出に失敗した場合はエラー内容を本文とする
+        
+        Returns:
+            {"content": 抽出テキスト, "seconds": 所要秒数, "backend": 使用したバックエンド}
+            （抽出に失敗した場合は "failed": True、予期しないエラーの場合は {"error": エラー内容, "seconds": 所要秒数}）
+        """
+        extraction = _extract_with_registry(self.extractors, doc_path, file_content)
+        # 統計はこのプロセスのレジストリに記録済み
+        extraction.pop("attempts", None)
+        return extraction
+    
+    def _get_cached_extraction(self, doc_path: str, file_content: bytes,
+                               content_hashes: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        抽出テキストキャッシュから抽出結果を取得（キャッシュ対象外・未登録の場合はNone）
+        保存時に使うためドキュメントのハッシュをcontent_hashesに記録する
+        """
+        if (not self.text_cache.enabled or Path(doc_path).suffix.lower() not in TEXT_CACHE_EXTENSIONS
+                or not self.extractors.is_supported(doc_path)):
+            return None
+        
+        started = time.perf_counter()
+        content_hash = hash_content(file_content)
+        content_hashes[doc_path] = content_hash
+        cached = self.text_cache.get(content_hash, *text_cache_key(doc_path))
+        if cached is None:
+            return None
+        return {"content": cached["text"] or EMPTY_DOCUMENT_TEXT, "seconds": time.perf_counter() - started, "cached": True}
+    
+    def _store_extraction(self, doc_path: str, extraction: Dict[str, Any], content_hashes: Dict[str, str]):
+        """抽出結果を抽出テキストキャッシュに保存（抽出に失敗した結果は保存しない）"""
+        content_hash = content_hashes.get(doc_path)
+        if content_hash and "backend" in extraction:
+            self.text_cache.set(content_hash, *text_cache_key(doc_path), "" if extraction.get("empty") else extraction["content"])
+    
+    def _get_extraction_workers(self, pool_document_count: int) -> int:
+        """プロセスプールのワーカー数（1の場合は単一プロセスで抽出）"""
+        if pool_document_count < max(2, self.min_documents_for_pool):
+            return 1
+        workers = self.extraction_workers or os.cpu_count() or 1
+        return max(1, min(workers, pool_document_count))
+    
+    def _plan_page_ranges(self, doc_path: str, file_content: bytes, workers: int) -> Tuple[Optional[str], Optional[List[Tuple[int, int]]]]:
+        """ページ分割して抽出する場合の最優先のバックエンド名とページ範囲（分割しない場合は (None, None)）"""
+        backends = self.extractors.backends_for(doc_path)
+        if not backends:
+            return None, None
+        page_ranges = self.extractors.page_ranges(backends[0], file_content, workers)
+        if not page_ranges:
+            return None, None
+        return backends[0].name, page_ranges
+    
+    def _assemble_page_parts(self, doc_path: str, split: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        ページ範囲ごとの抽出結果をページ順に結合
+        いずれかの範囲で失敗した場合は、バックエンドのフォールバックを含めて文書全体を抽出し直す
+        """
+        parts = split["parts"]
+        seconds = sum(part["seconds"] for part in parts)
+        if any("error" in part for part in parts):
+            self.extractors.record_attempts([(split["backend"], len(split["content"]), seconds, "failures")])
+            print(f"  ページ分割での抽出に失敗したため一括で抽出します: {doc_path}")
+            return self._extract_document(doc_path, split["content"])
+        
+        text = format_pages([page for part in parts for page in part["pages"]])
+        self.extractors.record_attempts([
+            (split["backend"], len(split["content"]), seconds, "successes" if text.strip() else "empty")
+        ])
+        return {"content": text or EMPTY_DOCUMENT_TEXT, "seconds": sum(part["seconds"] for part in parts),
+                "backend": split["backend"], "empty": not text, "page_ranges": len(parts)}
+    
+    def _extract_documents(self, doc_paths: List[str], zip_file: zipfile.ZipFile) -> Dict[str, Dict[str, Any]]:
+        """
+        全ドキュメントのテキストを抽出
+        ZIPのメンバーは1件ずつ読み込み、抽出後は内容を保持しない（プロセスプールへの投入も
+        ワーカー数の2倍までに制限）ため、メモリ使用量はアーカイブのサイズによらず一定に収まる
+        PDF・Excelが一定件数以上ある場合はサイズの大きい順にプロセスプールへ投入し、
+        プールが使えない場合は単一プロセスで抽出する
+        ページ数の多いPDFはページ範囲ごとに分けて同じプールへ投入し、揃った時点でページ順に結合する
+        PDF・Excelは抽出テキストキャッシュにあれば抽出しない
+        
+        Returns:
+            {ドキュメントパス: _extract_documentの結果}
+        """
+        started = time.perf_counter()
+        extractions = {}
+        content_hashes: Dict[str, str] = {}
+        
+        def collect(doc_path: str, extraction: Dict[str, Any]):
+            extractions[doc_path] = extraction
+            self._store_extraction(doc_path, extraction, content_hashes)
+        
+        pool_paths = [doc_path for doc_path in doc_paths if Path(doc_path).suffix.lower() in POOL_EXTRACTION_EXTENSIONS]
+        workers = self._get_extraction_workers(len(pool_paths))
+        mode = "single_process"
+        
+        if workers > 1:
+            # 大きいファイルから投入し、最後に大きいファイルだけが残って待たされないようにする
+            pool_paths.sort(key=lambda doc_path: zip_file.getinfo(doc_path).file_size, reverse=True)
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                    # {future: (ドキュメントパス, ページ範囲の番号（文書全体の場合はNone）)}
+                    future_to_task: Dict[concurrent.futures.Future, Tuple[str, Optional[int]]] = {}
+                    split_documents: Dict[str, Dict[str, Any]] = {}
+                    
+                    def complete(future: concurrent.futures.Future):
+                        doc_path, part = future_to_task.pop(future)
+                        if part is None:
+                            extraction = future.result()
+                            # ワーカーで計測したバックエンドごとの処理時間を親プロセスの統計に反映
+                            self.extractors.record_attempts(extraction.pop("attempts", []))
+                            collect(doc_path, extraction)
+                            return
+                        split = split_documents[doc_path]
+                        split["parts"][part] = future.result()
+                        split["remaining"] -= 1
+                        if not split["remaining"]:
+                            del split_documents[doc_path]
+                            collect(doc_path, self._assemble_page_parts(doc_path, split))
+                    
+                    def submit(doc_path: str, part: Optional[int], fn, *args):
+                        if len(future_to_task) >= workers * 2:
+                            done, _ = concurrent.futures.wait(future_to_task, return_when=concurrent.futures.FIRST_COMPLETED)
+                            for future in done:
+                                complete(future)
+                        future_to_task[executor.submit(fn, *args)] = (doc_path, part)
+                    
+                    for doc_path, file_content in self._iter_member_contents(zip_file, pool_paths):
+                        cached = self._get_cached_extraction(doc_path, file_content, content_hashes)
+                        if cached:
+                            extractions[doc_path] = cached
+                            continue
+                        backend_name, page_ranges = self._plan_page_ranges(doc_path, file_content, workers)
+                        if not page_ranges:
+                            submit(doc_path, None, _extract_document_in_worker, doc_path, file_content)
+                            continue
+                        split_documents[doc_path] = {"backend": backend_name, "content": file_content,
+                                                     "parts": [None] * len(page_ranges), "remaining": len(page_ranges)}
+                        for part, (start, end) in enumerate(page_ranges):
+                            submit(doc_path, part, _extract_page_range_in_worker, backend_name, file_content, start, end)
+                    for future in concurrent.futures.as_completed(list(future_to_task)):
+                        complete(future)
+                mode = "process_pool"
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                # 抽出済みの結果は使い、残りは単一プロセスで抽出
+                print(f"プロセスプールでの抽出に失敗したため単一プロセスで抽出します: {str(e)}")
+                workers = 1
+        
+        remaining_paths = [doc_path for doc_path in doc_paths if doc_path not in extractions]
+        for doc_path, file_content in self._iter_member_contents(zip_file, remaining_paths):
+            cached = self._get_cached_extraction(doc_path, file_content, content_hashes)
+            if cached:
+                extractions[doc_path] = cached
+                continue
+            collect(doc_path, self._extract_document(doc_path, file_content))
+        
+        self.last_extraction_stats = {
+            "mode": mode,
+            "workers": workers,
+            "documents": len(doc_paths),
+            "cached_documents": sum(1 for extraction in extractions.values() if extraction.get("cached")),
+            "split_documents": sum(1 for extraction in extractions.values() if extraction.get("page_ranges")),
+            "wall_seconds": time.perf_counter() - started,
+            "extraction_seconds": sum(extraction["seconds"] for extraction in extractions.values())
+        }
+        print(f"テキスト抽出完了: {len(doc_paths)}件（キャッシュ {self.last_extraction_stats['cached_documents']}件）/ "
+              f"{self.last_extraction_stats['wall_seconds']:.2f}秒 ({mode}, {workers}プロセス)")
+        return extractions
+    
     def _classify_document_type(self, filename: str) -> str:
         """ファイル名からドキュメントタイプを推定"""
         filename_lower = filename.lower()
@@ -244,8 +442,9 @@ class FolderProcessor:
             if not uploaded_file.name.lower().endswith('.zip'):
                 return False, "ZIPファイルをアップロードしてください"
             
-            # ZIPファイルの内容をチェック
-            with zipfile.ZipFile(io.BytesIO(uploaded_file.read())) as zip_file:
+            # ZIPファイルの内容をチェック（中央ディレクトリのみを読み、全体をメモリ上に複製しない）
+            uploaded_file.seek(0)
+            with zipfile.ZipFile(uploaded_file) as zip_file:
                 file_list = zip_file.filelist
                 
                 # 最低1つのファイルが含まれているかチェック
@@ -281,86 +480,43 @@ class FolderProcessor:
             
         except Exception as e:
             return False, f"フォルダ構造検証エラー: {str(e)}"
+
+
+def _extract_with_registry(extractors: ExtractorRegistry, doc_path: str, file_content: bytes) -> Dict[str, Any]:
+    """
+    抽出レジストリで1ドキュメントのテキストを抽出し所要時間を計測
     
-    def _extract_pdf_text(self, file_content: bytes) -> str:
-        """PDFファイルからテキストを抽出"""
-        
-        # PyMuPDFを優先的に使用（より高精度）
-        if FITZ_AVAILABLE:
-            try:
-                pdf_document = fitz.open(stream=file_content, filetype="pdf")
-                text_content = []
-                
-                for page_num in range(pdf_document.page_count):
-                    page = pdf_document.load_page(page_num)
-                    page_text = page.get_text()
-                    if page_text.strip():
-                        text_content.append(f"--- ページ {page_num + 1} ---")
-                        text_content.append(page_text)
-                
-                pdf_document.close()
-                
-                if text_content:
-                    return "\n".join(text_content)
-                else:
-                    return "PDFからテキストを抽出できませんでした（空のPDF）"
-                    
-            except Exception as e:
-                # PyMuPDFでエラーが発生した場合、PyPDF2にフォールバック
-                if PDF_AVAILABLE:
-                    return self._extract_pdf_with_pypdf2(file_content)
-                else:
-                    return f"PyMuPDF処理エラー: {str(e)}"
-        
-        # PyPDF2を使用
-        elif PDF_AVAILABLE:
-            return self._extract_pdf_with_pypdf2(file_content)
-        
-        else:
-            return "PDF処理ライブラリがインストールされていません"
-    
-    def _extract_pdf_with_pypdf2(self, file_content: bytes) -> str:
-        """PyPDF2を使用してPDFからテキストを抽出"""
-        try:
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text_content = []
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text_content.append(f"--- ページ {page_num + 1} ---")
-                    text_content.append(page_text)
-            
-            if text_content:
-                return "\n".join(text_content)
-            else:
-                return "PDFからテキストを抽出できませんでした（空のPDF）"
-                
-        except Exception as e:
-            return f"PDF処理エラー（PyPDF2）: {str(e)}"
+    Returns:
+        FolderProcessor._extract_documentの結果に、試したバックエンドごとの記録（"attempts"）を加えたもの
+    """
+    started = time.perf_counter()
+    if not extractors.is_supported(doc_path):
+        return {"content": "", "seconds": 0.0}
+    try:
+        result = extractors.extract(file_content, doc_path)
+    except ExtractionError as e:
+        return {"content": f"テキスト抽出エラー: {str(e)}", "seconds": time.perf_counter() - started, "failed": True,
+                "attempts": e.attempts}
+    except Exception as e:
+        return {"error": str(e), "seconds": time.perf_counter() - started}
     
-    def _extract_excel_text(self, file_content: bytes, file_name: str) -> str:
-        """Excelファイルからテキストを抽出"""
-        try:
-            excel_file = io.BytesIO(file_content)
-            
-            # すべてのシートを読み込み
-            excel_data = pd.read_excel(excel_file, sheet_name=None)
-            
-            text_content = []
-            for sheet_name, df in excel_data.items():
-                text_content.append(f"--- シート: {sheet_name} ---")
-                
-                # データフレームを文字列に変換
-                df_string = df.to_string(index=False, na_rep='')
-                text_content.append(df_string)
-                text_content.append("")
-            
-            if text_content:
-                return "\n".join(text_content)
-            else:
-                return "Excelファイルが空です"
-                
-        except Exception as e:
-            return f"Excel処理エラー: {str(e)}"
\ No newline at end of file
+    return {"content": result.text or EMPTY_DOCUMENT_TEXT, "seconds": time.perf_counter() - started,
+            "backend": result.backend, "empty": not result.text, "attempts": result.attempts}
+
+
+def _extract_document_in_worker(doc_path: str, file_content: bytes) -> Dict[str, Any]:
+    """
+    プロセスプールのワーカーで1ドキュメントのテキストを抽出（pickle可能なモジュール関数）
+    レジストリはワーカープロセスごとに1度だけ作成され、統計は結果の"attempts"で親プロセスに返す
+    """
+    return _extract_with_registry(get_extractor_registry(), doc_path, file_content)
+
+
+def _extract_page_range_in_worker(backend_name: str, file_content: bytes, start: int, end: int) -> Dict[str, Any]:
+    """プロセスプールのワーカーでPDFのページ範囲 [start, end) のテキストを抽出"""
+    started = time.perf_counter()
+    try:
+        pages = extract_page_range(backend_name, file_content, start, end)
+    except Exception as e:
+        return {"error": str(e), "seconds": time.perf_counter() - started}
+    return {"pages": pages, "seconds": time.perf_counter() - started}
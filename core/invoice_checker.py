@@ -1,7 +1,8 @@
 import asyncio
 from datetime import datetime
+import hashlib
 import json
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Callable
 from pydantic import BaseModel, Field, validator
 from enum import Enum
 import os
@@ -11,8 +12,13 @@ try:
     from langchain.output_parsers import PydanticOutputParser
 except ImportError:
     print("LangChainライブラリが正しくインストールされていません")
-import concurrent.futures
+from config import get_config
 from .base_llm_service import BaseLLMService, BaseDataValidator, BaseProcessor
+from .response_cache import ResponseCache
+from .local_rules import LocalRuleEngine
+from .metrics import get_metrics, metrics_tags
+from .json_repair import parse_json_lenient
+from .structured_output import supports_structured_outputs, get_model_response_format
 
 class SeverityLevel(str, Enum):
     """重要度レベルの定義"""
@@ -26,6 +32,7 @@ class CheckResult(BaseModel):
     severity: SeverityLevel = Field(description="重要度 (info/warning/error)")
     message: str = Field(min_length=1, description="チェック結果の説明")
     details: str = Field(default="", description="markdown形式で詳細な判断根拠を記載")
+    confidence: Optional[float] = Field(default=None, description="判定の確信度（0〜1）")
     
     @validator('message')
     def message_must_not_be_empty(cls, v):
@@ -46,6 +53,15 @@ class InvoiceCheckResponse(BaseModel):
     """GPT-4.1からのレスポンス全体のPydanticモデル"""
     check_result: CheckResult = Field(description="チェック結果")
 
+class RuleCheckResult(BaseModel):
+    """ルールIDに紐づくチェック結果（一括評価用）"""
+    rule_id: str = Field(description="評価したルールのID（指示されたIDをそのまま記載）")
+    check_result: CheckResult = Field(description="チェック結果")
+
+class MultiRuleCheckResponse(BaseModel):
+    """複数ルールを一括評価した場合のレスポンス全体のPydanticモデル"""
+    results: List[RuleCheckResult] = Field(description="ルールごとのチェック結果のリスト")
+
 class InvoiceChecker(BaseLLMService, BaseProcessor):
     """請求書チェック機能を提供するクラス（共通基盤を使用）"""
     
@@ -56,6 +72,22 @@ class InvoiceChecker(BaseLLMService, BaseProcessor):
         
         # Structured Output用のパーサーを初期化
         self.output_parser = PydanticOutputParser(pydantic_object=InvoiceCheckResponse)
+        self.multi_rule_output_parser = PydanticOutputParser(pydantic_object=MultiRuleCheckResponse)
+        
+        # strictなJSONスキーマで応答形式を指定（未対応の場合はプロンプト内のフォーマット指示を使用）
+        self.use_structured_outputs = supports_structured_outputs(self.provider, getattr(self, "azure_api_version", None))
+        if self.use_structured_outputs:
+            self.response_format = get_model_response_format("invoice_check_response", InvoiceCheckResponse)
+            self.multi_rule_response_format = get_model_response_format("multi_rule_check_response", MultiRuleCheckResponse)
+        else:
+            self.response_format = None
+            self.multi_rule_response_format = None
+        
+        # ルール評価結果の永続キャッシュ
+        self.response_cache = ResponseCache()
+        
+        # 計算で判定できるルール（local_check指定）のローカル評価
+        self.local_rule_engine = LocalRuleEngine()
     
     def validate_service_specific_config(self) -> Dict[str, Any]:
         """請求書チェック固有の設定を検証"""
@@ -68,51 +100,44 @@ class InvoiceChecker(BaseLLMService, BaseProcessor):
         
         return result
     
-    def check_invoice(self, file_data: Dict[str, Any], rule_ids: List[str]) -> Dict[str, Any]:
+    def check_invoice(self, file_data: Dict[str, Any], rule_ids: List[str],
+                      batch_rules: bool = False) -> Dict[str, Any]:
         """
         単一の請求書をチェック
         
         Args:
             file_data: ファイルの内容とメタデータ
             rule_ids: 適用するルールのIDリスト
+            batch_rules: Trueの場合、全ルールを1回のリクエストで一括評価する
             
         Returns:
             チェック結果
         """
-        # 設定の確認
-        if not self.is_configured():
-            return {"error": "OpenAI APIキーが設定されていません"}
-        
-        # 入力データの検証
-        file_validation = self.validator.validate_file_data(file_data)
-        if not file_validation["valid"]:
-            return {"error": f"ファイルデータエラー: {', '.join(file_validation['errors'])}"}
-        
-        rule_validation = self.validator.validate_rule_ids(rule_ids)
-        if not rule_validation["valid"]:
-            return {"error": f"ルールIDエラー: {', '.join(rule_validation['errors'])}"}
+        validation_error = self._validate_check_request(file_data, rule_ids)
+        if validation_error:
+            return validation_error
         
         try:
             self.log_info(f"請求書チェック開始: {file_data.get('file_name', '不明')}")
             
             # ルール管理からルールを取得
-            from .rule_manager import RuleManager
-            rule_manager = RuleManager()
-            
+            rules = self._load_rules(rule_ids)
+            content_hash = self.content_hash(file_data)
             checks = []
             
-            for rule_id in rule_ids:
-                rule = rule_manager.get_rule(rule_id)
-                if rule:
+            if batch_rules and len(rules) > 1:
+                self.log_info(f"ルール一括評価中: {len(rules)}件")
+                checks = self._apply_rules_batch(file_data, rules)
+            else:
+                for rule_id, rule in rules.items():
                     self.log_info(f"ルール適用中: {rule.get('name', rule_id)}")
                     check_result = self._apply_rule(file_data, rule)
                     checks.append(check_result)
-                else:
-                    self.log_warning(f"ルールが見つかりません: {rule_id}")
             
             result = {
                 "file_name": file_data.get("file_name", "不明"),
-                "checks": checks,
+                "checks": self._attach_provenance(checks, rules, content_hash),
+                "content_hash": content_hash,
                 "checked_at": datetime.now().isoformat()
             }
             
@@ -122,6 +147,76 @@ class InvoiceChecker(BaseLLMService, BaseProcessor):
         except Exception as e:
             return self.handle_exception("請求書チェック", e)
     
+    @staticmethod
+    def content_hash(file_data: Dict[str, Any]) -> str:
+        """請求書の内容のハッシュ（SHA-256）"""
+        return hashlib.sha256(file_data.get("content", "").encode("utf-8")).hexdigest()
+    
+    def _provenance(self, content_hash: str, rule_id: str, rule: Dict[str, Any]) -> Dict[str, Any]:
+        """チェック結果の入力（請求書の内容・ルール・ルール更新日時・モデル）"""
+        return {
+            "file_hash": content_hash,
+            "rule_id": rule_id,
+            "rule_updated_at": rule.get("updated_at"),
+            "model": self.cascade.model_signature()
+        }
+    
+    def _attach_provenance(self, checks: List[Dict[str, Any]], rules: Dict[str, Dict[str, Any]],
+                           content_hash: str) -> List[Dict[str, Any]]:
+        """チェック結果（rulesの順序）に入力の情報を付与"""
+        for (rule_id, rule), check in zip(rules.items(), checks):
+            check["provenance"] = self._provenance(content_hash, rule_id, rule)
+        return checks
+    
+    def _reusable_checks(self, previous_result: Optional[Dict[str, Any]], content_hash: str,
+                         rules: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        前回の結果のうち、入力が変わっていないため再利用できるチェック結果を取得
+        
+        Returns:
+            ルールIDをキーとしたチェック結果（エラー・解析失敗の結果は再評価するため含めない）
+        """
+        reusable = {}
+        for check in (previous_result or {}).get("checks", []):
+            provenance = check.get("provenance") or {}
+            rule_id = provenance.get("rule_id")
+            if rule_id not in rules or "passed" not in check or check.get("parse_error"):
+                continue
+            if provenance == self._provenance(content_hash, rule_id, rules[rule_id]):
+                reusable[rule_id] = dict(check, reused=True)
+        return reusable
+    
+    def _validate_check_request(self, file_data: Dict[str, Any], rule_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """チェック実行前の設定・入力を検証（問題があればエラー結果を返す）"""
+        # 設定の確認
+        if not self.is_configured():
+            return {"error": "OpenAI APIキーが設定されていません"}
+        
+        # 入力データの検証
+        file_validation = self.validator.validate_file_data(file_data)
+        if not file_validation["valid"]:
+            return {"error": f"ファイルデータエラー: {', '.join(file_validation['errors'])}"}
+        
+        rule_validation = self.validator.validate_rule_ids(rule_ids)
+        if not rule_validation["valid"]:
+            return {"error": f"ルールIDエラー: {', '.join(rule_validation['errors'])}"}
+        
+        return None
+    
+    def _load_rules(self, rule_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """ルールIDに対応するルールを取得（見つからないIDは警告して除外）"""
+        from .rule_manager import RuleManager
+        rule_manager = RuleManager()
+        
+        rules = {}
+        for rule_id in rule_ids:
+            rule = rule_manager.get_rule(rule_id)
+            if rule:
+                rules[rule_id] = rule
+            else:
+                self.log_warning(f"ルールが見つかりません: {rule_id}")
+        return rules
+    
     def process(self, *args, **kwargs) -> Dict[str, Any]:
         """
         BaseProcessorのabstractメソッド実装
@@ -132,80 +227,462 @@ class InvoiceChecker(BaseLLMService, BaseProcessor):
         else:
             return {"success": False, "error": "引数が不足しています（file_data, rule_ids）"}
     
-    def _apply_rule(self, file_data: Dict[str, Any], rule: Dict[str, Any]) -> Dict[str, Any]:
+    def _apply_rule(self, file_data: Dict[str, Any], rule: Dict[str, Any],
+                    escalation_reason: Optional[str] = None) -> Dict[str, Any]:
         """
         個別ルールを適用
+        カスケード有効時は小さいモデルで先に評価し、再評価が必要な場合のみ主モデルで評価する
         
         Args:
             file_data: ファイルデータ
             rule: 適用するルール
+            escalation_reason: 一括評価で再評価が必要と判定済みの場合はその理由（主モデルのみで評価）
             
         Returns:
             ルール適用結果
         """
         try:
-            # システムプロンプトの構築
-            system_prompt = self._build_system_prompt(rule)
+            with self._metrics_tags(file_data, rule.get("name")):
+                # 計算で判定できる場合はLLMを呼び出さない
+                local_result = self.local_rule_engine.evaluate(file_data, rule)
+                if local_result is not None:
+                    return local_result
+                
+                messages, cache_key = self._prepare_rule_request(file_data, rule)
+                
+                # キャッシュを確認（モデル・プロンプト・ルール更新日時が同一なら再利用）
+                cached_result = self._get_cached_rule_result(cache_key, rule)
+                if cached_result is not None:
+                    return cached_result
+                
+                if escalation_reason is None and self.cascade.active:
+                    response = self.invoke_llm(messages, self.response_format, model=self.cascade.first_pass_model)
+                    result, escalation_reason = self._review_first_pass(response.content, rule, cache_key)
+                    if escalation_reason is None:
+                        return result
+                
+                # GPT-4.1に問い合わせ
+                response = self.invoke_llm(messages, self.response_format)
+                
+                return self._finalize_rule_response(response.content, rule, cache_key, escalation_reason=escalation_reason)
             
-            # ユーザープロンプトの構築
-            user_prompt = self._build_user_prompt(file_data, rule)
-            
-            # GPT-4.1に問い合わせ
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
-            
-            response = self.llm(messages)
+        except Exception as e:
+            return self._rule_error_result(rule, e)
+    
+    async def _apply_rule_async(self, file_data: Dict[str, Any], rule: Dict[str, Any],
+                                semaphore: asyncio.Semaphore,
+                                escalation_reason: Optional[str] = None) -> Dict[str, Any]:
+        """
+        個別ルールを非同期で適用（_apply_ruleの非同期版）
+        
+        Args:
+            file_data: ファイルデータ
+            rule: 適用するルール
+            semaphore: 同時リクエスト数を制限するセマフォ
+            escalation_reason: 一括評価で再評価が必要と判定済みの場合はその理由（主モデルのみで評価）
             
-            # Structured Outputを使用してレスポンスを解析
-            result = self._parse_structured_response(response.content, rule)
+        Returns:
+            ルール適用結果
+        """
+        try:
+            with self._metrics_tags(file_data, rule.get("name")):
+                local_result = self.local_rule_engine.evaluate(file_data, rule)
+                if local_result is not None:
+                    return local_result
+                
+                messages, cache_key = self._prepare_rule_request(file_data, rule)
+                
+                # レスポンスキャッシュ（SQLite）の読み書きはイベントループを止めないよう別スレッドで実行
+                cached_result = await asyncio.to_thread(self._get_cached_rule_result, cache_key, rule)
+                if cached_result is not None:
+                    return cached_result
+                
+                if escalation_reason is None and self.cascade.active:
+                    async with semaphore:
+                        response = await self.ainvoke_llm(messages, self.response_format, model=self.cascade.first_pass_model)
+                    result, escalation_reason = await asyncio.to_thread(
+                        self._review_first_pass, response.content, rule, cache_key
+                    )
+                    if escalation_reason is None:
+                        return result
+                
+                async with semaphore:
+                    response = await self.ainvoke_llm(messages, self.response_format)
+                
+                return await asyncio.to_thread(
+                    self._finalize_rule_response, response.content, rule, cache_key, escalation_reason=escalation_reason
+                )
             
-            return result
+        except Exception as e:
+            return self._rule_error_result(rule, e)
+    
+    def _metrics_tags(self, file_data: Dict[str, Any], rule_name: Optional[str] = None):
+        """LLM呼び出しのメトリクスに付与するタグ"""
+        return metrics_tags(service=self.service_name, task="invoice_check", rule=rule_name,
+                            data_id=file_data.get("file_name"))
+    
+    def _prepare_rule_request(self, file_data: Dict[str, Any], rule: Dict[str, Any]) -> Tuple[List[Any], str]:
+        """個別ルール評価のメッセージとキャッシュキーを構築"""
+        # システムプロンプトの構築
+        system_prompt = self._build_system_prompt(rule)
+        
+        # ユーザープロンプトの構築
+        user_prompt = self._build_user_prompt(file_data, rule)
+        
+        cache_key = self.response_cache.make_key(self.cascade.model_signature(), system_prompt, user_prompt,
+                                                 rule.get("updated_at"))
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+        return messages, cache_key
+    
+    def _get_cached_rule_result(self, cache_key: str, rule: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みの評価結果があれば解析して返す"""
+        cached_content = self.response_cache.get(cache_key)
+        if cached_content is None:
+            return None
+        
+        result = self._parse_structured_response(cached_content, rule)
+        result["cached"] = True
+        return result
+    
+    def _finalize_rule_response(self, response_content: str, rule: Dict[str, Any], cache_key: str,
+                                result: Optional[Dict[str, Any]] = None,
+                                escalation_reason: Optional[str] = None) -> Dict[str, Any]:
+        """
+        レスポンスを解析し（解析済みの場合はresultを指定）、成功した場合はキャッシュに保存
+        主モデルで再評価した結果にはescalated（再評価の理由）を付与する
+        """
+        # Structured Outputを使用してレスポンスを解析
+        if result is None:
+            result = self._parse_structured_response(response_content, rule)
+        
+        # 解析に成功したレスポンスのみキャッシュに保存
+        if not result.get("parse_error"):
+            self.response_cache.set(cache_key, response_content, self.model)
+        
+        if self.cascade.active:
+            result["model"] = self.model
+            if escalation_reason:
+                result["escalated"] = escalation_reason
+                self.log_info(f"主モデルで再評価 ({rule.get('name', '不明')}): {escalation_reason}")
+        
+        return result
+    
+    def _review_first_pass(self, response_content: str, rule: Dict[str, Any],
+                           cache_key: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        小さいモデルの評価結果を確認
+        
+        Returns:
+            (採用した場合は確定した結果, 主モデルで再評価する理由（採用した場合はNone）)
+        """
+        result = self._parse_structured_response(response_content, rule)
+        escalation_reason = self.cascade.check_escalation_reason(result)
+        self.cascade.record_first_pass(escalation_reason)
+        if escalation_reason is None:
+            result = self._finalize_rule_response(response_content, rule, cache_key, result)
+            result["model"] = self.cascade.first_pass_model
+        return result, escalation_reason
+    
+    def _review_first_pass_batch(self, batch_results: Dict[str, Dict[str, Any]],
+                                 rules: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """
+        小さいモデルの一括評価結果を確認し、再評価が必要なルールを結果から除く
+        （結果が欠落したルールは従来どおり個別評価にフォールバックする）
+        
+        Returns:
+            主モデルで再評価するルールIDと理由
+        """
+        if not self.cascade.active:
+            return {}
+        
+        escalations = {}
+        for rule_id in rules:
+            if rule_id not in batch_results:
+                continue
+            escalation_reason = self.cascade.check_escalation_reason(batch_results[rule_id])
+            self.cascade.record_first_pass(escalation_reason)
+            if escalation_reason:
+                escalations[rule_id] = escalation_reason
+                del batch_results[rule_id]
+            else:
+                batch_results[rule_id]["model"] = self.cascade.first_pass_model
+        return escalations
+    
+    def _rule_error_result(self, rule: Dict[str, Any], exception: Exception) -> Dict[str, Any]:
+        """ルール適用エラー時の結果を作成"""
+        self.log_error(f"ルール適用エラー ({rule.get('name', '不明')}): {str(exception)}")
+        return {
+            "rule_name": rule.get("name", "不明"),
+            "severity": SeverityLevel.ERROR.value,
+            "message": f"ルール適用エラー: {str(exception)}",
+            "details": None
+        }
+    
+    def _apply_rules_batch(self, file_data: Dict[str, Any], rules: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        複数ルールを1回のリクエストで一括評価
+        検証に失敗したルールのみ個別評価にフォールバックする
+        
+        Args:
+            file_data: ファイルデータ
+            rules: ルールIDをキーとしたルールの辞書
             
+        Returns:
+            ルール適用結果のリスト（rulesの順序）
+        """
+        # 計算で判定できるルールは一括評価のリクエストに含めない
+        batch_results = self._evaluate_local_rules(file_data, rules)
+        llm_rules = {rule_id: rule for rule_id, rule in rules.items() if rule_id not in batch_results}
+        escalations = {}
+        
+        try:
+            with self._metrics_tags(file_data, "一括評価"):
+                if llm_rules:
+                    messages, cache_key = self._prepare_batch_request(file_data, llm_rules)
+                    llm_results = self._get_cached_batch_results(cache_key, llm_rules)
+                
+                    if llm_results is None:
+                        response = self.invoke_llm(messages, self.multi_rule_response_format, model=self.cascade.first_model())
+                        llm_results = self._finalize_batch_response(response.content, llm_rules, cache_key)
+                    escalations = self._review_first_pass_batch(llm_results, llm_rules)
+                    batch_results.update(llm_results)
+                    
         except Exception as e:
-            self.log_error(f"ルール適用エラー ({rule.get('name', '不明')}): {str(e)}")
-            return {
-                "rule_name": rule.get("name", "不明"),
-                "severity": SeverityLevel.ERROR.value,
-                "message": f"ルール適用エラー: {str(e)}",
-                "details": None
-            }
+            self.log_error(f"ルール一括評価エラー: {str(e)}")
+        
+        checks = []
+        for rule_id, rule in rules.items():
+            if rule_id in batch_results:
+                checks.append(batch_results[rule_id])
+            elif rule_id in escalations:
+                checks.append(self._apply_rule(file_data, rule, escalations[rule_id]))
+            else:
+                # 結果が欠落・検証エラーのルールは個別に再評価
+                self.log_warning(f"一括評価結果が無効なため個別評価します: {rule.get('name', rule_id)}")
+                checks.append(self._apply_rule(file_data, rule))
+        
+        return checks
     
-    def _build_system_prompt(self, rule: Dict[str, Any]) -> str:
-        """システムプロンプトを構築（Structured Output対応）"""
-        format_instructions = self.output_parser.get_format_instructions()
+    async def _apply_rules_batch_async(self, file_data: Dict[str, Any], rules: Dict[str, Dict[str, Any]],
+                                       semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        """複数ルールを1回のリクエストで非同期に一括評価（_apply_rules_batchの非同期版）"""
+        batch_results = self._evaluate_local_rules(file_data, rules)
+        llm_rules = {rule_id: rule for rule_id, rule in rules.items() if rule_id not in batch_results}
+        escalations = {}
+        
+        try:
+            with self._metrics_tags(file_data, "一括評価"):
+                if llm_rules:
+                    messages, cache_key = self._prepare_batch_request(file_data, llm_rules)
+                    # レスポンスキャッシュ（SQLite）の読み書きはイベントループを止めないよう別スレッドで実行
+                    llm_results = await asyncio.to_thread(self._get_cached_batch_results, cache_key, llm_rules)
+                
+                    if llm_results is None:
+                        async with semaphore:
+                            response = await self.ainvoke_llm(messages, self.multi_rule_response_format,
+                                                              model=self.cascade.first_model())
+                        llm_results = await asyncio.to_thread(
+                            self._finalize_batch_response, response.content, llm_rules, cache_key
+                        )
+                    escalations = self._review_first_pass_batch(llm_results, llm_rules)
+                    batch_results.update(llm_results)
+                
+        except Exception as e:
+            self.log_error(f"ルール一括評価エラー: {str(e)}")
+        
+        # 結果が欠落・検証エラーのルールは個別に再評価（再評価が必要と判定済みのルールは主モデルで評価）
+        fallback_rules = {rule_id: rule for rule_id, rule in rules.items() if rule_id not in batch_results}
+        for rule_id, rule in fallback_rules.items():
+            if rule_id not in escalations:
+                self.log_warning(f"一括評価結果が無効なため個別評価します: {rule.get('name', '不明')}")
+        fallback_results = await asyncio.gather(*[
+            self._apply_rule_async(file_data, rule, semaphore, escalations.get(rule_id))
+            for rule_id, rule in fallback_rules.items()
+        ])
+        batch_results.update(zip(fallback_rules.keys(), fallback_results))
+        
+        return [batch_results[rule_id] for rule_id in rules]
+    
+    def _evaluate_local_rules(self, file_data: Dict[str, Any], rules: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """ローカルで判定できたルールの結果を返す（ルールIDをキーとした辞書）"""
+        local_results = {}
+        for rule_id, rule in rules.items():
+            local_result = self.local_rule_engine.evaluate(file_data, rule)
+            if local_result is not None:
+                local_results[rule_id] = local_result
+        return local_results
+    
+    def _prepare_batch_request(self, file_data: Dict[str, Any], rules: Dict[str, Dict[str, Any]]) -> Tuple[List[Any], str]:
+        """一括評価のメッセージとキャッシュキーを構築"""
+        system_prompt = self._build_multi_rule_system_prompt()
+        user_prompt = self._build_multi_rule_user_prompt(file_data, rules)
+        
+        # キャッシュキーには全ルールの更新日時を含める
+        rules_updated_at = ",".join(rule.get("updated_at", "") for rule in rules.values())
+        cache_key = self.response_cache.make_key(self.cascade.model_signature(), system_prompt, user_prompt,
+                                                 rules_updated_at)
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+        return messages, cache_key
+    
+    def _get_cached_batch_results(self, cache_key: str, rules: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """キャッシュ済みの一括評価結果があれば解析して返す"""
+        cached_content = self.response_cache.get(cache_key)
+        if cached_content is None:
+            return None
+        
+        batch_results = self._parse_multi_rule_response(cached_content, rules)
+        for result in batch_results.values():
+            result["cached"] = True
+        return batch_results
+    
+    def _finalize_batch_response(self, response_content: str, rules: Dict[str, Dict[str, Any]],
+                                 cache_key: str) -> Dict[str, Dict[str, Any]]:
+        """一括評価レスポンスを解析し、全ルールの結果が揃った場合のみキャッシュに保存"""
+        batch_results = self._parse_multi_rule_response(response_content, rules)
+        if len(batch_results) == len(rules):
+            self.response_cache.set(cache_key, response_content, self.model)
+        return batch_results
+    
+    def _format_instructions(self, output_parser: Any) -> str:
+        """プロンプトに含めるフォーマット指示（strictなJSONスキーマ指定時はAPI側で強制されるため不要）"""
+        if self.use_structured_outputs:
+            return ""
+        return output_parser.get_format_instructions()
+    
+    def _build_multi_rule_system_prompt(self) -> str:
+        """一括評価用のシステムプロンプトを構築"""
+        format_instructions = self._format_instructions(self.multi_rule_output_parser)
         
         return f"""
-あなたは経理部門として、提出された請求書の内容をチェックしてください。
-
-チェックルール: {rule['name']}
-カテゴリ: {rule['category']}
+あなたは経理部門として、提出された請求書の内容を複数のチェックルールでチェックしてください。
 
 重要なガイドライン:
+- 指示されたすべてのルールについて、ルールごとに独立して判断し、それぞれ1件の結果を返してください
+- rule_id には指示されたルールIDをそのまま記載してください
 - 軽微な問題は "warning"
 - 重大な問題は "error" 
 - 問題なしは "info" で passed: true
+- confidence には判定の確信度を0〜1で記載してください
 - 請求書の内容を理解してチェックしてください
 - 請求書は原本から事前に抽出されたテキストです。そのため不自然なスペースや改行が含まれていたり、文字が欠落したりする場合があります。俯瞰的に見て問題なければ、表記や体裁についての指摘はしないでください。
 
 {format_instructions}
 """
     
-    def _build_user_prompt(self, file_data: Dict[str, Any], rule: Dict[str, Any]) -> str:
-        """ユーザープロンプトを構築"""
+    def _build_multi_rule_user_prompt(self, file_data: Dict[str, Any], rules: Dict[str, Dict[str, Any]]) -> str:
+        """一括評価用のユーザープロンプトを構築"""
+        rule_sections = []
+        for rule_id, rule in rules.items():
+            rule_sections.append(f"""### ルールID: {rule_id}
+チェックルール: {rule['name']}
+カテゴリ: {rule['category']}
+チェック内容:
+{rule['prompt']}""")
+        rules_text = "\n\n".join(rule_sections)
+        
+        return f"""{self._build_invoice_section(file_data)}
+チェックルール一覧:
+{rules_text}
+
+上記の内容について、各ルールに基づいてチェックしてください。
+"""
+    
+    def _parse_multi_rule_response(self, response_content: str, rules: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        一括評価のレスポンスをルールごとに検証
+        
+        Returns:
+            検証に成功したルールIDをキーとした結果の辞書
+        """
+        try:
+            # 途中で切れた場合も完結しているルールの結果は採用し、欠けたルールのみ個別に評価し直す
+            data, complete = parse_json_lenient(response_content)
+        except json.JSONDecodeError as e:
+            self.log_warning(f"一括評価レスポンスのJSON解析エラー: {str(e)}")
+            get_metrics().record_validation_failure(f"一括評価のJSON解析エラー: {str(e)}")
+            return {}
+        
+        if not complete:
+            self.log_warning("一括評価レスポンスが途中で切れているため、完結している結果のみ使用します")
+        items = data.get("results", []) if isinstance(data, dict) else []
+        items = items if isinstance(items, list) else []
+        
+        parsed_results = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            rule_id = item.get("rule_id")
+            if rule_id not in rules or rule_id in parsed_results:
+                continue
+            try:
+                check_result = CheckResult(**item.get("check_result", {}))
+            except Exception as e:
+                self.log_warning(f"一括評価結果の検証エラー ({rules[rule_id].get('name', rule_id)}): {str(e)}")
+                get_metrics().record_validation_failure(f"{rules[rule_id].get('name', rule_id)}: {str(e)}")
+                continue
+            
+            parsed_results[rule_id] = {
+                "rule_name": rules[rule_id].get("name", "不明"),
+                "severity": check_result.severity.value,
+                "message": check_result.message,
+                "details": check_result.details,
+                "passed": check_result.passed,
+                "confidence": check_result.confidence
+            }
+        
+        return parsed_results
+    
+    def _build_invoice_section(self, file_data: Dict[str, Any]) -> str:
+        """
+        ユーザープロンプト先頭の請求書部分を構築
+        ルールに依存する内容を含めないため、同じ請求書に対するリクエスト間で先頭が一致する
+        """
         content = file_data.get("content", "")
         metadata = file_data.get("metadata", {})
         
-        prompt = f"""
-以下の請求書を指示された内容でチェックしてください:
+        return f"""
+以下の請求書を、指示されたルールでチェックしてください:
 
 ファイル名: {file_data.get('file_name', '不明')}
 ファイルタイプ: {metadata.get('file_type', '不明')}
 
 請求書から抽出された内容:
 {content}
+"""
+    
+    def _build_system_prompt(self, rule: Dict[str, Any]) -> str:
+        """
+        システムプロンプトを構築（Structured Output対応）
+        プロバイダー側のプロンプトキャッシュ（先頭一致）が効くよう、ルールに依存する内容は
+        ユーザープロンプトの末尾に置き、システムプロンプトは全ルールで同一にする
+        """
+        format_instructions = self._format_instructions(self.output_parser)
+        
+        return f"""
+あなたは経理部門として、提出された請求書の内容を指示されたチェックルールでチェックしてください。
 
+重要なガイドライン:
+- 軽微な問題は "warning"
+- 重大な問題は "error" 
+- 問題なしは "info" で passed: true
+- confidence には判定の確信度を0〜1で記載してください
+- 請求書の内容を理解してチェックしてください
+- 請求書は原本から事前に抽出されたテキストです。そのため不自然なスペースや改行が含まれていたり、文字が欠落したりする場合があります。俯瞰的に見て問題なければ、表記や体裁についての指摘はしないでください。
+
+{format_instructions}
+"""
+    
+    def _build_user_prompt(self, file_data: Dict[str, Any], rule: Dict[str, Any]) -> str:
+        """ユーザープロンプトを構築（請求書部分を先頭、ルールを末尾に置く）"""
+        prompt = f"""{self._build_invoice_section(file_data)}
+チェックルール: {rule['name']}
+カテゴリ: {rule['category']}
 チェック内容:
 {rule['prompt']}
 
@@ -217,7 +694,16 @@ class InvoiceChecker(BaseLLMService, BaseProcessor):
         """Structured Outputを使用してGPTレスポンスを型安全に解析"""
         try:
             # LangChainのPydanticOutputParserを使用して構造化された出力を解析
-            parsed_response: InvoiceCheckResponse = self.output_parser.parse(response_content)
+            try:
+                parsed_response: InvoiceCheckResponse = self.output_parser.parse(response_content)
+            except Exception:
+                # コードフェンス・末尾のカンマなどで解析できない場合は修復して検証
+                data, complete = parse_json_lenient(response_content)
+                if not complete:
+                    # 途中で切れた単一ルールの結果は既定値で検証を通ってしまうため解析エラーとする
+                    # （キャッシュ・差分再チェックで再利用されず、カスケード時は上位モデルで再評価される）
+                    raise ValueError("レスポンスが途中で切れています")
+                parsed_response = InvoiceCheckResponse(**data)
             
             # Pydanticモデルから辞書形式に変換
             check_result = parsed_response.check_result
@@ -227,36 +713,70 @@ class InvoiceChecker(BaseLLMService, BaseProcessor):
                 "severity": check_result.severity.value,  # Enumの値を取得
                 "message": check_result.message,
                 "details": check_result.details,
-                "passed": check_result.passed
+                "passed": check_result.passed,
+                "confidence": check_result.confidence
             }
             
         except Exception as e:
             # 構造化出力の解析に失敗した場合のフォールバック
+            get_metrics().record_validation_failure(f"{rule.get('name', '不明')}: {str(e)}")
             return {
                 "rule_name": rule.get("name", "不明"),
                 "severity": SeverityLevel.ERROR.value,
                 "message": f"構造化出力解析エラー: {str(e)}",
                 "details": response_content,
-                "passed": False
+                "passed": False,
+                "parse_error": True
             }
     
-    async def check_invoices_async(self, files_data: List[Dict[str, Any]], rule_ids: List[str]) -> List[Dict[str, Any]]:
+    async def check_invoices_async(self, files_data: List[Dict[str, Any]], rule_ids: List[str],
+                                   batch_rules: bool = False, max_concurrency: Optional[int] = None,
+                                   progress_callback: Optional[Callable] = None,
+                                   previous_results: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """
         複数の請求書を非同期でチェック
+        すべてのルール×請求書のリクエストを1スレッドのイベントループ上で実行し、
+        同時に送信するリクエスト数をセマフォで制限する
         
         Args:
             files_data: ファイルデータのリスト
             rule_ids: 適用するルールのIDリスト
+            batch_rules: Trueの場合、請求書ごとに全ルールを一括評価する
+            max_concurrency: 同時リクエスト数の上限（Noneの場合は設定値）
+            progress_callback: 進捗コールバック（completed, total, file_name）
+            previous_results: 前回のチェック結果（ファイル名をキー）。指定した場合は請求書の内容・
+                ルール更新日時・モデルが変わっていない組み合わせを再利用し、変わった組み合わせのみ評価する
             
         Returns:
-            チェック結果のリスト
+            チェック結果のリスト（files_dataの順序）
         """
-        tasks = []
-        for file_data in files_data:
-            task = asyncio.create_task(self._check_invoice_async(file_data, rule_ids))
-            tasks.append(task)
+        if max_concurrency is None:
+            max_concurrency = get_config("PROCESSING_CONFIG").get("max_concurrent_requests", 64)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        # ルールは一度だけ読み込み、全請求書で共有する
+        rules = self._load_rules(rule_ids) if rule_ids else {}
+        total = len(files_data)
+        completed = 0
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        async def run_one(index: int, file_data: Dict[str, Any]) -> Tuple[int, Any]:
+            try:
+                previous_result = (previous_results or {}).get(file_data.get("file_name"))
+                result = await self._check_invoice_async(file_data, rule_ids, batch_rules, semaphore, rules,
+                                                         previous_result)
+            except Exception as e:
+                result = e
+            return index, result
+        
+        tasks = [asyncio.create_task(run_one(i, file_data)) for i, file_data in enumerate(files_data)]
+        
+        results: List[Any] = [None] * total
+        for future in asyncio.as_completed(tasks):
+            index, result = await future
+            results[index] = result
+            completed += 1
+            if progress_callback:
+                progress_callback(completed, total, files_data[index].get("file_name", f"ファイル_{index}"))
         
         # 例外を処理
         processed_results = []
@@ -271,14 +791,46 @@ class InvoiceChecker(BaseLLMService, BaseProcessor):
         
         return processed_results
     
-    async def _check_invoice_async(self, file_data: Dict[str, Any], rule_ids: List[str]) -> Dict[str, Any]:
-        """非同期版の単一請求書チェック"""
-        loop = asyncio.get_event_loop()
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            result = await loop.run_in_executor(
-                executor, 
-                self.check_invoice, 
-                file_data, 
-                rule_ids
-            )
-        return result
\ No newline at end of file
+    async def _check_invoice_async(self, file_data: Dict[str, Any], rule_ids: List[str],
+                                   batch_rules: bool, semaphore: asyncio.Semaphore,
+                                   rules: Optional[Dict[str, Dict[str, Any]]] = None,
+                                   previous_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """非同期版の単一請求書チェック（ルールごとのリクエストを並行実行）"""
+        validation_error = self._validate_check_request(file_data, rule_ids)
+        if validation_error:
+            return validation_error
+        
+        try:
+            self.log_info(f"請求書チェック開始: {file_data.get('file_name', '不明')}")
+            
+            if rules is None:
+                rules = self._load_rules(rule_ids)
+            
+            # 入力が前回と同じ組み合わせは再利用し、変わったルールのみ評価する
+            content_hash = self.content_hash(file_data)
+            reused_checks = self._reusable_checks(previous_result, content_hash, rules)
+            pending_rules = {rule_id: rule for rule_id, rule in rules.items() if rule_id not in reused_checks}
+            
+            if batch_rules and len(pending_rules) > 1:
+                new_checks = await self._apply_rules_batch_async(file_data, pending_rules, semaphore)
+            else:
+                new_checks = await asyncio.gather(*[
+                    self._apply_rule_async(file_data, rule, semaphore) for rule in pending_rules.values()
+                ])
+            new_checks = dict(zip(pending_rules.keys(),
+                                  self._attach_provenance(list(new_checks), pending_rules, content_hash)))
+            checks = [reused_checks[rule_id] if rule_id in reused_checks else new_checks[rule_id] for rule_id in rules]
+            
+            result = {
+                "file_name": file_data.get("file_name", "不明"),
+                "checks": checks,
+                "content_hash": content_hash,
+                "reused_checks": len(reused_checks),
+                "checked_at": datetime.now().isoformat()
+            }
+            
+            self.log_info(f"請求書チェック完了: {len(checks)}件のルールを適用（再利用{len(reused_checks)}件）")
+            return result
+            
+        except Exception as e:
+            return self.handle_exception("請求書チェック", e)
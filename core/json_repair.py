@@ -0,0 +1,214 @@
+"""
+LLM出力の寛容なJSON解析（壊れたJSONの修復）
+コードフェンス・前後の説明文・末尾のカンマ・max_tokensでの途中切れに対応し、
+途中で切れた出力からも完結している要素だけを取り出す
+
+途中切れの扱い:
+- 配列: 完結している要素のみ残し、途中の要素は捨てる（results の完結した項目だけが残る）
+- オブジェクト: 完結しているメンバーと、途中で切れた配列・オブジェクトの値を残す
+- 文字列・数値・リテラル: 途中で切れたものは捨てる（数値の途中「0.」「-」「1e」で切れたものを含む）
+
+    >>> parse_json_lenient('{"results": [{"x": 1}], "confidence": 0.')
+    ({'results': [{'x': 1}]}, False)
+    >>> parse_json_lenient('{"results": [{"x": 1}], "total": -')
+    ({'results': [{'x': 1}]}, False)
+    >>> parse_json_lenient('{"results": [{"x": 1}], "total": 1e')
+    ({'results': [{'x': 1}]}, False)
+    >>> parse_json_lenient('{"results": [1, 2.5e-')
+    ({'results': [1]}, False)
+    >>> parse_json_lenient('例: {x} 結果: {"a": 1}')
+    ({'a': 1}, False)
+"""
+import json
+import re
+from typing import Any, List, Tuple
+
+_NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+# 数値の途中（「-」「0.」「1e」「1e-」など）で終わっているかの判定
+_PARTIAL_NUMBER_PATTERN = re.compile(r"-?(?:\d+(?:\.\d*)?(?:[eE][+-]?\d*)?)?")
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+
+# 解析を試みる開始位置の候補数（前置きの説明文に括弧が含まれる場合に次の候補を試す）
+_MAX_START_CANDIDATES = 5
+
+
+class JSONRepairError(json.JSONDecodeError):
+    """修復しても解析できないJSON（json.JSONDecodeErrorとして扱える）"""
+
+
+class _Parser:
+    """1回の走査で値を組み立てる再帰下降パーサー（値と完結したかを返す）"""
+
+    def __init__(self, text: str, pos: int):
+        self.text = text
+        self.pos = pos
+        # オブジェクトのメンバー・配列の要素を1つ以上読み込んだか（読み込んだ後のエラーは別の開始位置で解析し直さない）
+        self.consumed = False
+
+    def _error(self, message: str):
+        raise JSONRepairError(message, self.text, min(self.pos, len(self.text)))
+
+    def _skip_whitespace(self):
+        while self.pos < len(self.text) and self.text[self.pos] in " \t\r\n":
+            self.pos += 1
+
+    def _skip_separators(self):
+        """空白とカンマを読み飛ばす（末尾・連続したカンマを許容）"""
+        while self.pos < len(self.text) and self.text[self.pos] in " \t\r\n,":
+            self.pos += 1
+
+    def _at_end(self) -> bool:
+        return self.pos >= len(self.text)
+
+    def parse_value(self) -> Tuple[Any, bool]:
+        self._skip_whitespace()
+        if self._at_end():
+            return None, False
+
+        char = self.text[self.pos]
+        if char == "{":
+            return self._parse_object()
+        if char == "[":
+            return self._parse_array()
+        if char == '"':
+            return self._parse_string()
+        return self._parse_literal()
+
+    def _parse_object(self) -> Tuple[dict, bool]:
+        self.pos += 1
+        result = {}
+        while True:
+            self._skip_separators()
+            if self._at_end():
+                return result, False
+            if self.text[self.pos] == "}":
+                self.pos += 1
+                return result, True
+            if self.text[self.pos] != '"':
+                self._error("オブジェクトのキーが文字列ではありません")
+
+            key, complete = self._parse_string()
+            if not complete:
+                return result, False
+            self._skip_whitespace()
+            if self._at_end():
+                return result, False
+            if self.text[self.pos] != ":":
+                self._error("オブジェクトのキーの後に ':' がありません")
+            self.pos += 1
+
+            value, complete = self.parse_value()
+            if complete:
+                result[key] = value
+                self.consumed = True
+                continue
+            if isinstance(value, (dict, list)):
+                result[key] = value
+            return result, False
+
+    def _parse_array(self) -> Tuple[list, bool]:
+        self.pos += 1
+        result: List[Any] = []
+        while True:
+            self._skip_separators()
+            if self._at_end():
+                return result, False
+            if self.text[self.pos] == "]":
+                self.pos += 1
+                return result, True
+            value, complete = self.parse_value()
+            if not complete:
+                return result, False
+            result.append(value)
+            self.consumed = True
+
+    def _parse_string(self) -> Tuple[Any, bool]:
+        start = self.pos + 1
+        pos = start
+        while pos < len(self.text):
+            char = self.text[pos]
+            if char == "\\":
+                pos += 2
+                continue
+            if char == '"':
+                self.pos = pos + 1
+                raw = self.text[start:pos]
+                try:
+                    # 文字列中の生の改行などの制御文字も許容する
+                    return json.loads(f'"{raw}"', strict=False), True
+                except json.JSONDecodeError:
+                    # 不正なエスケープはそのままの文字列として扱う
+                    return raw, True
+            pos += 1
+        self.pos = len(self.text)
+        return None, False
+
+    def _parse_literal(self) -> Tuple[Any, bool]:
+        partial = _PARTIAL_NUMBER_PATTERN.match(self.text, self.pos)
+        if partial.end() > self.pos and partial.end() == len(self.text):
+            # 末尾の数値は途中で切れている可能性がある
+            self.pos = len(self.text)
+            return None, False
+
+        match = _NUMBER_PATTERN.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            return (float(number) if any(c in number for c in ".eE") else int(number)), True
+
+        for literal, value in _LITERALS.items():
+            if self.text.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value, True
+            if literal.startswith(self.text[self.pos:]):
+                # リテラルの途中で切れている
+                self.pos = len(self.text)
+                return None, False
+
+        self._error(f"解析できない値です: {self.text[self.pos:self.pos + 20]!r}")
+
+
+def parse_json_lenient(text: str, start_chars: str = "{") -> Tuple[Any, bool]:
+    """
+    LLM出力のJSONを寛容に解析
+
+    Args:
+        text: LLMの出力（コードフェンス・前後の説明文を含んでもよい）
+        start_chars: トップレベルの値の開始文字（配列も受け付ける場合は "{["）
+
+    Returns:
+        (解析した値, 途中で切れずに完結していたか)
+        最初の開始位置で解析できず次の開始位置から解析した場合は、取り違えの可能性があるため完結していても False
+
+    Raises:
+        JSONRepairError: JSONの開始位置が見つからない、または修復できない場合
+    """
+    text = text or ""
+    try:
+        return json.loads(text), True
+    except json.JSONDecodeError:
+        pass
+
+    # 最初の開始文字から解析（コードフェンス・前置きの説明文を読み飛ばす）
+    candidates = [pos for pos, char in enumerate(text) if char in start_chars][:_MAX_START_CANDIDATES]
+    if not candidates:
+        raise JSONRepairError("JSONの開始位置が見つかりません", text, 0)
+
+    last_error = None
+    for index, start in enumerate(candidates):
+        parser = _Parser(text, start)
+        try:
+            value, complete = parser.parse_value()
+        except JSONRepairError as e:
+            if parser.consumed:
+                # 構造を読み込んだ後のエラーは内側のオブジェクトを取り違えないよう次の開始位置を試さない
+                raise
+            last_error = e
+            continue
+        return value, complete and index == 0
+    raise last_error
+
+
+def loads_lenient(text: str, start_chars: str = "{") -> Any:
+    """parse_json_lenientの値のみを返す（解析できない場合はJSONRepairError）"""
+    return parse_json_lenient(text, start_chars)[0]
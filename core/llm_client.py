@@ -1,13 +1,76 @@
-import openai
 from typing import Dict, List, Any, Optional, Tuple, Callable
 import json
+import time
 from datetime import datetime
 import concurrent.futures
+import contextvars
+import hashlib
+from dataclasses import dataclass
+from functools import lru_cache
 from pydantic import ValidationError
 from .models import LLMAccountingResponse, AccountingResult, AccountingSummary
+from .base_llm_service import execute_llm_call, get_shared_rate_limiter, get_concurrency_controller, get_openai_client
+from .singleflight import get_singleflight, make_request_key
+from .structured_output import supports_structured_outputs, get_accounting_response_format
+from .tokenizer import estimate_tokens
+from .evidence_selector import EvidenceSelector, build_query_terms
+from .model_cascade import ModelCascade
+from .metrics import get_metrics, metrics_tags
+from .json_repair import parse_json_lenient
+from config import get_config
 import os
 from dotenv import load_dotenv
 
+# 証跡データの差し込み位置を示す番兵文字列（テンプレートのformat後に分割する）
+_EVIDENCE_PLACEHOLDER = "\x00EVIDENCE_DATA\x00"
+
+# 複数データをまとめて処理する場合の追加指示
+_PACKED_DATA_INSTRUCTION = """
+
+## 複数データの一括処理
+上記の証跡データには複数のデータIDが含まれています。
+データIDごとに独立して処理し、各データIDにつき結果を返してください。
+各結果の data_id には対応するデータIDをそのまま記載してください。
+"""
+
+
+@lru_cache(maxsize=2)
+def _accounting_system_prompt(include_schema: bool = True) -> str:
+    """
+    システムプロンプト（全タスク共通のため1度だけ生成）
+    strictなJSONスキーマ指定時は応答形式がAPI側で強制されるため、スキーマを埋め込まない
+    """
+    base_prompt = "あなたは経理業務の専門家です。指示に従って証跡データを分析し、正確な結果を返してください。"
+    if not include_schema:
+        return base_prompt
+    
+    response_schema = LLMAccountingResponse.model_json_schema()
+    return f"""{base_prompt}
+
+必ず以下のJSONスキーマに厳密に従った形式で回答してください：
+{json.dumps(response_schema, ensure_ascii=False, indent=2)}"""
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """
+    タスク開始時に1度だけ生成するプロンプト部品
+    データごとの処理では証跡データの整形と差し込みのみを行う
+    """
+    system_prompt: str
+    format_text: str
+    # APIに指定するresponse_format（strictなJSONスキーマ、または未対応時はjson_object）
+    response_format: Dict[str, Any]
+    # ユーザープロンプトを証跡データの位置で分割した断片
+    template_parts: Tuple[str, ...]
+    # 証跡データの関連箇所の選択に使う検索語（指示と出力列の説明から作成）
+    evidence_query: Tuple[str, ...] = ()
+    
+    def render(self, evidence_text: str) -> str:
+        """証跡データを差し込んでユーザープロンプトを生成"""
+        return evidence_text.join(self.template_parts)
+
+
 class LLMClient:
     """
     LLM統合クライアント
@@ -22,6 +85,18 @@ class LLMClient:
         self.api_key = None
         self.provider = os.getenv("OPENAI_PROVIDER", "openai")  # デフォルトはopenai
         
+        # プロセス全体で共有するレートリミッター
+        self.rate_limiter = get_shared_rate_limiter()
+        
+        # プロセス全体で共有する同時実行数の制御（max_workersは上限として扱う）
+        self.concurrency_controller = get_concurrency_controller()
+        
+        # コンパイル済みプロンプト（指示・タスク設定・出力設定ごと）
+        self._compiled_prompts: Dict[str, CompiledPrompt] = {}
+        
+        # 長い証跡データから関連箇所をトークン予算内で選択
+        self.evidence_selector = EvidenceSelector()
+        
         # プロバイダーに応じた設定
         if self.provider == "azure":
             self.model = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1")
@@ -29,6 +104,12 @@ class LLMClient:
             self.azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
         else:
             self.model = "gpt-4.1"  # GPT-4.1相当
+        
+        # strictなJSONスキーマで応答形式を指定（旧APIバージョンのAzureではjson_objectにフォールバック）
+        self.use_structured_outputs = supports_structured_outputs(self.provider, getattr(self, "azure_api_version", None))
+        
+        # 小さいモデルでの先行処理と段階別の集計
+        self.cascade = ModelCascade(self.model, self.provider)
     
     def set_api_key(self, api_key: str = None):
         """APIキーを設定"""
@@ -44,20 +125,49 @@ class LLMClient:
         if not self.api_key:
             raise ValueError("APIキーが設定されていません。環境変数または引数で指定してください。")
         
-        # プロバイダーに応じてクライアントを初期化
+        # プロバイダー・認証情報ごとに共有するクライアントを使用
+        self.client = self._get_client(self.api_key)
+    
+    def _get_client(self, api_key: str):
+        """プロバイダーに応じた共有クライアントを取得"""
         if self.provider == "azure":
-            self.client = openai.AzureOpenAI(
-                api_key=self.api_key,
-                azure_endpoint=self.azure_endpoint,
-                api_version=self.azure_api_version
+            return get_openai_client(self.provider, api_key, self.azure_endpoint, self.azure_api_version)
+        return get_openai_client(self.provider, api_key)
+    
+    def _request_key(self, messages: List[Dict[str, Any]], response_format: Dict[str, Any],
+                     model: Optional[str] = None) -> str:
+        """同一リクエストの集約に使うキー（認証情報が異なる呼び出しは集約しない）"""
+        return make_request_key(model or self.model, messages, response_format=response_format, temperature=0,
+                                provider=self.provider, api_key=self.api_key)
+    
+    def _create_completion(self, messages: List[Dict[str, Any]], response_format: Dict[str, Any],
+                           model: Optional[str] = None, max_completion_tokens: Optional[int] = None) -> Any:
+        """
+        共有レートリミッター経由でChat Completionsを呼び出す
+        modelを省略した場合は主モデル。トークン数・所要時間はカスケードの段階別に集計する
+        """
+        model = model or self.model
+        started_at = time.monotonic()
+        with metrics_tags(model=model):
+            response = execute_llm_call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0,
+                    response_format=response_format
+                ),
+                messages,
+                max_completion_tokens=max_completion_tokens,
+                coalesce_key=self._request_key(messages, response_format, model)
             )
-        else:
-            self.client = openai.OpenAI(api_key=self.api_key)
+        self.cascade.record(model, response.usage.total_tokens, time.monotonic() - started_at)
+        return response
     
     def process_accounting_task(self, instruction: str, evidence_data: Dict[str, Any], 
                               output_format: Dict[str, Any], task_config: Dict[str, Any] = None,
                               max_workers: int = 3,
-                              progress_callback: Optional[Callable] = None) -> Dict[str, Any]:
+                              progress_callback: Optional[Callable] = None,
+                              pack_items: Optional[bool] = None) -> Dict[str, Any]:
         """
         経理業務タスクを処理（データごとに並列処理）
         
@@ -65,10 +175,11 @@ class LLMClient:
             instruction: ユーザーからの指示
             evidence_data: 証跡データ
             output_format: 出力フォーマット定義
-            max_workers: 最大並列処理数
+            max_workers: 最大並列処理数（同時実行数の自動調整が有効な場合はその上限）
+            pack_items: 小さなデータを複数まとめて1リクエストで処理するか（Noneの場合は設定値）
             
         Returns:
-            処理結果
+            処理結果（cascade_statsにモデルの段階別のトークン数・所要時間）
         """
         try:
             if not self.client:
@@ -79,8 +190,43 @@ class LLMClient:
             
             data_items = list(evidence_data["data"].items())
             total_data_count = len(data_items)
+            self.cascade.reset_stats()
+            # 共有の統計はリセットせず、開始時点からの増分を今回の実行分として集計する
+            concurrency_since = self.concurrency_controller.get_stats()
+            coalesce_since = get_singleflight().get_stats()
             
-            print(f"並列処理開始: {total_data_count}件のデータを{max_workers}並列で処理")
+            if self.concurrency_controller.enabled:
+                print(f"並列処理開始: {total_data_count}件のデータを最大{max_workers}並列で処理"
+                      f"（自動調整、現在{self.concurrency_controller.limit}並列）")
+            else:
+                print(f"並列処理開始: {total_data_count}件のデータを{max_workers}並列で処理")
+            
+            processing_config = get_config("PROCESSING_CONFIG")
+            if pack_items is None:
+                pack_items = processing_config.get("pack_items", False)
+            
+            # プロンプトの固定部分はタスク開始時に1度だけ生成
+            compiled_prompt = self.get_compiled_prompt(instruction, output_format, task_config)
+            
+            # データごとの証跡テキスト（パッキングの見積もりとリクエストで共用）
+            evidence_texts = {}
+            if pack_items:
+                packed_prompt = self.get_compiled_prompt(instruction, output_format, task_config, packed=True)
+                for data_id, data_entry in data_items:
+                    evidence_texts[data_id] = self._format_evidence_data(
+                        {"success": True, "data": {data_id: data_entry}}, packed_prompt.evidence_query
+                    )
+                packs = self._pack_data_items(
+                    [data_id for data_id, _ in data_items],
+                    evidence_texts,
+                    packed_prompt,
+                    processing_config.get("pack_token_budget", 8000),
+                    processing_config.get("max_items_per_pack", 10)
+                )
+                print(f"データパッキング: {total_data_count}件を{len(packs)}リクエストにまとめて処理")
+            else:
+                packed_prompt = None
+                packs = [[data_id] for data_id, _ in data_items]
             
             all_results = []
             total_tokens = 0
@@ -89,34 +235,38 @@ class LLMClient:
             
             # 並列処理で実行
             with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 各データの処理タスクを作成
+                # 各データ（パック）の処理タスクを作成
                 future_to_data = {}
                 
-                for data_id, data_entry in data_items:
-                    single_data_evidence = {
-                        "success": True,
-                        "data": {data_id: data_entry},
-                        "metadata": evidence_data.get("metadata", {})
-                    }
-                    
+                for pack in packs:
+                    # 呼び出し元のメトリクスのタグ（run等）をワーカースレッドに引き継ぐ
                     future = executor.submit(
-                        self._process_single_data,
-                        instruction, 
-                        single_data_evidence, 
-                        output_format, 
-                        data_id,
-                        task_config
+                        contextvars.copy_context().run,
+                        self._process_with_cascade,
+                        instruction,
+                        evidence_data,
+                        output_format,
+                        pack,
+                        task_config,
+                        evidence_texts,
+                        compiled_prompt,
+                        packed_prompt
                     )
-                    future_to_data[future] = data_id
+                    future_to_data[future] = pack
                 
                 # 結果を完了順に収集
                 completed_count = 0
                 for future in concurrent.futures.as_completed(future_to_data):
-                    data_id = future_to_data[future]
-                    completed_count += 1
+                    pack = future_to_data[future]
                     
                     try:
-                        single_result = future.result()
+                        pack_results = future.result()
+                    except Exception as e:
+                        pack_results = {data_id: {"success": False, "error": f"並列処理エラー - {str(e)}"} for data_id in pack}
+                    
+                    for data_id in pack:
+                        single_result = pack_results.get(data_id, {"success": False, "error": "処理結果がありません"})
+                        completed_count += 1
                         
                         if single_result["success"]:
                             # 結果を集約
@@ -135,10 +285,6 @@ class LLMClient:
                         # 進捗コールバックを呼び出し
                         if progress_callback:
                             progress_callback(completed_count, total_data_count, data_id)
-                        
-                    except Exception as e:
-                        processing_errors.append(f"データ {data_id}: 並列処理エラー - {str(e)}")
-                        print(f"エラー発生: {completed_count}/{total_data_count} ({data_id}) - {str(e)}")
             
             # 集約結果を作成
             def _extract_amount_from_result(result: Dict[str, Any]) -> float:
@@ -187,7 +333,10 @@ class LLMClient:
                 "raw_responses": raw_responses,  # 各データのRAWレスポンスを追加
                 "processed_at": datetime.now().isoformat(),
                 "tokens_used": total_tokens,
-                "processing_errors": processing_errors
+                "processing_errors": processing_errors,
+                "concurrency_stats": self.concurrency_controller.get_stats(since=concurrency_since),
+                "coalesce_stats": get_singleflight().get_stats(since=coalesce_since),
+                "cascade_stats": self.cascade.get_stats()
             }
             
         except Exception as e:
@@ -196,8 +345,48 @@ class LLMClient:
                 "error": f"LLM並列処理エラー: {str(e)}"
             }
     
+    def _process_with_cascade(self, instruction: str, evidence_data: Dict[str, Any], output_format: Dict[str, Any],
+                              data_ids: List[str], task_config: Dict[str, Any], evidence_texts: Dict[str, str],
+                              compiled_prompt: CompiledPrompt,
+                              packed_prompt: Optional[CompiledPrompt]) -> Dict[str, Dict[str, Any]]:
+        """
+        データ（パック）を処理
+        カスケード有効時は小さいモデルで先に処理し、要確認・確信度が低い・検証エラーのデータのみ
+        主モデルで個別に再処理する
+        
+        Returns:
+            データIDをキーとした処理結果（_process_single_dataと同じ形式）
+        """
+        results = self._process_pack(
+            instruction, evidence_data, output_format, data_ids, task_config,
+            evidence_texts, compiled_prompt, packed_prompt, model=self.cascade.first_model()
+        )
+        if not self.cascade.active:
+            return results
+        
+        for data_id in data_ids:
+            first_pass_result = results.get(data_id, {})
+            escalation_reason = self.cascade.accounting_escalation_reason(first_pass_result)
+            self.cascade.record_first_pass(escalation_reason)
+            if escalation_reason is None:
+                continue
+            
+            print(f"主モデルで再処理: {data_id}（{escalation_reason}）")
+            result = self._process_pack(
+                instruction, evidence_data, output_format, [data_id], task_config,
+                evidence_texts, compiled_prompt, packed_prompt, model=self.model
+            )[data_id]
+            result["escalated"] = escalation_reason
+            # 使用トークンは両段階の合計
+            result["tokens_used"] = result.get("tokens_used", 0) + first_pass_result.get("tokens_used", 0)
+            results[data_id] = result
+        
+        return results
+    
     def _process_single_data(self, instruction: str, single_data_evidence: Dict[str, Any], 
-                           output_format: Dict[str, Any], data_id: str, task_config: Dict[str, Any] = None) -> Dict[str, Any]:
+                           output_format: Dict[str, Any], data_id: str, task_config: Dict[str, Any] = None,
+                           compiled_prompt: Optional[CompiledPrompt] = None,
+                           model: Optional[str] = None) -> Dict[str, Any]:
         """
         単一データを処理
         
@@ -206,72 +395,87 @@ class LLMClient:
             single_data_evidence: 単一データの証跡データ
             output_format: 出力フォーマット定義
             data_id: データID
+            compiled_prompt: コンパイル済みプロンプト（Noneの場合はキャッシュから取得）
+            model: 使用するモデル（Noneの場合は主モデル）
             
         Returns:
             処理結果
         """
         try:
-            # プロンプトを構築
-            prompt = self._build_accounting_prompt(instruction, single_data_evidence, output_format, task_config)
-            
-            # レスポンススキーマを追加
-            response_schema = LLMAccountingResponse.model_json_schema()
-            
-            # GPT-4.1で処理（構造化出力を要求）
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            with metrics_tags(service="LLMClient", task=(task_config or {}).get("name"), data_id=data_id):
+                if compiled_prompt is None:
+                    compiled_prompt = self.get_compiled_prompt(instruction, output_format, task_config)
+                
+                # データごとに必要なのは証跡データの整形と差し込みのみ
+                prompt = compiled_prompt.render(
+                    self._format_evidence_data(single_data_evidence, compiled_prompt.evidence_query)
+                )
+                
+                messages = [
                     {
                         "role": "system",
-                        "content": f"""あなたは経理業務の専門家です。指示に従って証跡データを分析し、正確な結果を返してください。
-
-必ず以下のJSONスキーマに厳密に従った形式で回答してください：
-{json.dumps(response_schema, ensure_ascii=False, indent=2)}"""
+                        "content": compiled_prompt.system_prompt
                     },
                     {
                         "role": "user", 
                         "content": prompt
                     }
-                ],
-                temperature=0,
-                response_format={"type": "json_object"}
-            )
-            
-            # レスポンスを解析
-            result_text = response.choices[0].message.content
-            
-            # Pydanticモデルで検証とパース
-            try:
-                # JSONパース
-                json_data = json.loads(result_text)
+                ]
                 
-                # Pydanticモデルで検証
-                validated_response = LLMAccountingResponse(**json_data)
+                # GPT-4.1で処理（strictなJSONスキーマで構造化出力を要求、共有レートリミッター経由）
+                response = self._create_completion(messages, compiled_prompt.response_format, model)
                 
-                # データIDが設定されていない場合は設定
-                for result in validated_response.results:
-                    if not result.data_id:
-                        result.data_id = data_id
+                # レスポンスを解析
+                result_text = response.choices[0].message.content
                 
-                return {
-                    "success": True,
-                    "data": validated_response.model_dump(),
-                    "raw_response": result_text,
-                    "processed_at": datetime.now().isoformat(),
-                    "tokens_used": response.usage.total_tokens
-                }
-                
-            except (json.JSONDecodeError, ValidationError) as e:
-                # 型検証に失敗した場合はフォールバック
-                fallback_data = self._create_fallback_response(result_text, data_id, str(e))
-                return {
-                    "success": False,
-                    "data": fallback_data,
-                    "raw_response": result_text,
-                    "error": f"レスポンス検証エラー: {str(e)}",
-                    "processed_at": datetime.now().isoformat(),
-                    "tokens_used": response.usage.total_tokens
-                }
+                # Pydanticモデルで検証とパース
+                try:
+                    # JSONパース
+                    json_data = json.loads(result_text)
+                    
+                    # Pydanticモデルで検証
+                    validated_response = LLMAccountingResponse(**json_data)
+                    
+                    # データIDが設定されていない場合は設定
+                    for result in validated_response.results:
+                        if not result.data_id:
+                            result.data_id = data_id
+                    
+                    return {
+                        "success": True,
+                        "data": validated_response.model_dump(),
+                        "raw_response": result_text,
+                        "processed_at": datetime.now().isoformat(),
+                        "tokens_used": response.usage.total_tokens,
+                        "model": model or self.model
+                    }
+                    
+                except (json.JSONDecodeError, ValidationError) as e:
+                    get_metrics().record_validation_failure(str(e))
+                    
+                    # 壊れた・途中で切れたJSONから完結している結果を取り出せた場合は再実行せずに採用
+                    salvaged_data = self._salvage_accounting_response(result_text, data_id)
+                    if salvaged_data:
+                        return {
+                            "success": True,
+                            "data": salvaged_data,
+                            "raw_response": result_text,
+                            "repaired": True,
+                            "processed_at": datetime.now().isoformat(),
+                            "tokens_used": response.usage.total_tokens,
+                            "model": model or self.model
+                        }
+                    
+                    # 型検証に失敗した場合はフォールバック
+                    fallback_data = self._create_fallback_response(result_text, data_id, str(e))
+                    return {
+                        "success": False,
+                        "data": fallback_data,
+                        "raw_response": result_text,
+                        "error": f"レスポンス検証エラー: {str(e)}",
+                        "processed_at": datetime.now().isoformat(),
+                        "tokens_used": response.usage.total_tokens
+                    }
             
         except Exception as e:
             return {
@@ -279,16 +483,210 @@ class LLMClient:
                 "error": f"データ {data_id} のLLM処理エラー: {str(e)}"
             }
     
-    def _build_accounting_prompt(self, instruction: str, evidence_data: Dict[str, Any], 
-                               output_format: Dict[str, Any], task_config: Dict[str, Any] = None) -> str:
-        """経理業務用のプロンプトを構築"""
+    def _pack_data_items(self, data_ids: List[str], evidence_texts: Dict[str, str],
+                         packed_prompt: CompiledPrompt, token_budget: int, max_items: int) -> List[List[str]]:
+        """
+        データを入力トークン予算内に収まるようにまとめる（First-Fit Decreasing）
         
-        # 証跡データを文字列化
-        evidence_text = self._format_evidence_data(evidence_data)
+        Args:
+            data_ids: データIDのリスト
+            evidence_texts: データIDごとの整形済み証跡テキスト
+            packed_prompt: 一括処理用のコンパイル済みプロンプト
+            token_budget: 1リクエストあたりの入力トークン予算
+            max_items: 1リクエストにまとめる最大データ数
+            
+        Returns:
+            データIDのリストのリスト（予算を単独で超えるデータは1件のみのパック）
+        """
+        fixed_tokens = estimate_tokens(packed_prompt.system_prompt) + estimate_tokens("".join(packed_prompt.template_parts))
+        available_tokens = max(token_budget - fixed_tokens, 0)
+        order = {data_id: index for index, data_id in enumerate(data_ids)}
+        
+        sized_items = sorted(
+            ((estimate_tokens(evidence_texts[data_id]), data_id) for data_id in data_ids),
+            key=lambda item: (-item[0], order[item[1]])
+        )
+        
+        packs = []  # [残りトークン, データIDのリスト]
+        for tokens, data_id in sized_items:
+            for pack in packs:
+                if pack[0] >= tokens and len(pack[1]) < max_items:
+                    pack[0] -= tokens
+                    pack[1].append(data_id)
+                    break
+            else:
+                packs.append([available_tokens - tokens, [data_id]])
+        
+        # パック内・パック間とも元の順序に揃える
+        packed_ids = [sorted(ids, key=order.get) for _, ids in packs]
+        return sorted(packed_ids, key=lambda ids: order[ids[0]])
+    
+    def _process_pack(self, instruction: str, evidence_data: Dict[str, Any], output_format: Dict[str, Any],
+                      data_ids: List[str], task_config: Dict[str, Any], evidence_texts: Dict[str, str],
+                      compiled_prompt: CompiledPrompt, packed_prompt: Optional[CompiledPrompt],
+                      model: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        複数データを1リクエストで処理し、結果をデータIDごとに振り分ける
+        検証に失敗したデータはパックを分割して再処理し、1件になった場合は個別処理する
+        （packed_promptはデータが2件以上の場合のみ使用、modelがNoneの場合は主モデル）
+        
+        Returns:
+            データIDをキーとした処理結果（_process_single_dataと同じ形式）
+        """
+        if len(data_ids) == 1:
+            data_id = data_ids[0]
+            single_data_evidence = {
+                "success": True,
+                "data": {data_id: evidence_data["data"][data_id]},
+                "metadata": evidence_data.get("metadata", {})
+            }
+            return {data_id: self._process_single_data(
+                instruction, single_data_evidence, output_format, data_id, task_config, compiled_prompt, model
+            )}
+        
+        results = {}
+        failed_ids = list(data_ids)
+        try:
+            with metrics_tags(service="LLMClient", task=(task_config or {}).get("name"), data_id=",".join(data_ids)):
+                prompt = packed_prompt.render("\n".join(evidence_texts[data_id] for data_id in data_ids))
+                messages = [
+                    {"role": "system", "content": packed_prompt.system_prompt},
+                    {"role": "user", "content": prompt}
+                ]
+                completion_tokens = get_config("RATE_LIMIT_CONFIG").get("default_completion_tokens", 1000) * len(data_ids)
+                
+                response = self._create_completion(messages, packed_prompt.response_format, model,
+                                                   max_completion_tokens=completion_tokens)
+                result_text = response.choices[0].message.content
+                
+                grouped_results, failed_ids = self._demultiplex_pack_response(result_text, data_ids)
+                
+                # パック全体のトークン数は成功したデータに按分する
+                tokens_used = response.usage.total_tokens
+                processed_at = datetime.now().isoformat()
+                for index, (data_id, items) in enumerate(grouped_results.items()):
+                    share = tokens_used // len(grouped_results) + (tokens_used % len(grouped_results) if index == 0 else 0)
+                    results[data_id] = {
+                        "success": True,
+                        "data": {"results": items},
+                        "raw_response": result_text,
+                        "processed_at": processed_at,
+                        "tokens_used": share,
+                        "model": model or self.model
+                    }
+        except Exception as e:
+            print(f"パック処理エラー（{len(data_ids)}件）: {str(e)}")
+        
+        if failed_ids:
+            print(f"パック内の{len(failed_ids)}/{len(data_ids)}件が検証に失敗したため分割して再処理します")
+            get_metrics().record_validation_failure(
+                f"パック内の{len(failed_ids)}/{len(data_ids)}件の結果が欠落・検証エラー",
+                service="LLMClient", task=(task_config or {}).get("name"), data_id=",".join(failed_ids)
+            )
+            if len(failed_ids) == len(data_ids):
+                middle = len(failed_ids) // 2
+                subsets = [failed_ids[:middle], failed_ids[middle:]]
+            else:
+                subsets = [failed_ids]
+            for subset in subsets:
+                results.update(self._process_pack(
+                    instruction, evidence_data, output_format, subset, task_config,
+                    evidence_texts, compiled_prompt, packed_prompt, model
+                ))
+        
+        return results
+    
+    def _demultiplex_pack_response(self, result_text: str, data_ids: List[str]) -> Tuple[Dict[str, List[Dict[str, Any]]], List[str]]:
+        """
+        一括処理のレスポンスをデータIDごとに振り分けて検証
+        
+        Returns:
+            (検証に成功したデータIDごとの結果リスト, 結果が欠落・検証エラーのデータIDリスト)
+        """
+        # 壊れた・途中で切れたJSONも完結している結果までは解析する
+        json_data, complete = parse_json_lenient(result_text)
+        
+        grouped_results = {data_id: [] for data_id in data_ids}
+        invalid_ids = set()
+        items = json_data.get("results", []) if isinstance(json_data, dict) else []
+        items = items if isinstance(items, list) else []
+        for item in items:
+            data_id = item.get("data_id") if isinstance(item, dict) else None
+            if data_id not in grouped_results:
+                continue
+            try:
+                grouped_results[data_id].append(AccountingResult(**item).model_dump())
+            except ValidationError:
+                invalid_ids.add(data_id)
+        
+        if not complete and items and isinstance(items[-1], dict):
+            # 途中で切れた場合、最後のデータは続きの結果が欠けている可能性があるため再処理する
+            invalid_ids.add(items[-1].get("data_id"))
+        
+        valid_results = {
+            data_id: items for data_id, items in grouped_results.items()
+            if items and data_id not in invalid_ids
+        }
+        failed_ids = [data_id for data_id in data_ids if data_id not in valid_results]
+        return valid_results, failed_ids
+    
+    def get_compiled_prompt(self, instruction: str, output_format: Dict[str, Any],
+                            task_config: Dict[str, Any] = None, packed: bool = False) -> CompiledPrompt:
+        """
+        指示・タスク設定・出力設定に対応するコンパイル済みプロンプトを取得（初回のみ生成）
+        
+        Args:
+            instruction: ユーザーからの指示
+            output_format: 出力フォーマット定義
+            task_config: タスク設定
+            packed: 複数データをまとめて処理する場合の指示・スキーマにするか
+            
+        Returns:
+            コンパイル済みプロンプト
+        """
+        template = (task_config or {}).get("processing_prompt_template")
+        key_source = json.dumps([instruction, template, output_format, packed], ensure_ascii=False, sort_keys=True, default=str)
+        cache_key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()
         
-        # 出力フォーマットを文字列化
-        format_text = self._format_output_specification(output_format)
+        compiled = self._compiled_prompts.get(cache_key)
+        if compiled is None:
+            compiled = self._compile_prompt(instruction, output_format, task_config, packed)
+            self._compiled_prompts[cache_key] = compiled
+        return compiled
+    
+    def _compile_prompt(self, instruction: str, output_format: Dict[str, Any],
+                        task_config: Dict[str, Any] = None, packed: bool = False) -> CompiledPrompt:
+        """証跡データ以外のプロンプト部品を生成"""
+        if self.use_structured_outputs:
+            response_format = get_accounting_response_format(output_format["column_definitions"], include_data_id=packed)
+        else:
+            response_format = {"type": "json_object"}
+        
+        # 出力フォーマットを文字列化（strict指定時はJSON例を省略）
+        format_text = self._format_output_specification(output_format, include_example=not self.use_structured_outputs)
+        
+        # 証跡データの位置に番兵を入れてテンプレートを展開し、その位置で分割する
+        template_text = self._render_prompt_template(instruction, _EVIDENCE_PLACEHOLDER, format_text, task_config)
+        if packed:
+            template_text += _PACKED_DATA_INSTRUCTION
         
+        return CompiledPrompt(
+            system_prompt=_accounting_system_prompt(include_schema=not self.use_structured_outputs),
+            format_text=format_text,
+            response_format=response_format,
+            template_parts=tuple(template_text.split(_EVIDENCE_PLACEHOLDER)),
+            evidence_query=build_query_terms(instruction, output_format)
+        )
+    
+    def _build_accounting_prompt(self, instruction: str, evidence_data: Dict[str, Any], 
+                               output_format: Dict[str, Any], task_config: Dict[str, Any] = None) -> str:
+        """経理業務用のプロンプトを構築"""
+        compiled_prompt = self.get_compiled_prompt(instruction, output_format, task_config)
+        return compiled_prompt.render(self._format_evidence_data(evidence_data, compiled_prompt.evidence_query))
+    
+    def _render_prompt_template(self, instruction: str, evidence_text: str, format_text: str,
+                                task_config: Dict[str, Any] = None) -> str:
+        """プロンプトテンプレートに値を代入"""
         # タスク設定のプロンプトテンプレートを使用
         if task_config and "processing_prompt_template" in task_config:
             # テンプレートに値を代入
@@ -322,6 +720,7 @@ class LLMClient:
 - 金額は数値として正確に抽出してください
 - 日付形式は統一してください（YYYY-MM-DD）
 - 照合結果は「一致」「不一致」「要確認」のいずれかで判定してください
+- confidence には結果の確信度を0〜1で記載してください
 - 計算結果に端数がある場合の処理方法を明記してください
 
 結果をJSON形式で返してください：
@@ -329,8 +728,11 @@ class LLMClient:
         
         return prompt
     
-    def _format_evidence_data(self, evidence_data: Dict[str, Any]) -> str:
-        """証跡データを読みやすい形式に整形"""
+    def _format_evidence_data(self, evidence_data: Dict[str, Any], query_terms: Tuple[str, ...] = ()) -> str:
+        """
+        証跡データを読みやすい形式に整形
+        データごとの内容がトークン予算を超える場合は、検索語との関連度が高い区画のみを含める
+        """
         formatted_text = []
         
         if evidence_data.get("success") and "data" in evidence_data:
@@ -339,26 +741,36 @@ class LLMClient:
                 formatted_text.append(f"ドキュメント数: {data_entry.get('document_count', 0)}")
                 
                 if "documents" in data_entry:
+                    selections = self.evidence_selector.select(
+                        {doc_name: doc_info["content"] for doc_name, doc_info in data_entry["documents"].items()
+                         if doc_info.get("content")},
+                        query_terms
+                    )
+                    
                     for doc_name, doc_info in data_entry["documents"].items():
                         formatted_text.append(f"\n#### ドキュメント: {doc_name}")
                         formatted_text.append(f"タイプ: {doc_info.get('type', '不明')}")
                         formatted_text.append(f"拡張子: {doc_info.get('extension', '不明')}")
                         
                         # 実際のドキュメント内容がある場合は追加
-                        if "content" in doc_info and doc_info["content"]:
-                            content = doc_info["content"]
-                            # 長すぎる場合は適切に切り詰める（PDFは5000文字、その他は全文）
-                            if doc_info.get('extension') == '.pdf' and len(content) > 5000:
-                                formatted_text.append(f"内容（最初の5000文字）:\n{content[:5000]}...\n[以下省略]")
+                        if doc_name in selections:
+                            selection = selections[doc_name]
+                            if not selection["truncated"]:
+                                formatted_text.append(f"内容:\n{selection['content']}")
+                            elif selection["selected_chunks"]:
+                                formatted_text.append(
+                                    f"内容（関連箇所の抜粋: {selection['selected_chunks']}/{selection['total_chunks']}区画）:\n"
+                                    f"{selection['content']}"
+                                )
                             else:
-                                formatted_text.append(f"内容:\n{content}")
+                                formatted_text.append("内容: [トークン予算超過のため省略]")
                         else:
                             formatted_text.append("内容: [コンテンツなし]")
         
         return "\n".join(formatted_text) if formatted_text else "証跡データが見つかりません"
     
-    def _format_output_specification(self, output_format: Dict[str, Any]) -> str:
-        """出力フォーマット仕様を文字列化"""
+    def _format_output_specification(self, output_format: Dict[str, Any], include_example: bool = True) -> str:
+        """出力フォーマット仕様を文字列化（include_exampleがFalseの場合は列定義のみ）"""
         format_lines = []
         
         # 列定義を出力
@@ -369,6 +781,9 @@ class LLMClient:
             if "description" in col_def:
                 format_lines.append(f"  説明: {col_def['description']}")
         
+        if not include_example:
+            return "\n".join(format_lines)
+        
         format_lines.append("\nJSON形式例:")
         
         # 出力キーを取得（row_numberは除外）
@@ -400,41 +815,64 @@ class LLMClient:
         
         return "\n".join(format_lines)
     
+    def _salvage_accounting_response(self, response_text: str, data_id: str) -> Optional[Dict[str, Any]]:
+        """
+        検証に失敗したレスポンスから完結している結果を取り出す
+        コードフェンス・末尾のカンマ・max_tokensでの途中切れを修復し、結果を1件ずつ検証する
+        
+        Returns:
+            LLMAccountingResponse形式の辞書（結果が1件もない・検証エラーの結果を含む場合はNone）
+        """
+        try:
+            json_data, complete = parse_json_lenient(response_text)
+        except json.JSONDecodeError:
+            return None
+        
+        items = json_data.get("results") if isinstance(json_data, dict) else None
+        if not isinstance(items, list):
+            return None
+        
+        results = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                result = AccountingResult(**item)
+            except ValidationError:
+                return None
+            if not result.data_id:
+                result.data_id = data_id
+            results.append(result.model_dump())
+        if not results:
+            return None
+        
+        try:
+            summary = AccountingSummary(**json_data.get("summary", {})).model_dump()
+        except (TypeError, ValidationError):
+            summary = AccountingSummary(total_processed=len(results)).model_dump()
+        
+        processing_notes = json_data.get("processing_notes")
+        if not complete:
+            processing_notes = "出力が途中で切れたため、完結している結果のみ採用しました"
+        
+        return {
+            "results": results,
+            "summary": summary,
+            "processing_notes": processing_notes if isinstance(processing_notes, str) else None
+        }
+    
     def _create_fallback_response(self, response_text: str, data_id: str, error_message: str) -> Dict[str, Any]:
         """検証エラー時のフォールバックレスポンスを作成"""
-        # 従来の文字列パース処理を試みる
+        # 寛容なJSON解析で取り出せる内容を返す
         try:
-            # JSONブロックを探す
-            start_markers = ["```json", "```", "{"]
-            json_start = -1
-            
-            for marker in start_markers:
-                pos = response_text.find(marker)
-                if pos != -1:
-                    if marker == "{":
-                        json_start = pos
-                    else:
-                        json_start = pos + len(marker)
-                    break
-            
-            if json_start == -1:
-                json_start = 0
-            
-            # JSON終了位置を探す
-            remaining_text = response_text[json_start:]
-            last_brace = remaining_text.rfind("}")
-            json_end = json_start + last_brace + 1 if last_brace != -1 else len(response_text)
-            
-            # JSON部分を抽出
-            json_text = response_text[json_start:json_end].strip()
-            
-            # JSONパース
-            result = json.loads(json_text)
+            result, _ = parse_json_lenient(response_text)
+            if not isinstance(result, dict):
+                raise ValueError("JSONオブジェクトではありません")
             
             # データIDを設定
-            if "results" in result:
+            if isinstance(result.get("results"), list):
                 for item in result["results"]:
-                    if "data_id" not in item:
+                    if isinstance(item, dict) and "data_id" not in item:
                         item["data_id"] = data_id
             
             return result
@@ -470,15 +908,8 @@ class LLMClient:
             if not test_api_key:
                 return False, "APIキーが設定されていません"
             
-            # プロバイダーに応じてクライアントを作成
-            if self.provider == "azure":
-                temp_client = openai.AzureOpenAI(
-                    api_key=test_api_key,
-                    azure_endpoint=self.azure_endpoint,
-                    api_version=self.azure_api_version
-                )
-            else:
-                temp_client = openai.OpenAI(api_key=test_api_key)
+            # プロバイダーに応じたクライアントを取得
+            temp_client = self._get_client(test_api_key)
             
             # 簡単なテストリクエスト
             response = temp_client.chat.completions.create(
@@ -0,0 +1,317 @@
+"""
+ローカルでのルール事前判定
+金額の計算（税抜金額＋消費税額＝税込金額、消費税率）や期末日による日付のカットオフのように
+正規表現での抽出と計算で判定できるルールはLLMを呼び出さずに評価する。
+抽出結果が曖昧な場合（候補が複数・項目不足・複数税率など）はNoneを返し、LLMでの評価に委ねる
+"""
+import re
+import unicodedata
+from datetime import date
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config import get_config
+
+# ルールのlocal_checkに指定できる判定の種類
+LOCAL_CHECK_TYPES = {
+    "amount_consistency": "金額整合性（税抜金額＋消費税額＝税込金額、消費税率）",
+    "date_cutoff": "日付カットオフ（請求日が期末日以前か）"
+}
+
+_AMOUNT_LABELS = {
+    "subtotal": ["税抜金額", "税抜合計", "課税対象額", "本体価格", "税抜", "小計"],
+    "tax": ["消費税額", "消費税", "税額"],
+    "total": ["税込金額", "税込合計", "ご請求金額", "請求金額", "合計金額", "総額", "合計"]
+}
+_LABEL_CATEGORY = {label: category for category, labels in _AMOUNT_LABELS.items() for label in labels}
+
+# 明細の小計・数量の合計などにも使われる汎用的な見出し
+# （金額が一致しない場合、これらの見出しで抽出した金額ではエラーと判定せずLLMに委ねる）
+_GENERIC_AMOUNT_LABELS = {"小計", "合計", "税額"}
+
+# 見出しの後、金額までの間に許容する文字（税率表記「10%」を含む、数字・改行以外）と金額の後の単位
+_AMOUNT_PATTERN = re.compile(
+    "(?P<label>" + "|".join(sorted(_LABEL_CATEGORY, key=len, reverse=True)) + ")"
+    r"(?P<gap>(?:[^\d\n]|\d{1,2}(?:\.\d+)?\s*%){0,20}?)"
+    r"(?P<amount>\d{1,3}(?:,\d{3})+|\d+)(?![\d,]|\s*%)"
+    r"(?:\s*(?P<unit>[円年月日本個点件]))?"
+)
+# 見出しと金額の間が区切り文字のみの場合は単位がなくても金額とみなす
+_AMOUNT_SEPARATOR_PATTERN = re.compile(r"[\s:=\-、]*")
+# 金額ではない数値（日付・数量）の単位
+_NON_AMOUNT_UNITS = set("年月日本個点件")
+# 消費税率の見出しの直後（数字・改行以外の8文字以内）に記載された税率
+_TAX_RATE_PATTERN = re.compile(r"(?:消費税|税率)[^\d\n]{0,8}?(\d{1,2}(?:\.\d+)?)\s*%")
+# 消費税以外の税・割引の率が記載される行（源泉所得税・延滞税・割引率）
+_NON_CONSUMPTION_TAX_KEYWORDS = ("源泉", "延滞", "割引")
+
+_DATE_PATTERNS = [
+    re.compile(r"(?P<year>\d{4})\s*[年/\-.]\s*(?P<month>\d{1,2})\s*[月/\-.]\s*(?P<day>\d{1,2})"),
+    re.compile(r"令和\s*(?P<reiwa>\d{1,2}|元)\s*年\s*(?P<month>\d{1,2})\s*月\s*(?P<day>\d{1,2})")
+]
+_INVOICE_DATE_LABELS = ["請求年月日", "発行年月日", "請求書日付", "請求日", "発行日"]
+_PERIOD_END_LABELS = ["期末日", "決算日"]
+_TRANSACTION_DATE_LABELS = ["役務提供日", "作業完了日", "納品日", "納入日", "検収日", "取引日"]
+
+_ROUNDING_MODES = {"floor": ROUND_FLOOR, "round": ROUND_HALF_UP, "ceil": ROUND_CEILING}
+
+
+def _normalize(text: str) -> str:
+    """全角数字・記号を半角に統一"""
+    return unicodedata.normalize("NFKC", text or "")
+
+
+def _find_labeled_amounts(text: str) -> List[Tuple[str, str, int]]:
+    """
+    見出し付きの金額を抽出
+
+    金額とみなすのは「円」が続く・「¥」が前にある・見出しの直後（区切り文字のみを挟む）の数値で、
+    日付・数量の単位（年・月・日・本・個・点・件）が続く数値は除く
+
+    Returns:
+        (subtotal / tax / total, 見出し, 金額) のリスト
+    """
+    found = []
+    for match in _AMOUNT_PATTERN.finditer(_normalize(text)):
+        unit = match.group("unit")
+        if unit in _NON_AMOUNT_UNITS:
+            continue
+        gap = match.group("gap")
+        if unit != "円" and not gap.rstrip().endswith("¥") and not _AMOUNT_SEPARATOR_PATTERN.fullmatch(gap):
+            continue
+        label = match.group("label")
+        found.append((_LABEL_CATEGORY[label], label, int(match.group("amount").replace(",", ""))))
+    return found
+
+
+def extract_amounts(text: str) -> Dict[str, Set[int]]:
+    """
+    見出し付きの金額を抽出
+
+    Returns:
+        subtotal / tax / total ごとの金額の集合
+    """
+    amounts: Dict[str, Set[int]] = {category: set() for category in _AMOUNT_LABELS}
+    for category, _, amount in _find_labeled_amounts(text):
+        amounts[category].add(amount)
+    return amounts
+
+
+def extract_tax_rates(text: str) -> Set[Decimal]:
+    """消費税・税率の見出しの直後に記載された税率を抽出（源泉所得税・延滞税・割引の行は除く）"""
+    rates = set()
+    for line in _normalize(text).splitlines():
+        if any(keyword in line for keyword in _NON_CONSUMPTION_TAX_KEYWORDS):
+            continue
+        rates.update(Decimal(rate) / 100 for rate in _TAX_RATE_PATTERN.findall(line))
+    return rates
+
+
+def _format_rate(rate: Decimal) -> str:
+    """税率を "10%" 形式で表示"""
+    return f"{float(rate * 100):g}%"
+
+
+def _parse_date(match: "re.Match") -> Optional[date]:
+    groups = match.groupdict()
+    try:
+        if groups.get("reiwa"):
+            year = 2018 + (1 if groups["reiwa"] == "元" else int(groups["reiwa"]))
+        else:
+            year = int(groups["year"])
+        return date(year, int(groups["month"]), int(groups["day"]))
+    except ValueError:
+        return None
+
+
+def extract_labeled_dates(text: str, labels: List[str], max_distance: int = 20) -> Set[date]:
+    """見出しの直後（max_distance文字以内）に記載された日付を抽出"""
+    normalized = _normalize(text)
+    dates = set()
+    for label in labels:
+        for label_match in re.finditer(re.escape(label), normalized):
+            window = normalized[label_match.end():label_match.end() + max_distance + 12]
+            candidates = []
+            for pattern in _DATE_PATTERNS:
+                date_match = pattern.search(window)
+                if date_match and date_match.start() <= max_distance:
+                    candidates.append(date_match)
+            if candidates:
+                parsed = _parse_date(min(candidates, key=lambda m: m.start()))
+                if parsed:
+                    dates.add(parsed)
+    return dates
+
+
+def fiscal_period_end(target: date, fiscal_year_end: str) -> date:
+    """targetを含む会計期間の期末日（fiscal_year_endは "MM-DD"）"""
+    month, day = (int(part) for part in fiscal_year_end.split("-"))
+    period_end = date(target.year, month, day)
+    if period_end < target:
+        period_end = date(target.year + 1, month, day)
+    return period_end
+
+
+class LocalRuleEngine:
+    """
+    ルールのlocal_checkに指定された判定をローカルで実行する
+    判定できない場合はNoneを返し、呼び出し側はLLMで評価する
+    """
+
+    def __init__(self):
+        local_config = get_config("LOCAL_RULES_CONFIG")
+        standards = get_config("ACCOUNTING_STANDARDS")
+
+        self.enabled = local_config.get("enabled", True)
+        self.period_end_date = local_config.get("period_end_date")
+        self.tax_rounding = local_config.get("tax_rounding", "any")
+        self.max_label_distance = local_config.get("max_label_distance", 20)
+        self.fiscal_year_end = standards.get("fiscal_year_end", "03-31")
+        self.tax_rates = [Decimal(str(rate)) for rate in standards.get("tax_rates", [0.08, 0.10])]
+
+    @staticmethod
+    def get_check_spec(rule: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """ルールのlocal_check（文字列、またはtypeとオプションを持つ辞書）を正規化"""
+        local_check = rule.get("local_check")
+        if not local_check:
+            return None
+        spec = {"type": local_check} if isinstance(local_check, str) else dict(local_check)
+        return spec if spec.get("type") in LOCAL_CHECK_TYPES else None
+
+    def evaluate(self, file_data: Dict[str, Any], rule: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        ルールをローカルで評価
+
+        Args:
+            file_data: ファイルデータ
+            rule: ルール
+
+        Returns:
+            チェック結果（LLMの結果と同じ形式）。判定できない場合はNone
+        """
+        spec = self.get_check_spec(rule)
+        if not self.enabled or spec is None:
+            return None
+
+        content = file_data.get("content", "")
+        if spec["type"] == "amount_consistency":
+            outcome = self._check_amounts(content, spec)
+        else:
+            outcome = self._check_date_cutoff(content, spec)
+
+        if outcome is None:
+            return None
+
+        severity, message, details = outcome
+        return {
+            "rule_name": rule.get("name", "不明"),
+            "severity": severity,
+            "message": message,
+            "details": f"**判定方法**: ローカル計算（LLM未使用）\n\n{details}",
+            "passed": severity == "info",
+            "local_check": True
+        }
+
+    def _expected_tax(self, subtotal: int, rate: Decimal, rounding: str) -> Tuple[int, int]:
+        """税抜金額と税率から許容される消費税額の範囲"""
+        raw = Decimal(subtotal) * rate
+        if rounding in _ROUNDING_MODES:
+            value = int(raw.quantize(Decimal("1"), rounding=_ROUNDING_MODES[rounding]))
+            return value, value
+        return (int(raw.quantize(Decimal("1"), rounding=ROUND_FLOOR)),
+                int(raw.quantize(Decimal("1"), rounding=ROUND_CEILING)))
+
+    def _check_amounts(self, content: str, spec: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+        """金額整合性の判定（判定できない場合はNone）"""
+        labeled_amounts = _find_labeled_amounts(content)
+        amounts: Dict[str, Set[int]] = {category: set() for category in _AMOUNT_LABELS}
+        labels: Dict[str, Set[str]] = {category: set() for category in _AMOUNT_LABELS}
+        for category, label, amount in labeled_amounts:
+            amounts[category].add(amount)
+            labels[category].add(label)
+        if any(len(values) > 1 for values in amounts.values()):
+            return None  # 明細ごとの小計・複数税率など、候補が複数
+
+        subtotal = next(iter(amounts["subtotal"]), None)
+        tax = next(iter(amounts["tax"]), None)
+        total = next(iter(amounts["total"]), None)
+        if sum(value is not None for value in (subtotal, tax, total)) < 2:
+            return None
+
+        stated_rates = extract_tax_rates(content)
+        if len(stated_rates) > 1:
+            return None  # 複数税率の混在はLLMで判定
+
+        lines = [f"- 税抜金額: {subtotal:,}円" if subtotal is not None else "- 税抜金額: 記載なし",
+                 f"- 消費税額: {tax:,}円" if tax is not None else "- 消費税額: 記載なし",
+                 f"- 税込金額: {total:,}円" if total is not None else "- 税込金額: 記載なし"]
+
+        if stated_rates:
+            rate = next(iter(stated_rates))
+            if rate not in self.tax_rates:
+                return None  # 適用税率以外の率は消費税率か判断できないためLLMで判定
+            candidate_rates = [rate]
+        else:
+            candidate_rates = self.tax_rates
+
+        if subtotal is not None and tax is not None and total is not None:
+            if subtotal + tax != total:
+                if any(labels[category] & _GENERIC_AMOUNT_LABELS for category in labels):
+                    return None  # 明細の小計・数量の合計の可能性があるためLLMで判定
+                return ("error", "税抜金額と消費税額の合計が税込金額と一致しません",
+                        "\n".join(lines + [f"- 税抜金額＋消費税額: {subtotal + tax:,}円（差額 {total - subtotal - tax:,}円）"]))
+        elif subtotal is None:
+            subtotal = total - tax
+        elif tax is None:
+            tax = total - subtotal
+
+        if subtotal <= 0 or tax < 0:
+            return None
+
+        rounding = spec.get("tax_rounding", self.tax_rounding)
+        for rate in candidate_rates:
+            low, high = self._expected_tax(subtotal, rate, rounding)
+            if low <= tax <= high:
+                return ("info", f"金額計算は正しく、消費税率 {_format_rate(rate)} で計算されています",
+                        "\n".join(lines + [f"- 計算上の消費税額: {low:,}円" + (f"〜{high:,}円" if high != low else "")]))
+
+        expected = "、".join(
+            f"{_format_rate(rate)}: {low:,}円" + (f"〜{high:,}円" if high != low else "")
+            for rate in candidate_rates
+            for low, high in [self._expected_tax(subtotal, rate, rounding)]
+        )
+        return ("error", "消費税額が税抜金額と税率から計算した金額と一致しません",
+                "\n".join(lines + [f"- 計算上の消費税額（{expected}）"]))
+
+    def _check_date_cutoff(self, content: str, spec: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+        """
+        日付カットオフの判定（判定できない場合はNone）
+        期末日は文書中の記載、設定値（period_end_date）、取引日・納品日を含む会計期間の期末日の順に決定する
+        """
+        invoice_dates = extract_labeled_dates(content, _INVOICE_DATE_LABELS, self.max_label_distance)
+        if len(invoice_dates) != 1:
+            return None
+        invoice_date = next(iter(invoice_dates))
+
+        period_end = None
+        period_end_source = ""
+        document_period_ends = extract_labeled_dates(content, _PERIOD_END_LABELS, self.max_label_distance)
+        if len(document_period_ends) == 1:
+            period_end, period_end_source = next(iter(document_period_ends)), "文書中の記載"
+        elif len(document_period_ends) > 1:
+            return None
+        elif spec.get("period_end_date") or self.period_end_date:
+            period_end = date.fromisoformat(spec.get("period_end_date") or self.period_end_date)
+            period_end_source = "設定値"
+        else:
+            transaction_dates = extract_labeled_dates(content, _TRANSACTION_DATE_LABELS, self.max_label_distance)
+            if len(transaction_dates) != 1:
+                return None
+            transaction_date = next(iter(transaction_dates))
+            period_end = fiscal_period_end(transaction_date, spec.get("fiscal_year_end", self.fiscal_year_end))
+            period_end_source = f"取引日・納品日（{transaction_date.isoformat()}）を含む会計期間"
+
+        details = f"- 請求日: {invoice_date.isoformat()}\n- 期末日: {period_end.isoformat()}（{period_end_source}）"
+        if invoice_date > period_end:
+            return ("warning", f"請求日（{invoice_date.isoformat()}）が期末日（{period_end.isoformat()}）より後です", details)
+        return ("info", f"請求日（{invoice_date.isoformat()}）は期末日（{period_end.isoformat()}）以前です", details)
@@ -0,0 +1,334 @@
+"""
+LLM呼び出しのメトリクス（応答時間・待ち時間・トークン数・リトライ・検証エラー）
+呼び出しごとの記録をサービス・タスク・ルール・データIDのタグ付きで保持し、
+HDR方式（有効桁数を固定した対数線形のバケット）のヒストグラムで分布を集計する。
+記録はJSON/CSVでエクスポートできる
+
+タグは呼び出し元でmetrics_tagsを使って設定する（スレッド・非同期タスクごとに独立）:
+    with metrics_tags(service="InvoiceChecker", rule=rule_name, data_id=file_name):
+        response = self.invoke_llm(messages)
+
+記録はプロセス全体（全セッション）で共有するため、実行単位の集計は記録をリセットせず
+runタグで絞り込む（with metrics_tags(run=run_id): ... → get_summary(run=run_id)）
+"""
+import contextlib
+import contextvars
+import csv
+import io
+import json
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import get_config
+
+# 呼び出しに付与するタグ
+TAG_KEYS = ("run", "service", "task", "rule", "data_id", "model")
+
+# ヒストグラムで集計する項目
+HISTOGRAM_FIELDS = ("latency_ms", "queue_wait_ms", "prompt_tokens", "completion_tokens", "cached_tokens")
+
+# CSVエクスポートの列
+CSV_FIELDS = ("recorded_at", "kind") + TAG_KEYS + HISTOGRAM_FIELDS + ("retries", "outcome", "error")
+
+_current_tags: contextvars.ContextVar = contextvars.ContextVar("metrics_tags", default={})
+
+
+@contextlib.contextmanager
+def metrics_tags(**tags: Any) -> Iterator[None]:
+    """ブロック内のLLM呼び出しにタグを付与（外側のタグを引き継ぎ、Noneのタグは無視）"""
+    token = _current_tags.set({**_current_tags.get(), **{key: value for key, value in tags.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _current_tags.reset(token)
+
+
+def current_tags() -> Dict[str, Any]:
+    """現在のタグ"""
+    return dict(_current_tags.get())
+
+
+class Histogram:
+    """
+    HDR方式のヒストグラム
+    値を有効桁数（significant_digits）で丸めたバケットに数えるため、値の範囲によらず
+    相対誤差が一定（2桁なら約10%、3桁なら約1%以内）でメモリはバケット数のみ
+    """
+
+    def __init__(self, significant_digits: int = 3):
+        self.significant_digits = significant_digits
+        self.counts: Dict[float, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _bucket_width(self, value: float) -> float:
+        exponent = math.floor(math.log10(value))
+        return 10.0 ** (exponent - self.significant_digits + 1)
+
+    def _bucket(self, value: float) -> float:
+        """値が属するバケットの下限"""
+        if value <= 0:
+            return 0.0
+        width = self._bucket_width(value)
+        return round(math.floor(value / width) * width, 12)
+
+    def record(self, value: Optional[float]):
+        """値を1件記録（Noneは無視）"""
+        if value is None:
+            return
+        value = max(0.0, float(value))
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile: float) -> float:
+        """パーセンタイル値（バケットの上限、最大値を超えない）"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(percentile / 100 * self.count))
+        cumulative = 0
+        for bucket in sorted(self.counts):
+            cumulative += self.counts[bucket]
+            if cumulative >= rank:
+                upper = bucket + self._bucket_width(bucket) if bucket > 0 else 0.0
+                return min(upper, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        """件数・平均・パーセンタイルの要約"""
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min or 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max or 0.0,
+            "total": self.total
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """要約とバケットごとの件数（下限の昇順）"""
+        result = self.summary()
+        result["buckets"] = [[bucket, self.counts[bucket]] for bucket in sorted(self.counts)]
+        return result
+
+
+class MetricsRecorder:
+    """全LLMサービスで共有するメトリクスの記録"""
+
+    def __init__(self, enabled: Optional[bool] = None, max_records: Optional[int] = None,
+                 significant_digits: Optional[int] = None):
+        metrics_config = get_config("METRICS_CONFIG")
+
+        self.enabled = metrics_config.get("enabled", True) if enabled is None else enabled
+        self.max_records = max_records or metrics_config.get("max_records", 100000)
+        self.significant_digits = significant_digits or metrics_config.get("histogram_significant_digits", 3)
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """記録と集計をリセット"""
+        with self._lock:
+            # 件数が上限を超えた場合は古い記録から破棄（ヒストグラム・集計は全件）
+            self._records: deque = deque(maxlen=self.max_records)
+            self._histograms: Dict[str, Dict[str, Histogram]] = {}
+            self._counters: Dict[str, Dict[str, int]] = {}
+            self._started_at = datetime.now().isoformat()
+
+    def _service_counters(self, service: str) -> Dict[str, int]:
+        if service not in self._counters:
+            self._counters[service] = {"calls": 0, "errors": 0, "retries": 0, "validation_failures": 0}
+        return self._counters[service]
+
+    def record_call(self, latency: Optional[float], queue_wait: float, usage: Optional[Dict[str, Optional[int]]],
+                    retries: int, error: Optional[Exception] = None):
+        """
+        LLM呼び出し1回分（リトライを含む）を記録
+
+        Args:
+            latency: 最後の試行のAPI応答時間（秒、応答がない場合はNone）
+            queue_wait: 同時実行数・レート制限の枠の待ち時間の合計（秒）
+            usage: extract_usageの結果
+            retries: リトライ回数
+            error: 最終的に失敗した場合の例外
+        """
+        if not self.enabled:
+            return
+
+        usage = usage or {}
+        tags = current_tags()
+        record = {
+            "recorded_at": datetime.now().isoformat(),
+            "kind": "call",
+            **{key: tags.get(key) for key in TAG_KEYS},
+            "latency_ms": latency * 1000 if latency is not None else None,
+            "queue_wait_ms": queue_wait * 1000,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "cached_tokens": usage.get("cached_tokens"),
+            "retries": retries,
+            "outcome": "error" if error else "success",
+            "error": f"{type(error).__name__}: {error}" if error else None
+        }
+        service = tags.get("service") or "不明"
+
+        with self._lock:
+            self._records.append(record)
+            histograms = self._histograms.setdefault(
+                service, {field: Histogram(self.significant_digits) for field in HISTOGRAM_FIELDS}
+            )
+            for field in HISTOGRAM_FIELDS:
+                histograms[field].record(record[field])
+            counters = self._service_counters(service)
+            counters["calls"] += 1
+            counters["retries"] += retries
+            if error:
+                counters["errors"] += 1
+
+    def record_validation_failure(self, message: str, **tags: Any):
+        """応答の検証（JSON解析・スキーマ検証）の失敗を記録（tagsは現在のタグに追加・上書きする）"""
+        if not self.enabled:
+            return
+
+        tags = {**current_tags(), **{key: value for key, value in tags.items() if value is not None}}
+        record = {
+            "recorded_at": datetime.now().isoformat(),
+            "kind": "validation_failure",
+            **{key: tags.get(key) for key in TAG_KEYS},
+            "outcome": "validation_failure",
+            "error": message
+        }
+        with self._lock:
+            self._records.append(record)
+            self._service_counters(tags.get("service") or "不明")["validation_failures"] += 1
+
+    def get_records(self, run: Optional[str] = None) -> List[Dict[str, Any]]:
+        """保持している記録（古い順、runを指定するとその実行の記録のみ）"""
+        with self._lock:
+            records = list(self._records)
+        if run is None:
+            return records
+        return [record for record in records if record.get("run") == run]
+
+    def _summarize_records(self, records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """記録からサービスごとのカウンタとヒストグラムを集計"""
+        summaries: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            service = record.get("service") or "不明"
+            if service not in summaries:
+                summaries[service] = {
+                    "counters": {"calls": 0, "errors": 0, "retries": 0, "validation_failures": 0},
+                    "histograms": {field: Histogram(self.significant_digits) for field in HISTOGRAM_FIELDS}
+                }
+            counters = summaries[service]["counters"]
+            if record["kind"] == "validation_failure":
+                counters["validation_failures"] += 1
+                continue
+            counters["calls"] += 1
+            counters["retries"] += record["retries"]
+            if record["outcome"] == "error":
+                counters["errors"] += 1
+            for field in HISTOGRAM_FIELDS:
+                summaries[service]["histograms"][field].record(record[field])
+        return summaries
+
+    def get_summary(self, include_buckets: bool = False, run: Optional[str] = None) -> Dict[str, Any]:
+        """
+        サービスごとの集計
+
+        Args:
+            include_buckets: ヒストグラムのバケットを含めるか
+            run: 指定するとその実行の記録のみを集計（保持している記録の範囲内）
+
+        Returns:
+            started_at と services（サービス名ごとの件数・リトライ・検証エラー・ヒストグラム）
+        """
+        if run is not None:
+            summaries = self._summarize_records(self.get_records(run))
+            counters_by_service = {service: summary["counters"] for service, summary in summaries.items()}
+            histograms_by_service = {service: summary["histograms"] for service, summary in summaries.items()}
+        else:
+            with self._lock:
+                counters_by_service = {service: dict(counters) for service, counters in self._counters.items()}
+                histograms_by_service = dict(self._histograms)
+
+        with self._lock:
+            services = {}
+            for service, counters in counters_by_service.items():
+                histograms = histograms_by_service.get(service, {})
+                services[service] = {
+                    **counters,
+                    "histograms": {
+                        field: histogram.to_dict() if include_buckets else histogram.summary()
+                        for field, histogram in histograms.items()
+                    }
+                }
+            return {"started_at": self._started_at, "run": run, "services": services}
+
+    def export_json(self, run: Optional[str] = None) -> str:
+        """集計（バケットを含む）と記録をJSON文字列で出力（runを指定するとその実行分のみ）"""
+        return json.dumps({
+            "exported_at": datetime.now().isoformat(),
+            "summary": self.get_summary(include_buckets=True, run=run),
+            "records": self.get_records(run)
+        }, ensure_ascii=False, indent=2, default=str)
+
+    def export_csv(self, run: Optional[str] = None) -> str:
+        """記録をCSV文字列で出力（1行1呼び出し・検証エラー、runを指定するとその実行分のみ）"""
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for record in self.get_records(run):
+            writer.writerow({field: "" if record.get(field) is None else record.get(field) for field in CSV_FIELDS})
+        return output.getvalue()
+
+
+class CallTimer:
+    """execute_llm_callの1回の呼び出しでの待ち時間・応答時間・リトライ回数・使用量の計測"""
+
+    def __init__(self):
+        self.queue_wait = 0.0
+        self.latency: Optional[float] = None
+        self.retries = 0
+        self.usage: Optional[Dict[str, Optional[int]]] = None
+        self._mark: Optional[float] = None
+
+    def start_wait(self):
+        self._mark = time.monotonic()
+
+    def end_wait(self):
+        if self._mark is not None:
+            self.queue_wait += time.monotonic() - self._mark
+            self._mark = None
+
+    def on_retry(self, attempt: int, exception: Exception, delay: float):
+        self.retries += 1
+
+    def record(self, error: Optional[Exception] = None):
+        """計測結果を共有のメトリクスに記録"""
+        get_metrics().record_call(self.latency, self.queue_wait, self.usage, self.retries, error)
+
+
+_shared_metrics: Optional[MetricsRecorder] = None
+_shared_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRecorder:
+    """プロセス全体で共有するメトリクスの記録を取得"""
+    global _shared_metrics
+    if _shared_metrics is None:
+        with _shared_metrics_lock:
+            if _shared_metrics is None:
+                _shared_metrics = MetricsRecorder()
+    return _shared_metrics
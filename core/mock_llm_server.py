@@ -0,0 +1,447 @@
+"""
+OpenAI互換のローカルモックLLMサーバー
+APIクォータを消費せずに負荷試験・ベンチマークを行うためのもの
+
+OPENAI_PROVIDER=mock を設定すると、共有クライアント（get_openai_client）と
+LangChain用LLMがこのサーバーに接続する。MOCK_LLM_BASE_URLが未設定の場合は
+プロセス内でサーバーを自動起動する
+
+単体で起動する場合:
+    python -m core.mock_llm_server --port 8765 --latency-ms 500
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_config
+from .tokenizer import estimate_messages_tokens, estimate_tokens
+
+# 経理業務処理の出力列定義（「- B列: data_id (データID)」形式）からキーを取り出す
+_COLUMN_KEY_PATTERN = re.compile(r"^- [A-Z]+列: (\S+) \(", re.MULTILINE)
+_DATA_ID_PATTERN = re.compile(r"^### データID: (.+)$", re.MULTILINE)
+_RULE_ID_PATTERN = re.compile(r"^### ルールID: (.+)$", re.MULTILINE)
+
+# プロンプトキャッシュの単位（トークン数）
+PROMPT_CACHE_BLOCK_TOKENS = 128
+
+
+class MockLLMServer:
+    """
+    chat.completions互換のモックサーバー
+    遅延分布・エラー率・429注入・トークン数・タスク種別ごとの定型応答を設定できる
+    """
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, **overrides):
+        self.config = get_config("MOCK_LLM_CONFIG")
+        self.config.update({key: value for key, value in overrides.items() if value is not None})
+
+        self.host = host or self.config.get("host", "127.0.0.1")
+        self.port = self.config.get("port", 0) if port is None else port
+
+        self._random = random.Random(self.config.get("seed"))
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self._stats_lock = threading.Lock()
+        # 直近のリクエストごとの接頭辞のハッシュと、保持しているハッシュの出現数
+        self._recent_prompts: deque = deque(maxlen=self.config.get("prompt_cache_size", 256))
+        self._prefix_hash_counts: Dict[str, int] = {}
+        self.reset_stats()
+
+    @property
+    def base_url(self) -> str:
+        """OpenAIクライアントのbase_urlに指定するURL"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> str:
+        """バックグラウンドスレッドでサーバーを起動し、base_urlを返す"""
+        if self._server is not None:
+            return self.base_url
+
+        self._server = ThreadingHTTPServer((self.host, self.port), self._create_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MockLLMServer", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """サーバーを停止"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+
+    def reset_stats(self):
+        """統計情報をリセット"""
+        with self._stats_lock:
+            self._stats = {
+                "requests": 0,
+                "errors": 0,
+                "rate_limited": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0
+            }
+            self._latencies: List[float] = []
+            self._task_types: Dict[str, int] = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得（latencyはサーバー側の応答時間、秒）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+            stats["task_types"] = dict(self._task_types)
+
+        stats["latency_p50"] = _percentile(latencies, 50)
+        stats["latency_p95"] = _percentile(latencies, 95)
+        stats["latency_max"] = latencies[-1] if latencies else 0.0
+        return stats
+
+    def _create_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw_body = self.rfile.read(length) if length else b""
+
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"unknown path: {self.path}", "type": "invalid_request_error"}})
+                    return
+                try:
+                    body = json.loads(raw_body or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+                    return
+
+                status, headers, payload = server.handle_chat_completion(body)
+                self._send_json(status, payload, headers)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    self._send_json(200, server.get_stats())
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path: {self.path}"}})
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # リクエストごとのアクセスログは出力しない
+                pass
+
+        return _Handler
+
+    def _sample_latency(self) -> float:
+        """設定された分布から応答遅延（秒）をサンプリング"""
+        latency_ms = float(self.config.get("latency_ms", 500))
+        jitter = float(self.config.get("latency_jitter", 0.5))
+        distribution = self.config.get("latency_distribution", "lognormal")
+
+        if distribution == "fixed" or latency_ms <= 0:
+            value = latency_ms
+        elif distribution == "uniform":
+            # latency_ms ± latency_ms×jitter の一様分布
+            value = self._random.uniform(latency_ms * (1 - jitter), latency_ms * (1 + jitter))
+        else:
+            # 中央値latency_ms、対数標準偏差jitterの対数正規分布（裾の重い実際のAPIに近い）
+            value = self._random.lognormvariate(math.log(latency_ms), jitter)
+        return max(value, 0.0) / 1000.0
+
+    def handle_chat_completion(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        """
+        chat.completionsリクエストを処理
+
+        Returns:
+            (HTTPステータス, 追加ヘッダー, レスポンスJSON)
+        """
+        started_at = time.monotonic()
+        time.sleep(self._sample_latency())
+
+        roll = self._random.random()
+        rate_limit_rate = float(self.config.get("rate_limit_rate", 0.0))
+        error_rate = float(self.config.get("error_rate", 0.0))
+
+        if roll < rate_limit_rate:
+            self._record(started_at, "rate_limited")
+            retry_after = self.config.get("retry_after_seconds", 1)
+            return 429, {"Retry-After": str(retry_after)}, {
+                "error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}
+            }
+        if roll < rate_limit_rate + error_rate:
+            self._record(started_at, "errors")
+            return 500, {}, {"error": {"message": "Internal server error (mock)", "type": "server_error"}}
+
+        messages = body.get("messages", [])
+        task_type = _detect_task_type(body)
+        content = json.dumps(self._build_response(task_type, body), ensure_ascii=False)
+
+        prompt_tokens = self.config.get("prompt_tokens") or estimate_messages_tokens(messages)
+        completion_tokens = self.config.get("completion_tokens") or estimate_tokens(content)
+        cached_tokens = min(prompt_tokens, self._cached_prefix_tokens(messages))
+
+        with self._stats_lock:
+            request_number = self._stats["requests"] + 1
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["completion_tokens"] += completion_tokens
+            self._stats["cached_tokens"] += cached_tokens
+            self._task_types[task_type] = self._task_types.get(task_type, 0) + 1
+        self._record(started_at)
+
+        return 200, {}, {
+            "id": f"chatcmpl-mock-{request_number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+                "logprobs": None
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }
+        }
+
+    def _cached_prefix_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        プロバイダー側のプロンプトキャッシュを模擬し、直近のリクエストと先頭が一致するトークン数を返す
+        （一致部分がprompt_cache_min_tokens未満の場合は0、以上の場合は128トークン単位）
+        """
+        min_tokens = self.config.get("prompt_cache_min_tokens", 1024)
+        if not min_tokens:
+            return 0
+
+        prompt_text = "\n".join(f"{message.get('role', '')}: {_joined_content([message])}" for message in messages)
+        blocks = _prefix_block_hashes(prompt_text)
+        with self._stats_lock:
+            longest = next((end for end, digest in reversed(blocks) if digest in self._prefix_hash_counts), 0)
+            self._remember_prefix_hashes([digest for _, digest in blocks])
+
+        cached_tokens = estimate_tokens(prompt_text[:longest])
+        if cached_tokens < min_tokens:
+            return 0
+        return cached_tokens - cached_tokens % 128
+
+    def _remember_prefix_hashes(self, digests: List[str]):
+        """リクエストの接頭辞のハッシュを記録し、prompt_cache_sizeを超えた古いリクエストの分を削除（ロック内で呼ぶ）"""
+        if len(self._recent_prompts) == self._recent_prompts.maxlen:
+            for digest in self._recent_prompts.popleft():
+                self._prefix_hash_counts[digest] -= 1
+                if not self._prefix_hash_counts[digest]:
+                    del self._prefix_hash_counts[digest]
+        self._recent_prompts.append(digests)
+        for digest in digests:
+            self._prefix_hash_counts[digest] = self._prefix_hash_counts.get(digest, 0) + 1
+
+    def _record(self, started_at: float, counter: Optional[str] = None):
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            if counter:
+                self._stats[counter] += 1
+            self._latencies.append(time.monotonic() - started_at)
+
+    def _build_response(self, task_type: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """タスク種別ごとの定型応答を作成（MOCK_LLM_CONFIGのcanned_responsesがあればそれを返す）"""
+        canned = self.config.get("canned_responses", {}).get(task_type)
+        if canned is not None:
+            return canned
+
+        user_text = _joined_content(body.get("messages", []), "user")
+
+        if task_type == "accounting":
+            return _build_accounting_response(body, user_text)
+        if task_type == "multi_rule_check":
+            return {"results": [
+                {"rule_id": rule_id.strip(), "check_result": _mock_check_result()}
+                for rule_id in _RULE_ID_PATTERN.findall(user_text)
+            ]}
+        if task_type == "invoice_check":
+            return {"check_result": _mock_check_result()}
+        if task_type == "rule_enhancement":
+            return {"enhanced_prompt": "モック: 改善されたルール内容です。請求書の記載内容を確認してください。",
+                    "improvements": ["モック改善点"]}
+        if task_type == "rule_suggestions":
+            return {"suggestions": [{
+                "name": "モック提案ルール",
+                "category": "その他",
+                "prompt": "モック: 請求書の記載内容がドキュメントの規定に沿っているか確認してください。",
+                "severity": "warning",
+                "examples": None
+            }], "analysis_summary": "モック応答"}
+        return {"message": "モック応答"}
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _prefix_block_hashes(text: str) -> List[Tuple[int, str]]:
+    """
+    先頭からPROMPT_CACHE_BLOCK_TOKENSトークンごとの区切り位置と、そこまでの接頭辞のハッシュ
+    （区切りのトークン数は文字種による近似: ASCIIは4文字、それ以外は1文字で1トークン）
+    """
+    hasher = hashlib.sha256()
+    blocks = []
+    block_start = 0
+    block_tokens = 0.0
+    for position, char in enumerate(text):
+        block_tokens += 0.25 if ord(char) < 128 else 1.0
+        if block_tokens >= PROMPT_CACHE_BLOCK_TOKENS:
+            hasher.update(text[block_start:position + 1].encode("utf-8"))
+            blocks.append((position + 1, hasher.hexdigest()))
+            block_start = position + 1
+            block_tokens = 0.0
+    return blocks
+
+
+def _joined_content(messages: List[Dict[str, Any]], role: Optional[str] = None) -> str:
+    parts = []
+    for message in messages:
+        if role and message.get("role") != role:
+            continue
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def _detect_task_type(body: Dict[str, Any]) -> str:
+    """response_formatのスキーマ名、またはプロンプトの内容からタスク種別を判定"""
+    response_format = body.get("response_format") or {}
+    schema_name = (response_format.get("json_schema") or {}).get("name", "")
+    messages = body.get("messages", [])
+    user_text = _joined_content(messages, "user")
+    system_text = _joined_content(messages, "system")
+
+    if schema_name.startswith("accounting") or _DATA_ID_PATTERN.search(user_text):
+        return "accounting"
+    if schema_name == "multi_rule_check_response" or _RULE_ID_PATTERN.search(user_text):
+        return "multi_rule_check"
+    if schema_name == "invoice_check_response":
+        return "invoice_check"
+    if "enhanced_prompt" in system_text or "enhanced_prompt" in user_text:
+        return "rule_enhancement"
+    if "suggestions" in system_text or "suggestions" in user_text:
+        return "rule_suggestions"
+    if "チェックルール" in system_text:
+        return "invoice_check"
+    return "generic"
+
+
+def _mock_check_result() -> Dict[str, Any]:
+    return {"passed": True, "severity": "info", "message": "モック: 問題は検出されませんでした", "details": ""}
+
+
+def _build_accounting_response(body: Dict[str, Any], user_text: str) -> Dict[str, Any]:
+    """経理業務処理の応答（データIDごとに1件、列定義のキーを持つresult_data）"""
+    schema = ((body.get("response_format") or {}).get("json_schema") or {}).get("schema")
+    if schema:
+        result_schema = schema["properties"]["results"]["items"]
+        keys = list(result_schema["properties"]["result_data"]["properties"].keys())
+    else:
+        keys = [key for key in _COLUMN_KEY_PATTERN.findall(user_text) if key not in ("row_number", "data_id")]
+
+    data_ids = [data_id.strip() for data_id in _DATA_ID_PATTERN.findall(user_text)] or [None]
+    results = []
+    for data_id in data_ids:
+        results.append({
+            "data_id": data_id,
+            "task_type": "mock",
+            "status": "完了",
+            "result_data": {key: ("一致" if key == "match_status" else f"モック値: {key}") for key in keys},
+            "calculations": None,
+            "notes": None
+        })
+
+    return {
+        "results": results,
+        "summary": {
+            "total_processed": len(results),
+            "total_amount": None,
+            "matched_count": None,
+            "unmatched_count": None,
+            "require_review_count": None
+        },
+        "processing_notes": None
+    }
+
+
+_mock_server: Optional[MockLLMServer] = None
+_mock_server_lock = threading.Lock()
+
+
+def get_mock_server() -> MockLLMServer:
+    """プロセス内で共有するモックサーバーを取得（初回のみ起動）"""
+    global _mock_server
+    with _mock_server_lock:
+        if _mock_server is None:
+            _mock_server = MockLLMServer()
+            _mock_server.start()
+    return _mock_server
+
+
+def get_mock_base_url() -> str:
+    """モックサーバーのbase_url（MOCK_LLM_BASE_URLが設定されていれば外部のサーバーを使用）"""
+    return os.getenv("MOCK_LLM_BASE_URL") or get_mock_server().base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI互換のモックLLMサーバー")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=None, help="応答遅延の中央値（ミリ秒）")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default=None)
+    parser.add_argument("--error-rate", type=float, default=None, help="500エラーを返す確率")
+    parser.add_argument("--rate-limit-rate", type=float, default=None, help="429エラーを返す確率")
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        latency_distribution=args.latency_distribution,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    print(f"モックLLMサーバーを起動しました: {server.start()}")
+    print(f"（OPENAI_PROVIDER=mock MOCK_LLM_BASE_URL={server.base_url} で接続できます）")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+モデルのカスケード（小さいモデルで先に評価し、必要な場合のみ主モデルで再評価）
+不合格・要確認・確信度が低い・検証エラーの結果のみ主モデル（gpt-4.1）に回し、
+モデル（段階）ごとのトークン数・所要時間を集計する
+"""
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from config import get_config
+
+FIRST_PASS_TIER = "first_pass"
+PRIMARY_TIER = "primary"
+
+
+class ModelCascade:
+    """
+    サービスごとのカスケード設定と段階別の集計
+    無効時はすべて主モデルで評価し、集計は主モデルの段階のみになる
+    """
+
+    def __init__(self, primary_model: str, provider: str = "openai"):
+        cascade_config = get_config("MODEL_CASCADE_CONFIG")
+
+        self.enabled = cascade_config.get("enabled", False)
+        self.primary_model = primary_model
+        if provider == "azure":
+            # Azure OpenAIではデプロイ名を指定する
+            self.first_pass_model = os.getenv("AZURE_OPENAI_CASCADE_DEPLOYMENT_NAME",
+                                              cascade_config.get("first_pass_model", "gpt-4.1-mini"))
+        else:
+            self.first_pass_model = cascade_config.get("first_pass_model", "gpt-4.1-mini")
+        self.confidence_threshold = cascade_config.get("confidence_threshold", 0.7)
+        self.escalate_on_warning = cascade_config.get("escalate_on_warning", True)
+        self.escalate_statuses = set(cascade_config.get("escalate_statuses", ["要確認", "エラー"]))
+        self.escalate_match_statuses = set(cascade_config.get("escalate_match_statuses", ["要確認"]))
+
+        self._lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    @property
+    def active(self) -> bool:
+        """小さいモデルでの先行評価を行うか"""
+        return self.enabled and bool(self.first_pass_model) and self.first_pass_model != self.primary_model
+
+    def first_model(self) -> str:
+        """最初に評価するモデル"""
+        return self.first_pass_model if self.active else self.primary_model
+
+    def model_signature(self) -> str:
+        """結果のキャッシュ・再利用の判定に使うモデルの識別子（カスケード時は両モデル）"""
+        if self.active:
+            return f"{self.first_pass_model}>{self.primary_model}"
+        return self.primary_model
+
+    def tier_of(self, model: str) -> str:
+        """モデルの段階（first_pass / primary）"""
+        return FIRST_PASS_TIER if self.active and model == self.first_pass_model else PRIMARY_TIER
+
+    def _low_confidence(self, confidence: Any) -> bool:
+        return isinstance(confidence, (int, float)) and confidence < self.confidence_threshold
+
+    def check_escalation_reason(self, check_result: Dict[str, Any]) -> Optional[str]:
+        """
+        請求書チェックの結果を主モデルで再評価する理由（不要な場合はNone）
+
+        Args:
+            check_result: ルール適用結果（rule_name, severity, message, passed, ...）
+        """
+        if "passed" not in check_result or check_result.get("parse_error"):
+            return "検証エラー"
+        if not check_result["passed"]:
+            return "不合格"
+        if self.escalate_on_warning and check_result.get("severity") != "info":
+            return "要確認"
+        if self._low_confidence(check_result.get("confidence")):
+            return "確信度低"
+        return None
+
+    def accounting_escalation_reason(self, result: Dict[str, Any]) -> Optional[str]:
+        """
+        経理業務処理の結果（データ1件分）を主モデルで再処理する理由（不要な場合はNone）
+
+        Args:
+            result: _process_single_dataと同じ形式の処理結果
+        """
+        items = (result.get("data") or {}).get("results") if result.get("success") else None
+        if not items:
+            return "検証エラー"
+        for item in items:
+            result_data = item.get("result_data") or {}
+            if item.get("status") in self.escalate_statuses or result_data.get("match_status") in self.escalate_match_statuses:
+                return "要確認"
+            if self._low_confidence(item.get("confidence")):
+                return "確信度低"
+        return None
+
+    @staticmethod
+    def _empty_tier() -> Dict[str, Any]:
+        return {"requests": 0, "tokens": 0, "latency_seconds": 0.0}
+
+    def _empty_stats(self) -> Dict[str, Any]:
+        return {
+            "tiers": {FIRST_PASS_TIER: self._empty_tier(), PRIMARY_TIER: self._empty_tier()},
+            "first_pass_items": 0,
+            "escalations": 0,
+            "escalation_reasons": {}
+        }
+
+    def record(self, model: str, tokens: Optional[int], latency: float):
+        """1回の呼び出しのトークン数・所要時間（待機・リトライを含む）を段階別に加算"""
+        with self._lock:
+            tier = self._stats["tiers"][self.tier_of(model)]
+            tier["requests"] += 1
+            tier["tokens"] += tokens or 0
+            tier["latency_seconds"] += latency
+
+    def record_first_pass(self, escalation_reason: Optional[str]):
+        """小さいモデルで評価した1件の判定（再評価の理由、採用した場合はNone）を記録"""
+        with self._lock:
+            self._stats["first_pass_items"] += 1
+            if escalation_reason:
+                self._stats["escalations"] += 1
+                reasons = self._stats["escalation_reasons"]
+                reasons[escalation_reason] = reasons.get(escalation_reason, 0) + 1
+
+    def reset_stats(self):
+        """統計情報をリセット"""
+        with self._lock:
+            self._stats = self._empty_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得（段階ごとの平均所要時間、再評価率を含む）"""
+        with self._lock:
+            stats = {
+                "tiers": {name: dict(tier) for name, tier in self._stats["tiers"].items()},
+                "first_pass_items": self._stats["first_pass_items"],
+                "escalations": self._stats["escalations"],
+                "escalation_reasons": dict(self._stats["escalation_reasons"])
+            }
+        for tier in stats["tiers"].values():
+            tier["latency_avg_seconds"] = tier["latency_seconds"] / tier["requests"] if tier["requests"] else 0.0
+        stats.update({
+            "enabled": self.active,
+            "first_pass_model": self.first_pass_model,
+            "primary_model": self.primary_model,
+            "escalation_rate": stats["escalations"] / stats["first_pass_items"] if stats["first_pass_items"] else 0.0
+        })
+        return stats
@@ -14,6 +14,7 @@ class AccountingResult(BaseModel):
     result_data: Dict[str, Any] = Field(description="処理結果データ")
     calculations: Optional[List[str]] = Field(default=None, description="計算過程")
     notes: Optional[str] = Field(default=None, description="備考")
+    confidence: Optional[float] = Field(default=None, description="結果の確信度（0〜1）")
     
     @validator('status')
     def validate_status(cls, v):
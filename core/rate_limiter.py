@@ -0,0 +1,172 @@
+"""
+プロセス全体で共有するLLM呼び出しのレート制限
+1分あたりのリクエスト数（RPM）とトークン数（TPM）をトークンバケットで制御する
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from config import get_config
+
+
+class _TokenBucket:
+    """1分あたりの容量で補充されるトークンバケット"""
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.refill_rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """amountを消費できるまでの待ち時間（秒）"""
+        # 容量を超える要求はバケット満杯で通す（永久に待たないため）
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_rate
+
+    def consume(self, amount: float):
+        self.level -= amount
+
+    def adjust(self, amount: float):
+        """実績との差分を反映（負債は最大で1分間分まで）"""
+        self.level = max(-self.capacity, min(self.capacity, self.level - amount))
+
+
+class RateLimiter:
+    """
+    RPM・TPMの両方を満たすまで呼び出しを待機させるレートリミッター
+    事前見積もりトークンで予約し、応答のusageで実績に補正する
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        rate_config = get_config("RATE_LIMIT_CONFIG")
+
+        self.enabled = rate_config.get("enabled", True) if enabled is None else enabled
+        self.requests_per_minute = requests_per_minute or rate_config.get("requests_per_minute", 500)
+        self.tokens_per_minute = tokens_per_minute or rate_config.get("tokens_per_minute", 200000)
+
+        self._lock = threading.Lock()
+        self._request_bucket = _TokenBucket(self.requests_per_minute)
+        self._token_bucket = _TokenBucket(self.tokens_per_minute)
+
+        self._stats = {
+            "requests": 0,
+            "throttled_requests": 0,
+            "total_wait_seconds": 0.0,
+            "estimated_tokens": 0,
+            "actual_tokens": 0
+        }
+
+    def _try_acquire(self, estimated_tokens: int) -> float:
+        """予約を試み、成功時は0、失敗時は必要な待ち時間を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._request_bucket.refill(now)
+            self._token_bucket.refill(now)
+
+            wait = max(self._request_bucket.wait_time(1), self._token_bucket.wait_time(estimated_tokens))
+            if wait <= 0:
+                self._request_bucket.consume(1)
+                self._token_bucket.consume(estimated_tokens)
+            return wait
+
+    def _record_acquire(self, estimated_tokens: int, waited: float):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["estimated_tokens"] += estimated_tokens
+            if waited > 0:
+                self._stats["throttled_requests"] += 1
+                self._stats["total_wait_seconds"] += waited
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """
+        リクエスト枠と見積もりトークン分の枠を確保するまで待機
+
+        Args:
+            estimated_tokens: 入力＋出力の見積もりトークン数
+
+        Returns:
+            待機した秒数
+        """
+        if not self.enabled:
+            return 0.0
+
+        started_at = time.monotonic()
+        throttled = False
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if wait <= 0:
+                break
+            throttled = True
+            time.sleep(wait)
+
+        waited = time.monotonic() - started_at if throttled else 0.0
+        self._record_acquire(estimated_tokens, waited)
+        return waited
+
+    async def acquire_async(self, estimated_tokens: int) -> float:
+        """acquireの非同期版（イベントループをブロックしない）"""
+        if not self.enabled:
+            return 0.0
+
+        started_at = time.monotonic()
+        throttled = False
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if wait <= 0:
+                break
+            throttled = True
+            await asyncio.sleep(wait)
+
+        waited = time.monotonic() - started_at if throttled else 0.0
+        self._record_acquire(estimated_tokens, waited)
+        return waited
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """
+        見積もりと実績（response.usage）の差分をトークンバケットに反映
+
+        Args:
+            estimated_tokens: 予約時の見積もりトークン数
+            actual_tokens: 実際に消費したトークン数（不明な場合はNone）
+        """
+        if not self.enabled or actual_tokens is None:
+            return
+
+        with self._lock:
+            self._token_bucket.refill(time.monotonic())
+            self._token_bucket.adjust(actual_tokens - estimated_tokens)
+            self._stats["actual_tokens"] += actual_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """統計情報を取得"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "enabled": self.enabled,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute
+        })
+        return stats
+
+
+_shared_rate_limiter: Optional[RateLimiter] = None
+_shared_rate_limiter_lock = threading.Lock()
+
+
+def get_shared_rate_limiter() -> RateLimiter:
+    """プロセス全体で共有するレートリミッターを取得"""
+    global _shared_rate_limiter
+    if _shared_rate_limiter is None:
+        with _shared_rate_limiter_lock:
+            if _shared_rate_limiter is None:
+                _shared_rate_limiter = RateLimiter()
+    return _shared_rate_limiter
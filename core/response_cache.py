@@ -0,0 +1,180 @@
+"""
+LLMレスポンスの永続キャッシュ
+モデル名・プロンプト・ルール更新日時のハッシュをキーとしてSQLiteに保存する
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from config import get_config
+
+
+class ResponseCache:
+    """
+    コンテンツアドレス方式のLLMレスポンスキャッシュ
+    件数・サイズ・経過日数に基づいて古いエントリを削除する
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: Optional[int] = None,
+                 max_size_bytes: Optional[int] = None, max_age_days: Optional[float] = None,
+                 enabled: Optional[bool] = None):
+        cache_config = get_config("CACHE_CONFIG")
+
+        self.enabled = cache_config.get("enabled", True) if enabled is None else enabled
+        self.db_path = Path(db_path or cache_config.get("db_path", "cache/llm_responses.sqlite3"))
+        self.max_entries = max_entries or cache_config.get("max_entries", 20000)
+        self.max_size_bytes = max_size_bytes or cache_config.get("max_size_bytes", 200 * 1024 * 1024)
+        self.max_age_days = max_age_days or cache_config.get("max_age_days", 30)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.enabled:
+            try:
+                self._initialize_db()
+            except Exception as e:
+                print(f"レスポンスキャッシュ初期化エラー: {str(e)}")
+                self.enabled = False
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str, rule_updated_at: Optional[str] = None) -> str:
+        """キャッシュキー（SHA-256）を生成"""
+        payload = json.dumps([model, system_prompt, user_prompt, rule_updated_at or ""], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _transaction(self):
+        """ロックを取得して接続を開き、終了時にコミットして閉じる"""
+        with self._lock:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            try:
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _initialize_db(self):
+        """テーブルを作成"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses(last_accessed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses(created_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        キャッシュからレスポンスを取得
+
+        Returns:
+            キャッシュされたレスポンス本文（期限切れ・未登録の場合はNone）
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            now = time.time()
+            min_created_at = now - self.max_age_days * 86400
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, min_created_at)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+        except Exception as e:
+            print(f"レスポンスキャッシュ読み込みエラー: {str(e)}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, response: str, model: str = ""):
+        """レスポンスをキャッシュに保存"""
+        if not self.enabled:
+            return
+
+        try:
+            now = time.time()
+            size = len(response.encode("utf-8"))
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response, size, now, now)
+                )
+                self._evict(conn, now)
+        except Exception as e:
+            print(f"レスポンスキャッシュ書き込みエラー: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """期限切れ・上限超過のエントリを削除"""
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_days * 86400,))
+
+        count, total_size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total_size <= self.max_size_bytes:
+            return
+
+        # 最終参照が古い順に上限内へ収まるまで削除
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY last_accessed ASC").fetchall()
+        keys_to_delete = []
+        for key, size in rows:
+            if count <= self.max_entries and total_size <= self.max_size_bytes:
+                break
+            keys_to_delete.append((key,))
+            count -= 1
+            total_size -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", keys_to_delete)
+
+    def clear(self):
+        """キャッシュを全削除"""
+        if not self.enabled:
+            return
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def reset_stats(self):
+        """ヒット・ミスのカウンタをリセット"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計を取得"""
+        stats = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / (self.hits + self.misses) if (self.hits + self.misses) > 0 else 0.0,
+            "entries": 0,
+            "size_bytes": 0
+        }
+
+        if self.enabled:
+            try:
+                with self._transaction() as conn:
+                    count, total_size = conn.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                    ).fetchone()
+                    stats["entries"] = count
+                    stats["size_bytes"] = total_size
+            except Exception as e:
+                print(f"レスポンスキャッシュ統計取得エラー: {str(e)}")
+
+        return stats
@@ -0,0 +1,142 @@
+"""
+LLM呼び出しのリトライポリシー
+ERROR_CONFIGの設定に従い、一時的なエラー（429/5xx/タイムアウト/接続エラー）を
+指数バックオフ＋ジッターで再試行する。Retry-Afterヘッダーがあればそれに従う
+"""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from config import get_config
+
+try:
+    import openai
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+# 再試行対象のHTTPステータスコード
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RetryPolicy:
+    """指数バックオフ＋ジッターによるリトライポリシー"""
+
+    def __init__(self, max_retries: Optional[int] = None, retry_delay: Optional[float] = None,
+                 max_retry_delay: Optional[float] = None, jitter: Optional[bool] = None):
+        error_config = get_config("ERROR_CONFIG")
+
+        self.max_retries = error_config.get("max_retries", 3) if max_retries is None else max_retries
+        self.retry_delay = error_config.get("retry_delay", 1) if retry_delay is None else retry_delay
+        self.max_retry_delay = error_config.get("max_retry_delay", 60) if max_retry_delay is None else max_retry_delay
+        self.jitter = error_config.get("retry_jitter", True) if jitter is None else jitter
+
+    @staticmethod
+    def is_retryable(exception: Exception) -> bool:
+        """一時的なエラーかどうかを判定"""
+        if OPENAI_AVAILABLE:
+            if isinstance(exception, (openai.RateLimitError, openai.APITimeoutError,
+                                      openai.APIConnectionError, openai.InternalServerError)):
+                return True
+            if isinstance(exception, openai.APIStatusError):
+                return exception.status_code in RETRYABLE_STATUS_CODES
+
+        status_code = getattr(exception, "status_code", None)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+
+        return isinstance(exception, (TimeoutError, ConnectionError))
+
+    @staticmethod
+    def is_throttled(exception: Exception) -> bool:
+        """レート制限（429）によるエラーかどうかを判定"""
+        if OPENAI_AVAILABLE and isinstance(exception, openai.RateLimitError):
+            return True
+        return getattr(exception, "status_code", None) == 429
+
+    @staticmethod
+    def get_retry_after(exception: Exception) -> Optional[float]:
+        """エラーレスポンスのRetry-Afterヘッダーから待機秒数を取得"""
+        response = getattr(exception, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000.0
+            except ValueError:
+                pass
+
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def get_delay(self, attempt: int, exception: Exception) -> float:
+        """
+        attempt回目（0始まり）の失敗後に待機する秒数
+
+        Retry-Afterが指定されていればそれを優先し、
+        なければ retry_delay × 2^attempt を上限 max_retry_delay で打ち切ってジッターを加える
+        """
+        retry_after = self.get_retry_after(exception)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_delay)
+
+        delay = min(self.max_retry_delay, self.retry_delay * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(delay / 2, delay)
+        return delay
+
+    def _should_retry(self, attempt: int, exception: Exception) -> bool:
+        return attempt < self.max_retries and self.is_retryable(exception)
+
+    def call(self, func: Callable[[], Any], on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> Any:
+        """
+        funcを実行し、一時的なエラーの場合はリトライする
+
+        Args:
+            func: 実行する関数
+            on_retry: リトライ前に呼ばれるコールバック（attempt, exception, delay）
+        """
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self.get_delay(attempt, e)
+                if on_retry:
+                    on_retry(attempt + 1, e, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    async def call_async(self, func: Callable[[], Awaitable[Any]],
+                         on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> Any:
+        """callの非同期版"""
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self.get_delay(attempt, e)
+                if on_retry:
+                    on_retry(attempt + 1, e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -34,6 +34,7 @@ class RuleManager:
                 {
                     "name": "請求書日付チェック",
                     "category": "日付チェック",
+                    "local_check": "date_cutoff",
                     "prompt": """請求書の日付が会計期間内（期末日以前）かどうかを確認してください。
 - 請求書日付を特定してください
 - 期末日は通常3月31日ですが、文書に記載がある場合はそれに従ってください
@@ -43,6 +44,7 @@ class RuleManager:
                 {
                     "name": "金額整合性チェック",
                     "category": "金額チェック", 
+                    "local_check": "amount_consistency",
                     "prompt": """請求書の金額計算が正しいかどうかを確認してください。
 - 税抜金額と消費税額の合計が税込金額と一致するか
 - 消費税率（8%または10%）が正しく適用されているか
@@ -85,11 +87,16 @@ class RuleManager:
                 self.add_rule(
                     rule_data["name"],
                     rule_data["category"], 
-                    rule_data["prompt"]
+                    rule_data["prompt"],
+                    local_check=rule_data.get("local_check")
                 )
     
-    def add_rule(self, name: str, category: str, prompt: str) -> str:
-        """新しいルールを追加"""
+    def add_rule(self, name: str, category: str, prompt: str, local_check: Optional[Any] = None) -> str:
+        """
+        新しいルールを追加
+        local_checkを指定すると、判定可能な場合はLLMを使わずにローカルで評価する
+        （"amount_consistency" / "date_cutoff"、またはtypeとオプションを持つ辞書）
+        """
         rule_id = str(uuid.uuid4())
         
         self.rules[rule_id] = {
@@ -99,6 +106,8 @@ class RuleManager:
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat()
         }
+        if local_check:
+            self.rules[rule_id]["local_check"] = local_check
         
         self._save_rules()
         return rule_id
@@ -112,7 +121,8 @@ class RuleManager:
         return self.rules.copy()
     
     def update_rule(self, rule_id: str, name: Optional[str] = None, 
-                   category: Optional[str] = None, prompt: Optional[str] = None) -> bool:
+                   category: Optional[str] = None, prompt: Optional[str] = None,
+                   local_check: Optional[Any] = None) -> bool:
         """ルールを更新"""
         if rule_id not in self.rules:
             return False
@@ -123,6 +133,12 @@ class RuleManager:
             self.rules[rule_id]["category"] = category
         if prompt is not None:
             self.rules[rule_id]["prompt"] = prompt
+        if local_check is not None:
+            # 空文字を指定するとローカル判定を解除
+            if local_check:
+                self.rules[rule_id]["local_check"] = local_check
+            else:
+                self.rules[rule_id].pop("local_check", None)
         
         self.rules[rule_id]["updated_at"] = datetime.now().isoformat()
         self._save_rules()
@@ -5,12 +5,12 @@ from pathlib import Path
 import openai
 import logging
 from datetime import datetime
-import fitz  # PyMuPDF for PDF processing
-import docx  # python-docx for Word documents
-import pandas as pd
-import re
 from pydantic import ValidationError
 from .models import RuleSuggestionsResponse, RuleSuggestion, EnhancedRuleResponse
+from .base_llm_service import execute_llm_call, get_shared_rate_limiter, get_openai_client
+from .metrics import get_metrics, metrics_tags
+from .json_repair import parse_json_lenient
+from .extractors import extract_text
 import os
 from dotenv import load_dotenv
 
@@ -25,6 +25,9 @@ class RuleSuggester:
         self.logger = logging.getLogger(__name__)
         self.provider = os.getenv("OPENAI_PROVIDER", "openai")
         
+        # プロセス全体で共有するレートリミッター
+        self.rate_limiter = get_shared_rate_limiter()
+        
         # プロバイダーに応じた設定
         if self.provider == "azure":
             self.azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -45,80 +48,31 @@ class RuleSuggester:
         if not self.api_key:
             raise ValueError("APIキーが設定されていません。環境変数または引数で指定してください。")
     
+    def _get_client(self):
+        """プロバイダー・認証情報ごとに共有するクライアントとモデル名を取得"""
+        if self.provider == "azure":
+            client = get_openai_client(self.provider, self.api_key, self.azure_endpoint, self.azure_api_version)
+            return client, self.azure_deployment
+        return get_openai_client(self.provider, self.api_key), "gpt-4.1"
+    
     def process_uploaded_document(self, uploaded_file) -> str:
         """アップロードされたドキュメントからテキストを抽出"""
         try:
             file_extension = Path(uploaded_file.name).suffix.lower()
-            content = ""
             
-            if file_extension == '.pdf':
-                content = self._extract_pdf_text(uploaded_file)
-            elif file_extension in ['.docx', '.doc']:
-                content = self._extract_docx_text(uploaded_file)
-            elif file_extension in ['.txt', '.md']:
-                content = uploaded_file.read().decode('utf-8')
-            elif file_extension in ['.xlsx', '.xls']:
-                content = self._extract_excel_text(uploaded_file)
-            else:
+            if file_extension not in ['.pdf', '.docx', '.doc', '.txt', '.md', '.xlsx', '.xls']:
                 raise ValueError(f"サポートされていないファイル形式: {file_extension}")
             
+            # 共通の抽出レジストリで抽出（同じ内容のドキュメントは抽出テキストキャッシュから取得）
+            file_content = uploaded_file.read()
+            uploaded_file.seek(0)
+            content = extract_text(file_content, uploaded_file.name)
+            
             return content
         except Exception as e:
             self.logger.error(f"ドキュメント処理エラー: {str(e)}")
             raise e
     
-    def _extract_pdf_text(self, uploaded_file) -> str:
-        """PDFからテキストを抽出"""
-        try:
-            # BytesIOオブジェクトからPDFを読み込み
-            pdf_document = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-            text = ""
-            
-            for page_num in range(pdf_document.page_count):
-                page = pdf_document.load_page(page_num)
-                text += page.get_text()
-            
-            pdf_document.close()
-            return text
-        except Exception as e:
-            raise Exception(f"PDF解析エラー: {str(e)}")
-    
-    def _extract_docx_text(self, uploaded_file) -> str:
-        """Word文書からテキストを抽出"""
-        try:
-            doc = docx.Document(uploaded_file)
-            text = ""
-            
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            
-            # テーブルのテキストも抽出
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        text += cell.text + "\t"
-                    text += "\n"
-            
-            return text
-        except Exception as e:
-            raise Exception(f"Word文書解析エラー: {str(e)}")
-    
-    def _extract_excel_text(self, uploaded_file) -> str:
-        """Excelファイルからテキストを抽出"""
-        try:
-            # pandasでExcelファイルを読み込み
-            df = pd.read_excel(uploaded_file, sheet_name=None)  # 全シートを読み込み
-            text = ""
-            
-            for sheet_name, sheet_df in df.items():
-                text += f"=== {sheet_name} ===\n"
-                text += sheet_df.to_string(index=False, na_rep='')
-                text += "\n\n"
-            
-            return text
-        except Exception as e:
-            raise Exception(f"Excel解析エラー: {str(e)}")
-    
     def suggest_rules_from_document(self, document_content: str, existing_rules: Dict[str, Any]) -> List[Dict[str, Any]]:
         """ドキュメント内容から新しいルールを提案"""
         if not self.api_key:
@@ -132,44 +86,40 @@ class RuleSuggester:
             prompt = self._create_rule_suggestion_prompt(document_content, existing_rules_summary)
             
             # OpenAI APIを呼び出し (新バージョン対応)
-            from openai import OpenAI, AzureOpenAI
-            
-            # プロバイダーに応じてクライアントを作成
-            if self.provider == "azure":
-                client = AzureOpenAI(
-                    api_key=self.api_key,
-                    azure_endpoint=self.azure_endpoint,
-                    api_version=self.azure_api_version
-                )
-                model = self.azure_deployment
-            else:
-                client = OpenAI(api_key=self.api_key)
-                model = "gpt-4.1"
+            client, model = self._get_client()
             
             # レスポンススキーマを取得
             response_schema = RuleSuggestionsResponse.model_json_schema()
             
-            response = client.chat.completions.create(
-                model=model,  # プロバイダーに応じたモデルを使用
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"""あなたは請求書チェックルールの専門家です。
-                        提供されたドキュメントを分析し、請求書チェックに有用なルールを提案してください。
-                        既存のルールと重複しないよう注意してください。
-                        
-                        必ず以下のJSONスキーマに厳密に従った形式で回答してください：
-                        {json.dumps(response_schema, ensure_ascii=False, indent=2)}"""
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=2000,
-                response_format={"type": "json_object"}
-            )
+            messages = [
+                {
+                    "role": "system",
+                    "content": f"""あなたは請求書チェックルールの専門家です。
+                    提供されたドキュメントを分析し、請求書チェックに有用なルールを提案してください。
+                    既存のルールと重複しないよう注意してください。
+                    
+                    必ず以下のJSONスキーマに厳密に従った形式で回答してください：
+                    {json.dumps(response_schema, ensure_ascii=False, indent=2)}"""
+                },
+                {
+                    "role": "user", 
+                    "content": prompt
+                }
+            ]
+            
+            # 共有レートリミッター経由で呼び出し
+            with metrics_tags(service="RuleSuggester", task="rule_suggestions", model=model):
+                response = execute_llm_call(
+                    lambda: client.chat.completions.create(
+                        model=model,  # プロバイダーに応じたモデルを使用
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=2000,
+                        response_format={"type": "json_object"}
+                    ),
+                    messages,
+                    max_completion_tokens=2000
+                )
             
             # レスポンスを解析
             response_text = response.choices[0].message.content.strip()
@@ -184,6 +134,7 @@ class RuleSuggester:
                 
             except (json.JSONDecodeError, ValidationError) as e:
                 self.logger.error(f"ルール提案レスポンス検証エラー: {str(e)}")
+                get_metrics().record_validation_failure(str(e), service="RuleSuggester", task="rule_suggestions")
                 # フォールバックとして従来のパース処理を試みる
                 return self._parse_rule_suggestions(response_text)
             
@@ -236,18 +187,16 @@ class RuleSuggester:
         """
     
     def _parse_rule_suggestions(self, response_text: str) -> List[Dict[str, Any]]:
-        """APIレスポンスからルール提案を解析"""
+        """APIレスポンスからルール提案を解析（途中で切れた場合は完結している提案のみ）"""
         try:
-            # JSONの部分を抽出
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_text = json_match.group()
-                data = json.loads(json_text)
-                return data.get("suggested_rules", [])
-            else:
-                # JSONが見つからない場合は空のリストを返す
-                self.logger.warning("APIレスポンスからJSONを抽出できませんでした")
+            data, complete = parse_json_lenient(response_text)
+            if not complete:
+                self.logger.warning("APIレスポンスが途中で切れているため、完結している提案のみ使用します")
+            
+            suggestions = data.get("suggested_rules", data.get("suggestions", [])) if isinstance(data, dict) else []
+            if not isinstance(suggestions, list):
                 return []
+            return [suggestion for suggestion in suggestions if isinstance(suggestion, dict)]
         except json.JSONDecodeError as e:
             self.logger.error(f"JSON解析エラー: {str(e)}")
             return []
@@ -303,42 +252,38 @@ class RuleSuggester:
             }}
             """
             
-            from openai import OpenAI, AzureOpenAI
-            
-            # プロバイダーに応じてクライアントを作成
-            if self.provider == "azure":
-                client = AzureOpenAI(
-                    api_key=self.api_key,
-                    azure_endpoint=self.azure_endpoint,
-                    api_version=self.azure_api_version
-                )
-                model = self.azure_deployment
-            else:
-                client = OpenAI(api_key=self.api_key)
-                model = "gpt-4.1"
+            client, model = self._get_client()
             
             # レスポンススキーマを取得
             enhanced_schema = EnhancedRuleResponse.model_json_schema()
             
-            response = client.chat.completions.create(
-                model=model,  # プロバイダーに応じたモデルを使用
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"""あなたは請求書チェックルールの改善専門家です。
-                        
-                        必ず以下のJSONスキーマに従った形式で回答してください：
-                        {json.dumps(enhanced_schema, ensure_ascii=False, indent=2)}"""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.2,
-                max_tokens=1000,
-                response_format={"type": "json_object"}
-            )
+            messages = [
+                {
+                    "role": "system",
+                    "content": f"""あなたは請求書チェックルールの改善専門家です。
+                    
+                    必ず以下のJSONスキーマに従った形式で回答してください：
+                    {json.dumps(enhanced_schema, ensure_ascii=False, indent=2)}"""
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+            
+            # 共有レートリミッター経由で呼び出し
+            with metrics_tags(service="RuleSuggester", task="rule_enhancement", rule=base_rule.get("name"), model=model):
+                response = execute_llm_call(
+                    lambda: client.chat.completions.create(
+                        model=model,  # プロバイダーに応じたモデルを使用
+                        messages=messages,
+                        temperature=0.2,
+                        max_tokens=1000,
+                        response_format={"type": "json_object"}
+                    ),
+                    messages,
+                    max_completion_tokens=1000
+                )
             
             response_text = response.choices[0].message.content.strip()
             
@@ -358,16 +303,18 @@ class RuleSuggester:
                 
             except (json.JSONDecodeError, ValidationError) as e:
                 self.logger.error(f"ルール改善レスポンス検証エラー: {str(e)}")
-                # フォールバック：従来のパース処理
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    try:
-                        data = json.loads(json_match.group())
+                get_metrics().record_validation_failure(str(e), service="RuleSuggester", task="rule_enhancement",
+                                                        rule=base_rule.get("name"))
+                # フォールバック：寛容なJSON解析で改善後の内容のみ取り出す
+                try:
+                    data, _ = parse_json_lenient(response_text)
+                    enhanced_prompt = data.get('enhanced_prompt') if isinstance(data, dict) else None
+                    if isinstance(enhanced_prompt, str) and enhanced_prompt.strip():
                         enhanced_rule = base_rule.copy()
-                        enhanced_rule['prompt'] = data.get('enhanced_prompt', base_rule['prompt'])
+                        enhanced_rule['prompt'] = enhanced_prompt
                         return enhanced_rule
-                    except:
-                        pass
+                except json.JSONDecodeError:
+                    pass
             
         except Exception as e:
             self.logger.error(f"ルール改善エラー: {str(e)}")
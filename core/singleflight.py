@@ -0,0 +1,183 @@
+"""
+同一リクエストの同時実行の集約（singleflight）
+同じキーのLLM呼び出しが実行中の場合は新たに呼び出さず、実行中の呼び出しの結果を共有する
+（複数セッションからの同時実行や、重複アップロードされた請求書に同じルールを適用する場合など）
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+def _message_payload(message: Any) -> Tuple[str, str]:
+    """OpenAI形式の辞書・LangChainのメッセージの両方から（役割, 本文）を取り出す"""
+    if isinstance(message, dict):
+        return str(message.get("role", "")), str(message.get("content", ""))
+    return str(getattr(message, "type", type(message).__name__)), str(getattr(message, "content", ""))
+
+
+def make_request_key(model: str, messages: List[Any], **params: Any) -> str:
+    """
+    リクエスト内容（モデル・メッセージ・パラメーター）からキー（SHA-256）を生成
+
+    Args:
+        model: モデル名
+        messages: 送信するメッセージ
+        **params: 応答に影響するパラメーター（response_format、temperature、認証情報の識別子など）
+    """
+    payload = json.dumps(
+        [model, [_message_payload(message) for message in messages], params],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """実行中の呼び出し（結果を待機中の呼び出し元と共有する）"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.exception: Optional[BaseException] = None
+        self.async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+
+class SingleFlight:
+    """
+    キーごとに実行中の呼び出しを1つに集約する
+    スレッド・イベントループのどちらから呼び出しても、別スレッドの実行中の呼び出しと結果を共有できる
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"executed": 0, "coalesced": 0}
+
+    def _complete(self, key: str, call: _Call, result: Any = None, exception: Optional[BaseException] = None):
+        """結果を記録して待機中の呼び出し元に通知"""
+        with self._lock:
+            self._calls.pop(key, None)
+            call.result = result
+            call.exception = exception
+            call.done.set()
+            waiters, call.async_waiters = call.async_waiters, []
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(self._resolve, future, call)
+            except RuntimeError:
+                # イベントループが終了済み
+                pass
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, call: _Call):
+        if future.cancelled():
+            return
+        if isinstance(call.exception, asyncio.CancelledError):
+            # 実行役がキャンセルされた場合は待機側もキャンセル扱い
+            future.cancel()
+        elif call.exception is not None:
+            future.set_exception(call.exception)
+        else:
+            future.set_result(call.result)
+
+    @staticmethod
+    def _outcome(call: _Call) -> Any:
+        if call.exception is not None:
+            raise call.exception
+        return call.result
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        同じキーの呼び出しが実行中であればその結果を待ち、なければfuncを実行する
+
+        Args:
+            key: リクエストのキー（make_request_keyの結果）
+            func: 実際の呼び出しを行う関数
+
+        Returns:
+            funcの戻り値（例外も共有される）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not is_leader:
+            call.done.wait()
+            return self._outcome(call)
+
+        try:
+            result = func()
+        except BaseException as e:
+            self._complete(key, call, exception=e)
+            raise
+        self._complete(key, call, result=result)
+        return result
+
+    async def do_async(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """doの非同期版（待機中もイベントループをブロックしない）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                future = loop.create_future()
+                call.async_waiters.append((loop, future))
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                future = None
+
+        if future is not None:
+            return await future
+
+        try:
+            result = await func()
+        except BaseException as e:
+            self._complete(key, call, exception=e)
+            raise
+        self._complete(key, call, result=result)
+        return result
+
+    def reset_stats(self):
+        """統計情報をリセット"""
+        with self._lock:
+            self._stats = {"executed": 0, "coalesced": 0}
+
+    def get_stats(self, since: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        統計情報を取得（coalescedが削減できた呼び出し数）
+
+        Args:
+            since: 実行開始時に取得した統計。指定するとそれ以降の増分を返す
+                   （プロセス全体で共有する統計をリセットせずに実行単位で集計する）
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        if since:
+            for key in ("executed", "coalesced"):
+                stats[key] -= since.get(key, 0)
+        return stats
+
+
+_shared_singleflight: Optional[SingleFlight] = None
+_shared_singleflight_lock = threading.Lock()
+
+
+def get_singleflight() -> SingleFlight:
+    """プロセス全体で共有するsingleflightを取得"""
+    global _shared_singleflight
+    if _shared_singleflight is None:
+        with _shared_singleflight_lock:
+            if _shared_singleflight is None:
+                _shared_singleflight = SingleFlight()
+    return _shared_singleflight
@@ -0,0 +1,189 @@
+"""
+Structured Outputs（strictなJSONスキーマ指定）のスキーマ生成
+Pydanticモデル、またはタスクの列定義（column_definitions）からstrictモードで
+受け付けられる形式のスキーマを生成し、タスクごとにキャッシュする
+"""
+import json
+import threading
+from typing import Any, Dict, Optional, Type
+
+from config import get_config
+
+# strictモードで使用できないキーワード（スキーマから除去する）
+_UNSUPPORTED_KEYWORDS = {
+    "default", "minLength", "maxLength", "pattern", "format",
+    "minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum", "multipleOf",
+    "minItems", "maxItems", "uniqueItems"
+}
+
+# 経理業務処理結果のステータス（AccountingResult.validate_statusと同一）
+ACCOUNTING_STATUSES = ["完了", "エラー", "要確認", "処理中"]
+
+_response_format_cache: Dict[str, Dict[str, Any]] = {}
+_response_format_cache_lock = threading.Lock()
+
+
+def supports_structured_outputs(provider: str, api_version: Optional[str] = None) -> bool:
+    """
+    strictなJSONスキーマ指定を使用できるかを判定
+
+    Azure OpenAIは対応APIバージョン（STRUCTURED_OUTPUT_CONFIGのazure_min_api_version）以降のみ対応。
+    未対応の場合、呼び出し側は従来のjson_object指定＋プロンプト内のスキーマ説明にフォールバックする
+    """
+    structured_config = get_config("STRUCTURED_OUTPUT_CONFIG")
+    if not structured_config.get("enabled", True):
+        return False
+
+    if provider == "azure":
+        min_version = structured_config.get("azure_min_api_version", "2024-08-01-preview")
+        # APIバージョンは "YYYY-MM-DD[-preview]" 形式のため日付部分で比較
+        return bool(api_version) and api_version[:10] >= min_version[:10]
+
+    return True
+
+
+def _strict_node(node: Any) -> Any:
+    """スキーマの各ノードをstrictモードの制約に合わせて変換"""
+    if isinstance(node, list):
+        return [_strict_node(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+
+    # $refには他のキーワードを併記しない
+    if "$ref" in node:
+        return {"$ref": node["$ref"]}
+
+    converted = {key: _strict_node(value) for key, value in node.items() if key not in _UNSUPPORTED_KEYWORDS}
+
+    if "properties" in converted:
+        # strictモードは全項目の必須指定が必要
+        # （Optional項目はPydanticのスキーマで既にnull許容、デフォルト値のある項目は常に出力させる）
+        converted["required"] = list(converted["properties"].keys())
+        converted["additionalProperties"] = False
+
+    return converted
+
+
+def to_strict_json_schema(model: Type[Any]) -> Dict[str, Any]:
+    """Pydanticモデルからstrictモード用のJSONスキーマを生成"""
+    return _strict_node(model.model_json_schema())
+
+
+def build_response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """APIのresponse_formatパラメーターを作成"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": schema
+        }
+    }
+
+
+def get_model_response_format(name: str, model: Type[Any]) -> Dict[str, Any]:
+    """Pydanticモデルに対応するresponse_formatを取得（モデルごとにキャッシュ）"""
+    cache_key = f"model:{name}"
+    with _response_format_cache_lock:
+        if cache_key not in _response_format_cache:
+            _response_format_cache[cache_key] = build_response_format(name, to_strict_json_schema(model))
+        return _response_format_cache[cache_key]
+
+
+def build_accounting_response_schema(column_definitions: Dict[str, Dict[str, Any]],
+                                     include_data_id: bool = False) -> Dict[str, Any]:
+    """
+    タスクの列定義からLLMAccountingResponse互換のstrictなJSONスキーマを生成
+
+    result_dataは列定義のキー（row_number・data_idはシステム側で補完するため除外）を
+    必須項目として持つオブジェクトになる
+
+    Args:
+        column_definitions: 出力設定の列定義
+        include_data_id: 各結果にdata_idを必須で出力させるか（複数データをまとめて処理する場合）
+
+    Returns:
+        JSONスキーマ
+    """
+    result_data_properties = {}
+    for col_letter in sorted(column_definitions.keys()):
+        col_def = column_definitions[col_letter]
+        key = col_def.get("key")
+        if not key or key in ("row_number", "data_id"):
+            continue
+        description = col_def.get("header", "")
+        if col_def.get("description"):
+            description = f"{description}: {col_def['description']}" if description else col_def["description"]
+        result_data_properties[key] = {
+            "type": ["string", "number", "null"],
+            "description": description
+        }
+
+    def nullable(type_name: str, description: str) -> Dict[str, Any]:
+        return {"type": [type_name, "null"], "description": description}
+
+    result_schema = {
+        "type": "object",
+        "properties": {
+            "task_type": {"type": "string", "description": "タスクタイプ"},
+            "status": {"type": "string", "enum": ACCOUNTING_STATUSES, "description": "処理ステータス"},
+            "result_data": {
+                "type": "object",
+                "properties": result_data_properties,
+                "required": list(result_data_properties.keys()),
+                "additionalProperties": False,
+                "description": "処理結果データ"
+            },
+            "calculations": {
+                "type": ["array", "null"],
+                "items": {"type": "string"},
+                "description": "計算過程"
+            },
+            "notes": nullable("string", "備考"),
+            "confidence": nullable("number", "結果の確信度（0〜1）")
+        },
+        "required": ["task_type", "status", "result_data", "calculations", "notes", "confidence"],
+        "additionalProperties": False
+    }
+    if include_data_id:
+        result_schema["properties"] = {
+            "data_id": {"type": "string", "description": "結果に対応するデータID（指示されたIDをそのまま記載）"},
+            **result_schema["properties"]
+        }
+        result_schema["required"] = ["data_id"] + result_schema["required"]
+
+    summary_schema = {
+        "type": "object",
+        "properties": {
+            "total_processed": {"type": "integer", "description": "処理済みデータ数"},
+            "total_amount": nullable("number", "合計金額"),
+            "matched_count": nullable("integer", "一致件数"),
+            "unmatched_count": nullable("integer", "不一致件数"),
+            "require_review_count": nullable("integer", "要確認件数")
+        },
+        "required": ["total_processed", "total_amount", "matched_count", "unmatched_count", "require_review_count"],
+        "additionalProperties": False
+    }
+
+    return {
+        "type": "object",
+        "properties": {
+            "results": {"type": "array", "items": result_schema, "description": "処理結果のリスト"},
+            "summary": summary_schema,
+            "processing_notes": nullable("string", "処理全体に関する備考")
+        },
+        "required": ["results", "summary", "processing_notes"],
+        "additionalProperties": False
+    }
+
+
+def get_accounting_response_format(column_definitions: Dict[str, Dict[str, Any]],
+                                   include_data_id: bool = False) -> Dict[str, Any]:
+    """列定義に対応するresponse_formatを取得（列定義ごとにキャッシュ）"""
+    name = "accounting_pack_response" if include_data_id else "accounting_response"
+    cache_key = f"{name}:" + json.dumps(column_definitions, ensure_ascii=False, sort_keys=True)
+    with _response_format_cache_lock:
+        if cache_key not in _response_format_cache:
+            schema = build_accounting_response_schema(column_definitions, include_data_id)
+            _response_format_cache[cache_key] = build_response_format(name, schema)
+        return _response_format_cache[cache_key]
@@ -1,10 +1,13 @@
 import json
+import math
 from typing import Dict, List, Any, Optional, Callable
 from datetime import datetime
+from config import get_config
 from .llm_client import LLMClient
 from .excel_manager import ExcelManager
 from .folder_processor import FolderProcessor
 from .base_llm_service import BaseLLMService, BaseDataValidator, BaseProcessor
+from .tokenizer import estimate_tokens
 
 class TaskEngine(BaseProcessor):
     """
@@ -149,6 +152,143 @@ class TaskEngine(BaseProcessor):
                 self.excel_manager = original_excel_manager
             return self.handle_exception("経理業務タスク実行", e)
     
+    def preflight_accounting_task(self, task_config_id: str, evidence_data: Dict[str, Any],
+                                  instruction: str, custom_output_config: Optional[Dict[str, Any]] = None,
+                                  max_workers: int = 3) -> Dict[str, Any]:
+        """
+        経理業務タスク実行前の見積もり（LLMは呼び出さない）
+        データごとのコンパイル済みプロンプトをローカルでトークン化し、
+        入出力トークン数・所要時間・コストとコンテキスト長を超えるデータを算出する
+        
+        Args:
+            task_config_id: タスク設定ID
+            evidence_data: 証跡データ
+            instruction: ユーザー指示
+            custom_output_config: カスタム出力設定
+            max_workers: 最大並列処理数
+            
+        Returns:
+            見積もり結果
+        """
+        try:
+            if task_config_id not in self.task_configs:
+                return {"success": False, "error": f"タスク設定が見つかりません: {task_config_id}"}
+            
+            evidence_validation = self.validator.validate_evidence_data(evidence_data)
+            if not evidence_validation["valid"]:
+                return {"success": False, "error": f"証跡データエラー: {', '.join(evidence_validation['errors'])}"}
+            
+            task_config = self.task_configs[task_config_id]
+            output_config = custom_output_config or task_config.get("output_config", {})
+            output_validation = self.validator.validate_output_config(output_config)
+            if not output_validation["valid"]:
+                return {"success": False, "error": f"出力設定エラー: {', '.join(output_validation['errors'])}"}
+            
+            preflight_config = get_config("PREFLIGHT_CONFIG")
+            processing_config = get_config("PROCESSING_CONFIG")
+            rate_config = get_config("RATE_LIMIT_CONFIG")
+            
+            # 1件あたりの出力トークン予測（列数に比例）
+            output_columns = [col for col in output_config["column_definitions"].values()
+                              if col.get("key") not in ("row_number", "data_id")]
+            output_tokens_per_item = (preflight_config.get("output_tokens_base", 150)
+                                      + preflight_config.get("output_tokens_per_column", 40) * len(output_columns))
+            
+            # 実行時と同じコンパイル済みプロンプトでデータごとの入力トークンを算出
+            llm_client = self.llm_client
+            compiled_prompt = llm_client.get_compiled_prompt(instruction, output_config, task_config)
+            fixed_tokens = (estimate_tokens(compiled_prompt.system_prompt)
+                            + estimate_tokens("".join(compiled_prompt.template_parts)))
+            
+            data_ids = list(evidence_data["data"].keys())
+            evidence_texts = {}
+            evidence_tokens = {}
+            for data_id in data_ids:
+                evidence_texts[data_id] = llm_client._format_evidence_data(
+                    {"success": True, "data": {data_id: evidence_data["data"][data_id]}},
+                    compiled_prompt.evidence_query
+                )
+                evidence_tokens[data_id] = estimate_tokens(evidence_texts[data_id])
+            
+            # リクエスト単位に集計（パッキング有効時は実行時と同じ詰め方）
+            if processing_config.get("pack_items", False):
+                packed_prompt = llm_client.get_compiled_prompt(instruction, output_config, task_config, packed=True)
+                packs = llm_client._pack_data_items(
+                    data_ids, evidence_texts, packed_prompt,
+                    processing_config.get("pack_token_budget", 8000),
+                    processing_config.get("max_items_per_pack", 10)
+                )
+                packed_fixed_tokens = (estimate_tokens(packed_prompt.system_prompt)
+                                       + estimate_tokens("".join(packed_prompt.template_parts)))
+            else:
+                packs = [[data_id] for data_id in data_ids]
+                packed_fixed_tokens = fixed_tokens
+            
+            requests = []
+            for pack in packs:
+                request_fixed_tokens = fixed_tokens if len(pack) == 1 else packed_fixed_tokens
+                requests.append({
+                    "data_ids": pack,
+                    "input_tokens": request_fixed_tokens + sum(evidence_tokens[data_id] for data_id in pack),
+                    "output_tokens": output_tokens_per_item * len(pack)
+                })
+            
+            input_tokens = sum(request["input_tokens"] for request in requests)
+            output_tokens = sum(request["output_tokens"] for request in requests)
+            
+            # コンテキスト長を超えるデータ（入力＋出力予測で判定）
+            context_window = preflight_config.get("context_window_tokens", 1047576)
+            oversize_items = []
+            for data_id in data_ids:
+                item_tokens = fixed_tokens + evidence_tokens[data_id] + output_tokens_per_item
+                if item_tokens > context_window:
+                    oversize_items.append({"data_id": data_id, "tokens": item_tokens})
+            
+            # 所要時間: 並列数での処理時間とRPM・TPM制限による下限のうち最大のもの
+            base_latency = preflight_config.get("latency_base_seconds", 2.0)
+            output_speed = preflight_config.get("output_tokens_per_second", 80)
+            total_latency = sum(base_latency + request["output_tokens"] / output_speed for request in requests)
+            longest_latency = max((base_latency + request["output_tokens"] / output_speed for request in requests), default=0.0)
+            time_estimates = {"並列数": max(total_latency / max(1, max_workers), longest_latency)}
+            if rate_config.get("enabled", True):
+                time_estimates["RPM制限"] = len(requests) / rate_config.get("requests_per_minute", 500) * 60
+                time_estimates["TPM制限"] = (input_tokens + output_tokens) / rate_config.get("tokens_per_minute", 200000) * 60
+            bottleneck = max(time_estimates, key=time_estimates.get)
+            
+            input_price = preflight_config.get("input_price_per_million", 2.0)
+            output_price = preflight_config.get("output_price_per_million", 8.0)
+            estimated_cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+            
+            largest_items = sorted(data_ids, key=lambda data_id: evidence_tokens[data_id], reverse=True)[:5]
+            
+            result = {
+                "success": True,
+                "data_count": len(data_ids),
+                "request_count": len(requests),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "estimated_seconds": math.ceil(time_estimates[bottleneck]),
+                "bottleneck": bottleneck,
+                "estimated_cost": round(estimated_cost, 4),
+                "currency": preflight_config.get("currency", "USD"),
+                "context_window_tokens": context_window,
+                "oversize_items": oversize_items,
+                "largest_items": [
+                    {"data_id": data_id, "tokens": fixed_tokens + evidence_tokens[data_id]} for data_id in largest_items
+                ]
+            }
+            
+            self.log_info(f"事前見積もり: {len(requests)}リクエスト, 入力{input_tokens}トークン, "
+                          f"出力{output_tokens}トークン, 約{result['estimated_seconds']}秒, "
+                          f"{result['estimated_cost']} {result['currency']}")
+            if oversize_items:
+                self.log_warning(f"コンテキスト長を超えるデータが{len(oversize_items)}件あります")
+            
+            return result
+            
+        except Exception as e:
+            return self.handle_exception("事前見積もり", e)
+    
     def process(self, *args, **kwargs) -> Dict[str, Any]:
         """
         BaseProcessorのabstractメソッド実装
@@ -200,6 +340,9 @@ class TaskEngine(BaseProcessor):
             "excel_range": write_result.get("range", "不明"),
             "target_sheet": write_result.get("target_sheet", "不明"),
             "tokens_used": llm_result.get("tokens_used", 0),
+            "concurrency_stats": llm_result.get("concurrency_stats", {}),
+            "coalesce_stats": llm_result.get("coalesce_stats", {}),
+            "cascade_stats": llm_result.get("cascade_stats", {}),
             "processing_details": {
                 "total_amount": summary_data.get("total_amount", 0),
                 "matched_count": summary_data.get("matched_count", 0),
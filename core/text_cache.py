@@ -0,0 +1,247 @@
+"""
+抽出テキストの永続キャッシュ
+ドキュメント本体のSHA-256と抽出処理（名前・バージョン）をキーとして、
+抽出したテキストとページの開始位置をSQLiteに保存する
+FileProcessor・FolderProcessor・RuleSuggesterで共有する
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import get_config
+
+# 抽出テキスト中のページ区切り（FileProcessor・FolderProcessorのPDF抽出で付与）
+_PAGE_MARKER_PATTERN = re.compile(r"^--- ページ (\d+) ---$", re.MULTILINE)
+
+
+def hash_content(content: bytes) -> str:
+    """ドキュメント本体のSHA-256"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def find_page_offsets(text: str) -> List[List[int]]:
+    """抽出テキスト中の各ページの開始位置（[ページ番号, 文字位置] のリスト）"""
+    return [[int(match.group(1)), match.start()] for match in _PAGE_MARKER_PATTERN.finditer(text)]
+
+
+class ExtractedTextCache:
+    """
+    コンテンツアドレス方式の抽出テキストキャッシュ
+    同じドキュメントでも抽出処理ごとに出力形式が異なるため、抽出処理名を含めてキーとし、
+    バージョンが異なるエントリはミスとして扱う。件数・サイズの上限を超えた分は最終参照が古い順に削除する
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: Optional[int] = None,
+                 max_size_bytes: Optional[int] = None, enabled: Optional[bool] = None):
+        cache_config = get_config("TEXT_CACHE_CONFIG")
+
+        self.enabled = cache_config.get("enabled", True) if enabled is None else enabled
+        self.db_path = Path(db_path or cache_config.get("db_path", "cache/extracted_text.sqlite3"))
+        self.max_entries = max_entries or cache_config.get("max_entries", 50000)
+        self.max_size_bytes = max_size_bytes or cache_config.get("max_size_bytes", 500 * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.enabled:
+            try:
+                self._initialize_db()
+            except Exception as e:
+                print(f"抽出テキストキャッシュ初期化エラー: {str(e)}")
+                self.enabled = False
+
+    @contextmanager
+    def _transaction(self):
+        """ロックを取得して接続を開き、終了時にコミットして閉じる"""
+        with self._lock:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            try:
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _initialize_db(self):
+        """テーブルを作成"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS extracted_texts (
+                    content_hash TEXT NOT NULL,
+                    extractor TEXT NOT NULL,
+                    extractor_version TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    page_offsets TEXT,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    PRIMARY KEY (content_hash, extractor)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_extracted_texts_last_accessed "
+                         "ON extracted_texts(last_accessed)")
+
+    def get(self, content_hash: str, extractor: str, extractor_version: str) -> Optional[Dict[str, Any]]:
+        """
+        キャッシュから抽出結果を取得
+
+        Returns:
+            {"text", "page_offsets", "extractor", "extractor_version"}（未登録・バージョン違いの場合はNone）
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT text, page_offsets FROM extracted_texts "
+                    "WHERE content_hash = ? AND extractor = ? AND extractor_version = ?",
+                    (content_hash, extractor, extractor_version)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute(
+                    "UPDATE extracted_texts SET last_accessed = ? WHERE content_hash = ? AND extractor = ?",
+                    (time.time(), content_hash, extractor)
+                )
+                self.hits += 1
+        except Exception as e:
+            print(f"抽出テキストキャッシュ読み込みエラー: {str(e)}")
+            self.misses += 1
+            return None
+
+        return {
+            "text": row[0],
+            "page_offsets": json.loads(row[1]) if row[1] else [],
+            "extractor": extractor,
+            "extractor_version": extractor_version
+        }
+
+    def set(self, content_hash: str, extractor: str, extractor_version: str, text: str,
+            page_offsets: Optional[List[List[int]]] = None):
+        """抽出結果をキャッシュに保存（同じ抽出処理の古いバージョンは置き換える）"""
+        if not self.enabled:
+            return
+
+        try:
+            now = time.time()
+            if page_offsets is None:
+                page_offsets = find_page_offsets(text)
+            size = len(text.encode("utf-8"))
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO extracted_texts "
+                    "(content_hash, extractor, extractor_version, text, page_offsets, size, created_at, last_accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (content_hash, extractor, extractor_version, text, json.dumps(page_offsets), size, now, now)
+                )
+                self._evict(conn)
+        except Exception as e:
+            print(f"抽出テキストキャッシュ書き込みエラー: {str(e)}")
+
+    def get_or_extract(self, content: bytes, extractor: str, extractor_version: str,
+                       extract: Callable[[], str]) -> str:
+        """
+        キャッシュにあれば抽出済みのテキストを返し、なければ抽出して保存
+
+        Args:
+            content: ドキュメント本体
+            extractor: 抽出処理の名前（出力形式が異なる抽出処理ごとに別の名前）
+            extractor_version: 抽出処理のバージョン（変わると再抽出される）
+            extract: テキストを抽出する関数
+        """
+        if not self.enabled:
+            return extract()
+
+        content_hash = hash_content(content)
+        cached = self.get(content_hash, extractor, extractor_version)
+        if cached is not None:
+            return cached["text"]
+
+        text = extract()
+        self.set(content_hash, extractor, extractor_version, text)
+        return text
+
+    def _evict(self, conn: sqlite3.Connection):
+        """上限超過のエントリを最終参照が古い順に削除"""
+        count, total_size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extracted_texts"
+        ).fetchone()
+        if count <= self.max_entries and total_size <= self.max_size_bytes:
+            return
+
+        rows = conn.execute(
+            "SELECT content_hash, extractor, size FROM extracted_texts ORDER BY last_accessed ASC"
+        ).fetchall()
+        keys_to_delete = []
+        for content_hash, extractor, size in rows:
+            if count <= self.max_entries and total_size <= self.max_size_bytes:
+                break
+            keys_to_delete.append((content_hash, extractor))
+            count -= 1
+            total_size -= size
+        conn.executemany("DELETE FROM extracted_texts WHERE content_hash = ? AND extractor = ?", keys_to_delete)
+
+    def clear(self):
+        """キャッシュを全削除"""
+        if not self.enabled:
+            return
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM extracted_texts")
+
+    def reset_stats(self):
+        """ヒット・ミスのカウンタをリセット"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計を取得（抽出処理ごとの件数を含む）"""
+        stats = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / (self.hits + self.misses) if (self.hits + self.misses) > 0 else 0.0,
+            "entries": 0,
+            "size_bytes": 0,
+            "max_size_bytes": self.max_size_bytes,
+            "extractors": {}
+        }
+
+        if self.enabled:
+            try:
+                with self._transaction() as conn:
+                    count, total_size = conn.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extracted_texts"
+                    ).fetchone()
+                    stats["entries"] = count
+                    stats["size_bytes"] = total_size
+                    stats["extractors"] = dict(conn.execute(
+                        "SELECT extractor, COUNT(*) FROM extracted_texts GROUP BY extractor"
+                    ).fetchall())
+            except Exception as e:
+                print(f"抽出テキストキャッシュ統計取得エラー: {str(e)}")
+
+        return stats
+
+
+_shared_text_cache: Optional[ExtractedTextCache] = None
+_shared_text_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> ExtractedTextCache:
+    """プロセス全体で共有する抽出テキストキャッシュを取得"""
+    global _shared_text_cache
+    if _shared_text_cache is None:
+        with _shared_text_cache_lock:
+            if _shared_text_cache is None:
+                _shared_text_cache = ExtractedTextCache()
+    return _shared_text_cache
@@ -0,0 +1,72 @@
+"""
+トークン数の見積もり
+tiktokenが利用可能な場合はローカルのトークナイザーで計数し、
+利用できない場合は文字種に基づく近似値を返す
+"""
+from typing import Any, List, Optional
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# メッセージ1件あたりの書式オーバーヘッド（role等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+# エンコーディングの読み込みに失敗したか（オフライン環境などでのダウンロード失敗。以降は再試行せず近似値を使う）
+_encoding_failed = False
+
+
+def _get_encoding():
+    """gpt-4.1系のエンコーディングを取得（初回のみ読み込み、失敗した場合はNone）"""
+    global _encoding, _encoding_failed
+    if _encoding is None and TIKTOKEN_AVAILABLE and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"tiktokenのエンコーディング読み込みエラー（以降は近似値で見積もります）: {str(e)}")
+            _encoding_failed = True
+    return _encoding
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    テキストのトークン数を見積もる
+
+    Args:
+        text: 対象テキスト
+
+    Returns:
+        トークン数（近似値の場合あり）
+    """
+    if not text:
+        return 0
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    # 近似: ASCIIは約4文字で1トークン、日本語等の非ASCII文字は約1文字1トークン
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    non_ascii_chars = len(text) - ascii_chars
+    return ascii_chars // 4 + non_ascii_chars + 1
+
+
+def _message_content(message: Any) -> str:
+    """OpenAI形式の辞書・LangChainのメッセージの両方から本文を取り出す"""
+    if isinstance(message, dict):
+        content = message.get("content", "")
+    else:
+        content = getattr(message, "content", "")
+
+    if isinstance(content, list):
+        # マルチパート形式の場合はテキスト部分のみ
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def estimate_messages_tokens(messages: List[Any]) -> int:
+    """メッセージリスト全体の入力トークン数を見積もる"""
+    return sum(estimate_tokens(_message_content(message)) + MESSAGE_OVERHEAD_TOKENS for message in messages)
@@ -0,0 +1,76 @@
+"""
+LLM呼び出しのトークン使用量の集計
+応答のusageから入力・出力トークン数と、プロバイダー側のプロンプトキャッシュで
+再利用された入力トークン数（cached_tokens）を実行単位で集計する
+"""
+import threading
+from typing import Any, Dict, Optional
+
+
+class TokenUsageStats:
+    """全LLMサービスで共有するトークン使用量の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "cached_requests": 0
+        }
+
+    def record(self, usage: Dict[str, Optional[int]]):
+        """
+        1回の呼び出しのトークン使用量を加算
+
+        Args:
+            usage: extract_usageの結果（取得できない項目はNone）
+        """
+        cached_tokens = usage.get("cached_tokens") or 0
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            self._stats["completion_tokens"] += usage.get("completion_tokens") or 0
+            self._stats["cached_tokens"] += cached_tokens
+            if cached_tokens:
+                self._stats["cached_requests"] += 1
+
+    def reset_stats(self):
+        """統計情報をリセット"""
+        with self._lock:
+            self._stats = self._empty_stats()
+
+    def get_stats(self, since: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        統計情報を取得（cached_rateは入力トークンのうちキャッシュから再利用された割合）
+
+        Args:
+            since: 実行開始時に取得した統計。指定するとそれ以降の増分を返す
+                   （プロセス全体で共有する統計をリセットせずに実行単位で集計する）
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        if since:
+            for key in self._empty_stats():
+                stats[key] -= since.get(key, 0)
+        stats["cached_rate"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        return stats
+
+
+_shared_usage_stats: Optional[TokenUsageStats] = None
+_shared_usage_stats_lock = threading.Lock()
+
+
+def get_usage_stats() -> TokenUsageStats:
+    """プロセス全体で共有するトークン使用量の集計を取得"""
+    global _shared_usage_stats
+    if _shared_usage_stats is None:
+        with _shared_usage_stats_lock:
+            if _shared_usage_stats is None:
+                _shared_usage_stats = TokenUsageStats()
+    return _shared_usage_stats